@@ -0,0 +1,212 @@
+from can_error_handler import DATA_START
+from can_message import ErrorFrame, OverloadFrame
+
+CATEGORIES = ["payload", "overhead", "stuff", "error", "overload", "retransmitted", "idle"]
+
+
+def empty_counts():
+    return dict.fromkeys(CATEGORIES, 0)
+
+
+def bit_categories(msg):
+    """Category ("payload", "overhead" or "stuff") of every bit of a data/remote frame's bitstream."""
+    stuff = set(msg.stuff_indices)
+    data_end = DATA_START + 8 * len(msg.data_field)
+    kinds = []
+    position = 0  # position in the unstuffed frame
+    for index in range(len(msg.get_bitstream())):
+        if index in stuff:
+            kinds.append("stuff")
+            continue
+        kinds.append("payload" if DATA_START <= position < data_end else "overhead")
+        position += 1
+    return kinds
+
+
+class BitAccounting:
+    """
+    Attributes every bit time of a bus (CANBus.set_accounting()) to one category:
+      payload        data field bits of frames that went through
+      overhead       SOF, arbitration, control, CRC, ACK, EOF and intermission bits of those frames
+      stuff          stuff bits of those frames
+      error          error frame bits
+      overload       overload frame bits
+      retransmitted  all bits of attempts destroyed by an error (the frame has to be sent again)
+      idle           no frame on the bus
+    Bits of a data/remote frame are held per attempt and only booked as payload,
+    overhead and stuff once the frame completes. Error frame bits are charged to
+    the node and identifier of the frame they destroyed, overload bits to the
+    node that sent the overload frame.
+
+    Counters are kept for the whole bus (`totals`), per node id (`by_node`) and per
+    identifier (`by_id`); goodput() and efficiency() can be read at any time.
+    The accounting is a measurement and not part of bus snapshots.
+    """
+
+    def __init__(self, bitrate=500000):
+        self.bitrate = bitrate
+        self.reset()
+
+    def attach(self, bus):
+        self.bitrate = bus.bitrate
+
+    def reset(self):
+        self.totals = empty_counts()
+        self.by_node = {}
+        self.by_id = {}
+        self.frames = {}         # key ("node", id) / ("id", identifier) -> frames that went through
+        self.payload_bytes = {}  # same keys -> payload bytes of those frames
+        self.frames_total = 0
+        self.payload_bytes_total = 0
+        self.arbitration_bits = 0  # arbitration bit times whose winner is not known yet
+        self.attempt = None
+        self.error_owner = None   # (node id, identifier) charged with the current error frame
+
+    def add(self, category, bits, node_id=None, identifier=None):
+        self.totals[category] += bits
+        if node_id is not None:
+            self.by_node.setdefault(node_id, empty_counts())[category] += bits
+        if identifier is not None:
+            self.by_id.setdefault(identifier, empty_counts())[category] += bits
+
+    # ---- per bit time, called by CANBus.simulate_step() ----
+
+    def idle_bit(self, count=1):
+        self.totals["idle"] += count
+
+    def arbitration_bit(self):
+        self.arbitration_bits += 1
+
+    def frame_bit(self, node, msg, index):
+        if isinstance(msg, ErrorFrame):
+            owner, identifier = self.error_owner or (node.node_id, None)
+            self.add("error", 1, owner, identifier)
+            return
+        if isinstance(msg, OverloadFrame):
+            self.add("overload", 1, node.node_id)
+            return
+
+        attempt = self.attempt
+        if attempt is None or attempt["msg"] is not msg:
+            if attempt is not None:
+                self.frame_aborted()
+            attempt = self.start_attempt(node, msg)
+        kinds = attempt["kinds"]
+        attempt["counts"][kinds[index] if index < len(kinds) else "overhead"] += 1
+
+    def start_attempt(self, node, msg):
+        kinds = bit_categories(msg)
+        counts = empty_counts()
+        # the arbitration bit times before the winner was known are the frame's first bits
+        for index in range(self.arbitration_bits):
+            counts[kinds[index]] += 1
+        self.arbitration_bits = 0
+        self.attempt = {
+            "msg": msg,
+            "node_id": node.node_id,
+            "identifier": msg.identifier,
+            "counts": counts,
+            "kinds": kinds,
+        }
+        return self.attempt
+
+    # ---- frame outcomes, called by CANBus ----
+
+    def frame_completed(self, msg):
+        attempt = self.attempt
+        if attempt is None or attempt["msg"] is not msg:
+            return
+        self.attempt = None
+        node_id, identifier = attempt["node_id"], attempt["identifier"]
+        for category, bits in attempt["counts"].items():
+            if bits:
+                self.add(category, bits, node_id, identifier)
+        size = len(msg.data_field)
+        self.frames_total += 1
+        self.payload_bytes_total += size
+        for key in (("node", node_id), ("id", identifier)):
+            self.frames[key] = self.frames.get(key, 0) + 1
+            self.payload_bytes[key] = self.payload_bytes.get(key, 0) + size
+
+    def frame_aborted(self):
+        """The current attempt was destroyed: its bits are booked as retransmitted."""
+        attempt = self.attempt
+        bits = self.arbitration_bits
+        self.arbitration_bits = 0
+        if attempt is None:
+            self.error_owner = None
+            if bits:
+                self.add("retransmitted", bits)
+            return
+        self.attempt = None
+        bits += sum(attempt["counts"].values())
+        self.error_owner = (attempt["node_id"], attempt["identifier"])
+        self.add("retransmitted", bits, attempt["node_id"], attempt["identifier"])
+
+    # ---- ratios ----
+
+    def counts(self, node_id=None, identifier=None):
+        if node_id is not None:
+            return self.by_node.get(node_id, empty_counts())
+        if identifier is not None:
+            return self.by_id.get(identifier, empty_counts())
+        return self.totals
+
+    def total_bits(self):
+        return sum(self.totals.values())
+
+    def delivered_frames(self, node_id=None, identifier=None):
+        if node_id is not None:
+            return self.frames.get(("node", node_id), 0)
+        if identifier is not None:
+            return self.frames.get(("id", identifier), 0)
+        return self.frames_total
+
+    def delivered_bytes(self, node_id=None, identifier=None):
+        if node_id is not None:
+            return self.payload_bytes.get(("node", node_id), 0)
+        if identifier is not None:
+            return self.payload_bytes.get(("id", identifier), 0)
+        return self.payload_bytes_total
+
+    def goodput(self, node_id=None, identifier=None):
+        """Payload bytes per second that went through, over the accounted time."""
+        seconds = self.total_bits() / self.bitrate
+        return self.delivered_bytes(node_id, identifier) / seconds if seconds else 0.0
+
+    def raw_throughput(self, node_id=None, identifier=None):
+        """Bits per second on the wire (everything except idle) for the bus, a node or an identifier."""
+        seconds = self.total_bits() / self.bitrate
+        counts = self.counts(node_id, identifier)
+        busy = sum(counts.values()) - counts["idle"]
+        return busy / seconds if seconds else 0.0
+
+    def efficiency(self, node_id=None, identifier=None):
+        """Share of the non-idle bits that carried delivered payload."""
+        counts = self.counts(node_id, identifier)
+        busy = sum(counts.values()) - counts["idle"]
+        return counts["payload"] / busy if busy else 0.0
+
+    def utilization(self):
+        total = self.total_bits()
+        return (total - self.totals["idle"]) / total if total else 0.0
+
+    def report(self):
+        """Nested dict of all counters and ratios: {"bus": ..., "nodes": {id: ...}, "ids": {id: ...}}."""
+        def entry(counts, **key):
+            return {
+                **counts,
+                "frames": self.delivered_frames(**key),
+                "payload_bytes": self.delivered_bytes(**key),
+                "goodput": self.goodput(**key),
+                "raw_throughput": self.raw_throughput(**key),
+                "efficiency": self.efficiency(**key),
+            }
+
+        bus = entry(self.totals)
+        bus["utilization"] = self.utilization()
+        return {
+            "bus": bus,
+            "nodes": {nid: entry(c, node_id=nid) for nid, c in sorted(self.by_node.items())},
+            "ids": {ident: entry(c, identifier=ident) for ident, c in sorted(self.by_id.items())},
+        }
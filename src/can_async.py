@@ -0,0 +1,215 @@
+import asyncio
+import math
+import selectors
+
+from can_node import BUS_OFF
+
+# Asyncio front end for CANBus. Time is virtual: one unit of loop.time() is one
+# bit time, and the loop jumps straight to the next timer instead of waiting, so
+# node coroutines run as fast as the CPU allows.
+
+
+class CANTransmissionError(Exception):
+    def __init__(self, error_type, message):
+        super().__init__(f"{error_type} while transmitting {message!r}")
+        self.error_type = error_type
+        self.message = message
+
+
+class _VirtualTimeSelector(selectors.BaseSelector):
+    """Polls real file descriptors without blocking and advances the virtual clock instead."""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._selector = selectors.DefaultSelector()
+
+    def register(self, fileobj, events, data=None):
+        return self._selector.register(fileobj, events, data)
+
+    def unregister(self, fileobj):
+        return self._selector.unregister(fileobj)
+
+    def modify(self, fileobj, events, data=None):
+        return self._selector.modify(fileobj, events, data)
+
+    def get_map(self):
+        return self._selector.get_map()
+
+    def close(self):
+        self._selector.close()
+
+    def select(self, timeout=None):
+        ready = self._selector.select(0)
+        if ready:
+            return ready
+        if timeout is None:
+            # nothing scheduled in virtual time => only another thread can wake us
+            return self._selector.select(None)
+        if timeout > 0:
+            self._loop.advance_time(timeout)
+        return []
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        self._virtual_time = 0.0
+        super().__init__(selector=_VirtualTimeSelector(self))
+        self._clock_resolution = 1e-6
+
+    def time(self):
+        return self._virtual_time
+
+    def advance_time(self, bits):
+        self._virtual_time += bits
+
+
+def run(coro):
+    """Runs `coro` to completion on a fresh VirtualTimeEventLoop (like asyncio.run)."""
+    loop = VirtualTimeEventLoop()
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coro)
+    finally:
+        try:
+            for task in asyncio.all_tasks(loop):
+                task.cancel()
+            loop.run_until_complete(asyncio.sleep(0))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+class AsyncCANBus:
+    """
+    Wraps a CANBus. A driver task calls simulate_step() once per bit time while
+    any node has something to send and sleeps (in virtual time) while the bus is idle.
+    """
+
+    def __init__(self, bus):
+        self.bus = bus
+        self.nodes = {}
+        self._pending = {}  # id(msg) -> (future, node, msg, retransmit)
+        self._activity = None
+        self._driver = None
+        bus.add_listener(self._on_bus_event)
+
+    def node(self, node):
+        """Returns the AsyncCANNode for a CANNode (or node_id)."""
+        if not hasattr(node, "node_id"):
+            node = next(nd for nd in self.bus.nodes if nd.node_id == node)
+        if node.node_id not in self.nodes:
+            self.nodes[node.node_id] = AsyncCANNode(self, node)
+        return self.nodes[node.node_id]
+
+    def time(self):
+        return self.bus.bit_time
+
+    async def sleep(self, bits):
+        self._ensure_driver()
+        await asyncio.sleep(bits)
+
+    def close(self):
+        self.bus.remove_listener(self._on_bus_event)
+        if self._driver is not None:
+            self._driver.cancel()
+            self._driver = None
+
+    def _ensure_driver(self):
+        if self._driver is None or self._driver.done():
+            self._activity = asyncio.Event()
+            self._driver = asyncio.get_running_loop().create_task(self._drive())
+
+    def _wake(self):
+        self._ensure_driver()
+        self._activity.set()
+
+    def _bus_idle(self):
+        bus = self.bus
+        if bus.current_winner or bus.arbitration_in_progress:
+            return False
+        return not any(nd.has_pending_message() and nd.state != BUS_OFF for nd in bus.nodes)
+
+    async def _drive(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._bus_idle():
+                self._activity.clear()
+                await self._activity.wait()
+                # idle bits are skipped, the bus clock catches up with the loop clock
+                self.bus.bit_time = max(self.bus.bit_time, math.floor(loop.time()))
+                continue
+            self.bus.simulate_step()
+            self._check_bus_off()
+            await asyncio.sleep(max(0, self.bus.bit_time - loop.time()))
+
+    def _check_bus_off(self):
+        for key, (fut, node, msg, _) in list(self._pending.items()):
+            if node.state == BUS_OFF:
+                del self._pending[key]
+                if not fut.done():
+                    fut.set_exception(CANTransmissionError("bus_off", msg))
+
+    def _on_bus_event(self, event, *args):
+        if event == "frame_transmitted":
+            node, msg = args
+            entry = self._pending.pop(id(msg), None)
+            if entry and not entry[0].done():
+                entry[0].set_result(True)
+        elif event == "frame_received":
+            node, msg = args
+            anode = self.nodes.get(node.node_id)
+            if anode is not None and anode.node is node:
+                anode._rx.put_nowait(msg)
+        elif event == "error_frame":
+            reporter, error_type, msg = args
+            entry = self._pending.get(id(msg))
+            if entry is None or entry[3]:
+                return
+            fut, node, msg, _ = self._pending.pop(id(msg))
+            # one-shot send: the frame is not retransmitted
+            if msg in node.message_queue:
+                node.message_queue.remove(msg)
+            if not fut.done():
+                fut.set_exception(CANTransmissionError(error_type, msg))
+
+
+class AsyncCANNode:
+    def __init__(self, abus, node):
+        self.abus = abus
+        self.node = node
+        self._rx = asyncio.Queue()
+
+    async def send(self, frame, retransmit=False):
+        """
+        Queues `frame` and resolves to True once it was transmitted without error.
+        Raises CANTransmissionError on an error frame, or, with retransmit=True,
+        only when the node goes bus off; with "rate_limited" when the node's rate
+        limiter (drop policy) discards the frame.
+        """
+        if self.node.state == BUS_OFF:
+            raise CANTransmissionError("bus_off", frame)
+        fut = asyncio.get_running_loop().create_future()
+        self.abus._pending[id(frame)] = (fut, self.node, frame, retransmit)
+        if self.node.add_message_to_queue(frame):
+            self.abus._wake()
+        else:
+            self.abus._pending.pop(id(frame), None)
+            fut.set_exception(CANTransmissionError("rate_limited", frame))
+        try:
+            return await fut
+        except asyncio.CancelledError:
+            on_bus = self.node.message_queue and self.node.message_queue[0] is frame and self.node.current_bit_index > 0
+            if frame in self.node.message_queue and not on_bus:
+                self.node.message_queue.remove(frame)
+            raise
+        finally:
+            self.abus._pending.pop(id(frame), None)
+
+    async def receive(self):
+        """Async iterator over the frames accepted by this node's filters."""
+        while True:
+            yield await self._rx.get()
+
+    def __repr__(self):
+        return f"AsyncCANNode(node_id={self.node.node_id})"
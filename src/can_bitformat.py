@@ -0,0 +1,115 @@
+from can_message import DataFrame, RemoteFrame, ErrorFrame, OverloadFrame
+
+INTERMISSION = "Intermission Bits"
+
+
+def frame_layout(frame):
+    """
+    (section name, first bit, end bit) of the fields shown for a frame view, or
+    None for frames the live view does not show. Error and overload frames are
+    shown as flag and delimiter, data and remote frames field by field (the
+    intermission is not shown).
+    """
+    if issubclass(frame.frame_class, ErrorFrame):
+        return (("Error Flag", 0, 6), ("Error Delimiter", 6, 14))
+    if issubclass(frame.frame_class, OverloadFrame):
+        return (("Overload Flag", 0, 6), ("Overload Delimiter", 6, 14))
+    remote = issubclass(frame.frame_class, RemoteFrame)
+    if not remote and not (issubclass(frame.frame_class, DataFrame) or frame.frame_type == "Data"):
+        return None
+    sections = frame.sections
+    id_end = sections["rtr_start"]
+    crc_start = sections["crc_start"]
+    crc_end = sections["crc_end"]
+    fields = [
+        ("Start of Frame Bit", 0, 1),
+        ("Identifier Bits", 1, id_end),
+        ("Remote Transmission Request Bit", id_end, id_end + 1),
+    ]
+    if remote:
+        fields.append(("Control Field Bits", id_end + 1, crc_start))
+    else:
+        fields.append(("Control Field Bits", id_end + 1, sections["data_start"]))
+        fields.append(("Data Field Bits", sections["data_start"], crc_start))
+    fields += [
+        ("Cyclic Redundancy Check Bits", crc_start, crc_end),
+        ("CRC Delimiter Bit", crc_end, crc_end + 1),
+        ("Acknowledgement Bit", crc_end + 1, crc_end + 2),
+        ("Acknowledgement Delimiter Bit", crc_end + 2, crc_end + 3),
+        ("End of Frame Bits", crc_end + 3, crc_end + 10),
+    ]
+    return tuple(fields)
+
+
+class BitfieldFormatter:
+    """
+    Renders the bits a frame has sent so far, grouped by field, for the live frame view.
+
+    The rendering of the current frame is kept between calls: update() appends only
+    the bits sent since the previous call to their field's buffer, and the line is
+    joined again only when bits were added. Another frame, or the same frame sent
+    again (its bit index starts over), starts a new rendering.
+    """
+
+    def __init__(self):
+        self.node_id = None
+        self.frame = None
+        self.layout = None
+        self.buffers = []
+        self.texts = []
+        self.sent = 0
+        self.field = 0  # field of the last bit appended (len(layout) once past the last field)
+        self.line = ""
+
+    def start(self, node_id, frame):
+        self.node_id = node_id
+        self.frame = frame
+        self.layout = frame_layout(frame)
+        fields = self.layout or ()
+        self.buffers = [[] for _ in fields]
+        self.texts = ["" for _ in fields]
+        self.sent = 0
+        self.field = 0
+        self.line = self.join()
+
+    def update(self, node_id, frame, bit_index):
+        """Line of the first bit_index bits of the frame; None for frames that are not shown."""
+        if frame is not self.frame or node_id != self.node_id or bit_index < self.sent:
+            self.start(node_id, frame)
+        if self.layout is None:
+            return None
+        if bit_index > self.sent:
+            self.append(bit_index)
+        return self.line
+
+    def append(self, bit_index):
+        bits = self.frame.bits
+        layout = self.layout
+        touched = set()
+        for i in range(self.sent, min(bit_index, len(bits))):
+            while self.field < len(layout) and i >= layout[self.field][2]:
+                self.field += 1
+            if self.field < len(layout):
+                self.buffers[self.field].append("1" if bits[i] else "0")
+                touched.add(self.field)
+        self.sent = bit_index
+        if touched:
+            for f in touched:
+                self.texts[f] = "".join(self.buffers[f])
+            self.line = self.join()
+
+    def join(self):
+        if self.layout is None:
+            return None
+        if issubclass(self.frame.frame_class, (ErrorFrame, OverloadFrame)):
+            return "\t".join(f"{text:<{end - start}}" for text, (_, start, end) in zip(self.texts, self.layout))
+        return " ".join(self.texts)
+
+    def section(self):
+        """(field index, section name) of the bit sent last; the first field (Start of Frame Bit) before any bit was sent."""
+        layout = self.layout
+        if self.field < len(layout):
+            return self.field, layout[self.field][0]
+        if issubclass(self.frame.frame_class, (ErrorFrame, OverloadFrame)):
+            return len(layout) - 1, layout[-1][0]
+        return len(layout), INTERMISSION
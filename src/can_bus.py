@@ -414,7 +414,9 @@
 # can_bus.py
 
 from can_node import CANNode, WAITING, TRANSMITTING, RECEIVING, BUS_OFF
-from can_message import DataFrame, ErrorFrame, OverloadFrame, RemoteFrame
+from can_message import DataFrame, ErrorFrame, OverloadFrame, RemoteFrame, frame_state, frame_from_state
+from can_channel import ALL_NODES
+from can_remote import RemoteRequestTracker
 import random
 import time
 
@@ -423,8 +425,15 @@ BUSY = "Busy"
 WAITING_ACK = "Waiting for ACK"
 
 class CANBus:
-    def __init__(self):
+    def __init__(self, bitrate=500000, seed=None, max_consecutive_overloads=2):
         self.nodes = []
+        self.bitrate = bitrate  # bits per second, used to map bit_time to wall-clock time
+        self.seed = seed
+        # rng drives the bus's own decisions (error reporter, overload sender);
+        # stimulus_rng is for generating traffic and error injections from outside
+        seeder = random.Random(seed)
+        self.rng = random.Random(seeder.getrandbits(64))
+        self.stimulus_rng = random.Random(seeder.getrandbits(64))
         self.current_bit = 1  # default bit sent on the bus
         self.in_arbitration = False
         self.error = False
@@ -440,11 +449,77 @@ class CANBus:
         self.current_winner = None
         self.arbitration_contenders = []
 
+        self.bit_time = 0  # number of simulated bit times (simulate_step calls)
+        self.listeners = []
+        self.channel = None  # optional bit error model, see can_channel.py
+        self.accounting = None  # optional per-bit goodput accounting, see can_accounting.py
+        self.remote_requests = RemoteRequestTracker()  # remote frame -> data frame latencies
+        self.waveform = None  # optional WaveformCapture, see can_waveform.py
+        self.drive_levels = {}  # node_id -> level the node drives in this bit (only kept while capturing)
+        self.stepping = False  # inside simulate_step: frames queued now come from the simulation itself
+
+        # overload delay in simulated time: at most max_consecutive_overloads frames
+        # between two data/remote frames, overload_bits is bus capacity lost to them
+        self.max_consecutive_overloads = max_consecutive_overloads
+        self.consecutive_overloads = 0
+        self.overload_frames = 0
+        self.overload_bits = 0
+        self.overload_requests_dropped = 0
+
     def connect_node(self, node):
         self.nodes.append(node)
         node.set_bus(self)
         print(f"Node {node.node_id} connected to the bus.")
 
+    def add_listener(self, listener):
+        """
+        listener(event, *args) is called synchronously for bus events:
+          "frame_transmitted" (node, msg)  data/remote frame sent without error
+          "frame_received"    (node, msg)  frame accepted by a receiving node's filters
+          "frame_complete"    (node, msg)  any frame (incl. error/overload) finished
+          "error_frame"       (reporter, error_type, msg)
+          "overload_frame"    (sender,)
+          "frame_queued"      (node, msg)  frame added by send_message/add_message_to_queue
+          "frame_generated"   (node, msg)  frame queued by the simulation while it steps
+                                           (e.g. the answer to a remote frame), not an input
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def notify(self, event, *args):
+        for listener in self.listeners:
+            listener(event, *args)
+
+    def set_channel(self, channel):
+        """Attaches a channel model (BERChannel, GilbertElliottChannel, ...) or removes it with None."""
+        self.channel = channel
+        if channel is not None:
+            channel.attach(self)
+
+    def set_accounting(self, accounting):
+        """Attaches a BitAccounting that classifies every following bit time, or removes it with None."""
+        self.accounting = accounting
+        if accounting is not None:
+            accounting.attach(self)
+
+    def set_waveform(self, capture):
+        """Attaches a WaveformCapture that records the bus and node levels of every following bit, or None."""
+        self.waveform = capture
+        self.drive_levels = {}
+        if capture is not None:
+            capture.attach(self)
+
+    def response_dlc(self, identifier):
+        """DLC registered by the node answering remote frames for identifier, None if unknown."""
+        for nd in self.nodes:
+            entry = nd.response_handlers.get(identifier)
+            if entry is not None and entry[1] is not None:
+                return entry[1]
+        return None
+
     def get_current_bit(self):
         return self.current_bit
 
@@ -459,8 +534,22 @@ class CANBus:
            if done => finalize_message
         4) if the reporter/current_winner is BUS_OFF => release bus
         """
+        self.stepping = True
+        try:
+            if self.waveform is None:
+                self.advance_bit()
+                return
+            self.drive_levels = {}
+            self.advance_bit()
+            self.waveform.sample(self)
+        finally:
+            self.stepping = False
+
+    def advance_bit(self):
+        """One bit time of simulate_step()."""
         self.current_bitstream.clear()
         self.bitstream_display.clear()
+        self.bit_time += 1
 
         # ### 1a) If we are IDLE, ensure all non-BUS_OFF nodes are WAITING
         if self.state == IDLE:
@@ -470,12 +559,15 @@ class CANBus:
 
         # ### 1b) If we have no winner and are not arbitrating, check for active nodes
         if not self.current_winner and not self.arbitration_in_progress:
-            active_nodes = [n for n in self.nodes if n.has_pending_message() and n.state != BUS_OFF]
+            active_nodes = [n for n in self.nodes
+                            if n.has_pending_message() and n.state != BUS_OFF and n.ready_to_transmit()]
 
             if not active_nodes:
                 # No nodes have pending messages => bus idle
                 self.current_bit = 1
                 self.state = IDLE
+                if self.accounting is not None:
+                    self.accounting.idle_bit()
                 print("No nodes with pending messages => bus idle => bit=1")
                 return
 
@@ -508,6 +600,8 @@ class CANBus:
         # 2) Arbitration in progress?
         if self.arbitration_in_progress and not self.current_winner:
             self.do_one_arbitration_bit()
+            if self.accounting is not None and not self.current_winner:
+                self.accounting.arbitration_bit()
 
         # 3) If we have a winner, transmit a data bit
         if self.current_winner:
@@ -517,6 +611,9 @@ class CANBus:
                 self.current_winner = None
                 self.state = IDLE
                 self.error_reported = False
+                if self.accounting is not None:
+                    self.accounting.frame_aborted()
+                    self.accounting.idle_bit()
                 return
 
             self.transmit_one_data_bit(self.current_winner)
@@ -529,18 +626,32 @@ class CANBus:
                 self.arbitration_bit_index = 0
                 self.arbitration_contenders.clear()
                 self.state = IDLE
+                self.start_requested_overload()
 
     def do_one_arbitration_bit(self):
         if self.arbitration_bit_index == 0:
             self.current_bit = 0  # SOF=0
             self.arbitration_bit_index = 1
+            if self.waveform is not None:
+                for nd in self.arbitration_contenders:
+                    self.drive_levels[nd.node_id] = 0
+            for nd in self.nodes:
+                nd.error_handler.start_frame()
+            self.receive_arbitration_bit(0)
             print("Arbitration started (SOF=0).")
             return
 
         if self.arbitration_bit_index > 12:
+            # same identifier from several nodes => the first one keeps sending, the others receive
             self.current_winner = self.arbitration_contenders[0]
             print(f"Arbitration done => forced winner Node {self.current_winner.node_id}")
+            for nd in self.arbitration_contenders[1:]:
+                nd.mode = RECEIVING
             self.arbitration_in_progress = False
+            self.in_arbitration = False
+            self.current_winner.current_bit_index = self.arbitration_bit_index
+            self.arbitration_contenders.clear()
+            self.arbitration_bit_index = 0
             return
 
         bits_from_nodes = []
@@ -554,8 +665,12 @@ class CANBus:
             bits_from_nodes.append((nd, bit))
 
         bit_values = [val for (_, val) in bits_from_nodes]
+        if self.waveform is not None:
+            for nd, val in bits_from_nodes:
+                self.drive_levels[nd.node_id] = val
         dominant_bit = min(bit_values)
         self.current_bit = dominant_bit
+        self.receive_arbitration_bit(dominant_bit)
 
         new_contenders = []
         for (nd, val) in bits_from_nodes:
@@ -579,6 +694,13 @@ class CANBus:
             self.arbitration_contenders = new_contenders
             self.arbitration_bit_index += 1
 
+    def receive_arbitration_bit(self, level):
+        # every node decodes the arbitration field: losers need it for the CRC and stuffing
+        # checks once they become receivers; errors found here are reported in the data phase
+        for nd in self.nodes:
+            if nd.state != BUS_OFF:
+                nd.error_handler.receive_bit(level)
+
     def transmit_one_data_bit(self, node):
         if node.state == BUS_OFF:
             return
@@ -586,24 +708,89 @@ class CANBus:
         bit = node.transmit_bit()
         if bit is None:
             self.current_bit = 1
+            if self.accounting is not None:
+                self.accounting.idle_bit()
             return
 
-        self.current_bit = bit
-        print(f"Node {node.node_id} => data bit {node.current_bit_index - 1} = {bit}")
-
         msg = node.message_queue[0]
-        # Notify other nodes
+        if self.accounting is not None:
+            self.accounting.frame_bit(node, msg, node.current_bit_index - 1)
+        if not isinstance(msg, (DataFrame, RemoteFrame)):
+            if isinstance(msg, OverloadFrame):
+                self.overload_bits += 1
+            if self.waveform is not None:
+                self.drive_levels[node.node_id] = bit
+            self.current_bit = bit
+            print(f"Node {node.node_id} => data bit {node.current_bit_index - 1} = {bit}")
+            return
+
+        idx = node.current_bit_index - 1
+        n = len(msg.get_bitstream())
+        ack_idx = n - 12
+        sent = bit
+        level = bit
+        if idx == msg.bit_flipped[0]:
+            sent = msg.bit_flipped[1]  # injected disturbance: the wire carries the corrupted bit
+        elif idx == ack_idx and self.acknowledging_nodes(node):
+            level = 0
+            if self.waveform is not None:
+                for nd in self.acknowledging_nodes(node):
+                    self.drive_levels[nd.node_id] = 0
+        if self.waveform is not None:
+            self.drive_levels[node.node_id] = sent
+
+        flipped = ()
+        if self.channel is not None and self.bit_time >= self.channel.next_error:
+            level, flipped = self.apply_channel_errors(level)
+
+        self.current_bit = level
+        print(f"Node {node.node_id} => data bit {idx} = {level}")
+
+        if idx == 0:
+            for nd in self.nodes:
+                nd.error_handler.start_frame()
+
+        tx_level = 1 - level if node.node_id in flipped else level
+        error_type = node.error_handler.check_transmitted_bit(idx, n, sent, tx_level)
+        if error_type:
+            print(f"Node {node.node_id} => detected {error_type} at bit {idx}")
+            self.broadcast_error_frame(error_type, msg, reporter=node)
+            return
+
+        detectors = []
         for nd in self.nodes:
             if nd != node and nd.state != BUS_OFF:
-                nd.process_received_bit(msg, node)
+                rx_level = 1 - level if nd.node_id in flipped else level
+                error_type = nd.process_received_bit(msg, node, rx_level)
+                if error_type:
+                    detectors.append((nd, error_type))
+        if detectors:
+            reporter, error_type = detectors[0] if len(detectors) == 1 else self.rng.choice(detectors)
+            self.broadcast_error_frame(error_type, msg, reporter=reporter)
+            return
 
-        # Check ACK
-        ack_idx = msg.get_ack_index()
-        if (node.current_bit_index) == ack_idx:
-            if msg.error_type == "ack_error":
-                msg.ack_slot = 1
+        if idx == ack_idx:
+            msg.ack_slot = level
+
+    def acknowledging_nodes(self, transmitter):
+        """Receivers that drive the ACK slot dominant (no error detected in the frame so far)."""
+        return [nd for nd in self.nodes
+                if nd is not transmitter and nd.state != BUS_OFF and nd.mode == RECEIVING
+                and nd.error_handler.rx_error is None]
+
+    def apply_channel_errors(self, level):
+        """
+        Applies the channel's bit errors for the current bit of a data/remote frame.
+        Returns the wire level and the ids of the nodes that see the inverted level.
+        Flips during arbitration or on an idle bus are absorbed.
+        """
+        flipped = set()
+        for target in self.channel.errors_at(self.bit_time):
+            if target is ALL_NODES:
+                level = 1 - level
             else:
-                msg.ack_slot = 0  # normal ack
+                flipped ^= {target}
+        return level, flipped
 
     def finalize_message(self, node):
         """
@@ -618,12 +805,26 @@ class CANBus:
         node.message_queue.pop(0)
         node.stop_transmitting()
 
-        if msg.error_type is None and isinstance(msg, (DataFrame, RemoteFrame)):
+        success = msg.error_type is None and isinstance(msg, (DataFrame, RemoteFrame))
+        if self.accounting is not None and isinstance(msg, (DataFrame, RemoteFrame)):
+            if success:
+                self.accounting.frame_completed(msg)
+            else:
+                self.accounting.frame_aborted()
+        receivers = []
+        if success:
             # no error => decrement counters
             node.decrement_transmit_error()
+            node.record_transmission(msg)
             for nd in self.nodes:
                 if nd != node and nd.state != BUS_OFF and nd.mode == RECEIVING:
                     nd.decrement_receive_error()
+                    if msg.identifier in nd.filters:
+                        receivers.append(nd)
+            if isinstance(msg, RemoteFrame):
+                self.remote_requests.request(msg, self.bit_time)
+            else:
+                self.remote_requests.response(msg, self.bit_time)
 
         # Let all non-BUS_OFF nodes go to WAITING
         for nd in self.nodes:
@@ -636,19 +837,34 @@ class CANBus:
             node.message_queue.append(msg)
 
         self.current_winner = None
-        if isinstance(msg, RemoteFrame):
+        if isinstance(msg, OverloadFrame):
             self.overload_request = False
         elif isinstance(msg, ErrorFrame):
             self.error_reported = False
+        else:
+            self.consecutive_overloads = 0
+
+        if success and isinstance(msg, RemoteFrame):
+            for nd in receivers:
+                nd.respond_to_remote(msg)
+
+        if self.listeners:
+            if success:
+                self.notify("frame_transmitted", node, msg)
+                for nd in receivers:
+                    self.notify("frame_received", nd, msg)
+            self.notify("frame_complete", node, msg)
 
-    def broadcast_error_frame(self, error_type, message=None):
+    def broadcast_error_frame(self, error_type, message=None, reporter=None):
         if self.error_reported:
             return
 
         reporter_node = None
         retransmittable_errors = {"ack_error", "bit_error", "crc_error", "stuff_error"}
 
-        if error_type in ("bit_error", "ack_error"):
+        if reporter is not None and reporter.state != BUS_OFF:
+            reporter_node = reporter
+        elif error_type in ("bit_error", "ack_error"):
             for nd in self.nodes:
                 if nd.mode == TRANSMITTING and nd.state != BUS_OFF:
                     reporter_node = nd
@@ -664,17 +880,19 @@ class CANBus:
                     x for x in self.nodes if x.mode == RECEIVING and x.state != BUS_OFF
                 ]
             if listening_nodes:
-                reporter_node = random.choice(listening_nodes)
+                reporter_node = self.rng.choice(listening_nodes)
             else:
                 transmitters = [x for x in self.nodes if x.mode == TRANSMITTING and x.state != BUS_OFF]
                 if transmitters:
-                    reporter_node = random.choice(transmitters)
+                    reporter_node = self.rng.choice(transmitters)
 
         if not reporter_node:
             print("No valid reporter node found for error frame => skipping.")
             return
 
         print(f"Node {reporter_node.node_id} => broadcasting error frame: {error_type}")
+        if self.accounting is not None:
+            self.accounting.frame_aborted()
 
         err_frame = ErrorFrame(sent_by=reporter_node.node_id)
         reporter_node.message_queue.insert(0, err_frame)
@@ -699,6 +917,8 @@ class CANBus:
             self.current_winner = None
             self.error_reported = False
             self.state = IDLE
+            # the error was still detected and signalled; listeners see it like any other
+            self.notify("error_frame", reporter_node, error_type, message)
             return
 
         # 4) Increment receive error counters for nodes that were actually listening
@@ -721,6 +941,28 @@ class CANBus:
 
         print(f"Node {reporter_node.node_id} => Error frame inserted => partial sending soon.")
         print(f"{reporter_node.node_id} => {reporter_node.message_queue[0]}")
+        self.notify("error_frame", reporter_node, error_type, message)
+
+    def start_requested_overload(self):
+        """
+        Called when the bus becomes idle after a frame: nodes with pending overload
+        requests delay the next start of frame by one overload frame (their flags
+        overlap, so one frame serves all of them). Requests beyond
+        max_consecutive_overloads are dropped.
+        """
+        requesting = [nd for nd in self.nodes if nd.overload_pending > 0 and nd.state != BUS_OFF]
+        if not requesting:
+            return
+        if self.consecutive_overloads >= self.max_consecutive_overloads:
+            for nd in requesting:
+                self.overload_requests_dropped += nd.overload_pending
+                nd.overload_pending = 0
+            return
+        for nd in requesting:
+            nd.overload_pending -= 1
+        self.consecutive_overloads += 1
+        self.overload_frames += 1
+        self.broadcast_overload_frame(requesting[0])
 
     def broadcast_overload_frame(self, sender=None):
         print("Broadcasting overload frame.")
@@ -729,7 +971,7 @@ class CANBus:
             if not active:
                 print("No node available for OverloadFrame.")
                 return
-            sender = random.choice(active)
+            sender = self.rng.choice(active)
 
         overload = OverloadFrame(sent_by=sender.node_id)
         sender.message_queue.insert(0, overload)
@@ -746,6 +988,90 @@ class CANBus:
         self.arbitration_in_progress = False
         self.state = BUSY
         print(f"Node {sender.node_id} => Overload frame inserted => future partial sending.")
+        self.notify("overload_frame", sender)
+
+    def snapshot(self):
+        """
+        Captures the complete simulation state (node queues, counters, modes, bit
+        indices, arbitration state, bit_time and both RNG states) as plain picklable data.
+        Every frame is stored once in a frame table and referenced by index, with
+        copies of its lists, so later changes to the live frames do not reach it.
+        """
+        frames = []
+        frame_ids = {}
+
+        def frame_index(msg):
+            key = id(msg)
+            if key not in frame_ids:
+                frame_ids[key] = len(frames)
+                frames.append(frame_state(msg))
+            return frame_ids[key]
+
+        node_index = {id(nd): i for i, nd in enumerate(self.nodes)}
+        nodes = [(type(nd), nd.snapshot_state(frame_index)) for nd in self.nodes]
+        bus_state = {
+            "bitrate": self.bitrate,
+            "seed": self.seed,
+            "current_bit": self.current_bit,
+            "in_arbitration": self.in_arbitration,
+            "error": self.error,
+            "state": self.state,
+            "error_reported": self.error_reported,
+            "overload_request": self.overload_request,
+            "arbitration_in_progress": self.arbitration_in_progress,
+            "arbitration_bit_index": self.arbitration_bit_index,
+            "current_winner": node_index.get(id(self.current_winner)),
+            "arbitration_contenders": [node_index[id(nd)] for nd in self.arbitration_contenders],
+            "bit_time": self.bit_time,
+            "max_consecutive_overloads": self.max_consecutive_overloads,
+            "consecutive_overloads": self.consecutive_overloads,
+            "overload_frames": self.overload_frames,
+            "overload_bits": self.overload_bits,
+            "overload_requests_dropped": self.overload_requests_dropped,
+        }
+        if self.channel is not None:
+            bus_state["channel"] = self.channel.snapshot_state()
+        rng_state = (self.rng.getstate(), self.stimulus_rng.getstate())
+        return {"bus": bus_state, "nodes": nodes, "frames": frames, "rng": rng_state}
+
+    def restore(self, snapshot):
+        """
+        Puts the bus back into a snapshot's state. Fresh frame objects are built
+        from the frame table (with their own lists), so branches restored from the
+        same snapshot never see each other's changes.
+        """
+        if len(snapshot["nodes"]) != len(self.nodes):
+            raise ValueError(f"Snapshot has {len(snapshot['nodes'])} nodes, bus has {len(self.nodes)}")
+
+        frames = [frame_from_state(state) for state in snapshot["frames"]]
+
+        for nd, (_, state) in zip(self.nodes, snapshot["nodes"]):
+            nd.restore_state(state, frames)
+
+        bus_state = snapshot["bus"]
+        for key, value in bus_state.items():
+            if key not in ("current_winner", "arbitration_contenders", "channel"):
+                setattr(self, key, value)
+        winner = bus_state["current_winner"]
+        self.current_winner = self.nodes[winner] if winner is not None else None
+        self.arbitration_contenders = [self.nodes[i] for i in bus_state["arbitration_contenders"]]
+        if self.channel is not None and "channel" in bus_state:
+            self.channel.restore_state(bus_state["channel"])
+        self.current_bitstream.clear()
+        self.bitstream_display.clear()
+        self.rng.setstate(snapshot["rng"][0])
+        self.stimulus_rng.setstate(snapshot["rng"][1])
+
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Builds an independent bus (with new nodes) from a snapshot, e.g. to fork a run."""
+        bus = cls(bitrate=snapshot["bus"]["bitrate"], seed=snapshot["bus"]["seed"])
+        for (node_cls, state) in snapshot["nodes"]:
+            node = node_cls(state["node_id"])
+            bus.nodes.append(node)
+            node.set_bus(bus)
+        bus.restore(snapshot)
+        return bus
 
     def reset_nodes_after_error(self):
         for nd in self.nodes:
@@ -770,3 +1096,13 @@ class CANBus:
         self.arbitration_bit_index = 0
         self.current_winner = None
         self.arbitration_contenders.clear()
+        self.bit_time = 0
+        self.consecutive_overloads = 0
+        self.overload_frames = 0
+        self.overload_bits = 0
+        self.overload_requests_dropped = 0
+        if self.channel is not None:
+            self.channel.attach(self)
+        self.remote_requests.reset()
+        if self.accounting is not None:
+            self.accounting.reset()
@@ -0,0 +1,179 @@
+import collections
+import mmap
+import os
+import struct
+
+from can_node import BUS_OFF
+from can_trace import (BINARY_HEADER, BINARY_MAGIC, BINARY_RECORD, event_record,
+                       pack_binary_record, decode_binary_record)
+
+# Continuous capture into a fixed-size, memory-mapped ring file: every record
+# overwrites the oldest one, so a soak test can record for days without the file
+# growing. When a trigger fires, the records of the last `pre_trigger` seconds are
+# copied to a separate binary trace file and the following `post_trigger` seconds
+# are appended to it; the result reads like any trace (can_trace.read_trace).
+
+RING_MAGIC = b"CANRNG1\0"
+RING_HEADER = struct.Struct("<8sIQQ")  # magic, bitrate, capacity (records), records written so far
+
+
+class BusOffTrigger:
+    """Fires when a node (any, or one of node_ids) enters BUS_OFF; node states are checked on every event."""
+
+    def __init__(self, node_ids=None):
+        self.node_ids = set(node_ids) if node_ids is not None else None
+        self.bus_off = set()
+
+    def check(self, bus, event, args):
+        for nd in bus.nodes:
+            if nd.state == BUS_OFF and nd.node_id not in self.bus_off:
+                self.bus_off.add(nd.node_id)
+                if self.node_ids is None or nd.node_id in self.node_ids:
+                    return f"node {nd.node_id} bus off"
+            elif nd.state != BUS_OFF:
+                self.bus_off.discard(nd.node_id)
+        return None
+
+
+class ErrorRateTrigger:
+    """Fires when at least `errors` error frames fall within `window` seconds."""
+
+    def __init__(self, errors, window):
+        self.errors = errors
+        self.window = window
+        self.times = collections.deque()
+
+    def check(self, bus, event, args):
+        if event != "error_frame":
+            return None
+        now = bus.bit_time / bus.bitrate
+        self.times.append(now)
+        while self.times[0] < now - self.window:
+            self.times.popleft()
+        if len(self.times) >= self.errors:
+            self.times.clear()
+            return f"{self.errors} error frames within {self.window}s"
+        return None
+
+
+class IdTrigger:
+    """Fires on a data/remote frame with one of the given identifiers."""
+
+    def __init__(self, *identifiers):
+        self.identifiers = set(identifiers)
+
+    def check(self, bus, event, args):
+        if event == "frame_transmitted" and args[1].identifier in self.identifiers:
+            return f"frame {args[1].identifier:03X}"
+        return None
+
+
+class RingCapture:
+    """
+    ring = RingCapture(bus, "soak.ring", capacity=100000, triggers=[BusOffTrigger()],
+                       pre_trigger=120.0, post_trigger=10.0)
+
+    Records the same events as TraceRecorder (binary records) into a ring file of
+    `capacity` records. Each record is one slice assignment into the mapping plus
+    a header update, whatever the run length. Frozen windows are written to
+    <path>.<n>.bin and listed in `frozen` as (path, reason, trigger bit_time).
+    Triggers that fire while a window is still being completed are counted but do
+    not start another one.
+    """
+
+    def __init__(self, bus, path, capacity=100000, triggers=(), pre_trigger=60.0, post_trigger=10.0):
+        self.bus = bus
+        self.path = path
+        self.capacity = capacity
+        self.triggers = list(triggers)
+        self.pre_trigger = pre_trigger
+        self.post_trigger = post_trigger
+        self.written = 0
+        self.frozen = []
+        self.triggers_fired = 0
+        self.window = None  # (file, end bit_time) of the window being completed
+
+        size = RING_HEADER.size + capacity * BINARY_RECORD.size
+        self.file = open(path, "w+b")
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+        self.write_header()
+        bus.add_listener(self.on_bus_event)
+
+    def write_header(self):
+        RING_HEADER.pack_into(self.map, 0, RING_MAGIC, self.bus.bitrate, self.capacity, self.written)
+
+    def slot_offset(self, position):
+        return RING_HEADER.size + (position % self.capacity) * BINARY_RECORD.size
+
+    def on_bus_event(self, event, *args):
+        record = event_record(event, args)
+        if record is not None:
+            chunk = pack_binary_record(self.bus.bit_time, *record)
+            offset = self.slot_offset(self.written)
+            self.map[offset:offset + BINARY_RECORD.size] = chunk
+            self.written += 1
+            self.write_header()
+            if self.window is not None:
+                self.window[0].write(chunk)
+
+        if self.window is not None and self.bus.bit_time > self.window[1]:
+            self.finish_window()
+        for trigger in self.triggers:
+            reason = trigger.check(self.bus, event, args)
+            if reason is not None:
+                self.triggers_fired += 1
+                if self.window is None:
+                    self.freeze(reason)
+
+    def records(self, since_bit=None):
+        """Decoded records still in the ring, oldest first (optionally only from bit_time since_bit on)."""
+        first = max(self.written - self.capacity, 0)
+        for position in range(first, self.written):
+            fields = BINARY_RECORD.unpack_from(self.map, self.slot_offset(position))
+            if since_bit is not None and fields[0] < since_bit:
+                continue
+            yield decode_binary_record(fields, self.bus.bitrate)
+
+    def freeze(self, reason):
+        now = self.bus.bit_time
+        path = f"{self.path}.{len(self.frozen)}.bin"
+        out = open(path, "wb")
+        out.write(BINARY_HEADER.pack(BINARY_MAGIC, self.bus.bitrate))
+        since = now - int(self.pre_trigger * self.bus.bitrate)
+        first = max(self.written - self.capacity, 0)
+        for position in range(first, self.written):
+            offset = self.slot_offset(position)
+            if struct.unpack_from("<Q", self.map, offset)[0] >= since:
+                out.write(self.map[offset:offset + BINARY_RECORD.size])
+        self.frozen.append((path, reason, now))
+        print(f"Capture trigger: {reason} at bit {now} => {path}")
+        self.window = (out, now + int(self.post_trigger * self.bus.bitrate))
+
+    def finish_window(self):
+        out, _ = self.window
+        out.close()
+        self.window = None
+
+    def close(self):
+        self.bus.remove_listener(self.on_bus_event)
+        if self.window is not None:
+            self.finish_window()
+        self.map.flush()
+        self.map.close()
+        self.file.close()
+
+
+def read_ring(path):
+    """Records of a ring file left behind by a RingCapture (e.g. after a crash), oldest first."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as ring:
+            magic, bitrate, capacity, written = RING_HEADER.unpack_from(ring, 0)
+            if magic != RING_MAGIC:
+                raise ValueError(f"{path}: not a capture ring file")
+            records = []
+            for position in range(max(written - capacity, 0), written):
+                offset = RING_HEADER.size + (position % capacity) * BINARY_RECORD.size
+                records.append(decode_binary_record(BINARY_RECORD.unpack_from(ring, offset), bitrate))
+            return records
@@ -0,0 +1,192 @@
+import math
+import random
+
+# Channel models for CANBus.set_channel(). Instead of drawing a random number for
+# every bit, each model samples the position of its next bit error from a geometric
+# distribution, so the bus only compares bit_time against `next_error` per bit and
+# a low-BER soak run costs almost nothing for the channel.
+
+ALL_NODES = None  # target of an error seen by every node (a disturbance on the wire)
+
+
+def geometric_skip(rng, p):
+    """Number of error-free bits before the next error for a per-bit error probability p."""
+    if p <= 0:
+        return math.inf
+    if p >= 1:
+        return 0
+    return int(math.log(1.0 - rng.random()) / math.log(1.0 - p))
+
+
+class ChannelModel:
+    def __init__(self, seed=None):
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.next_error = math.inf
+        self.errors = 0
+
+    def attach(self, bus, stream=None):
+        self.seed_from(bus, stream)
+        self.schedule_from(bus.bit_time)
+
+    def seed_from(self, bus, stream=None):
+        # without its own seed a model draws from the bus seed; `stream` (the position
+        # inside a CompositeChannel) keeps models of the same class apart
+        if self.seed is None and bus.seed is not None:
+            key = f"{bus.seed}|{type(self).__name__}"
+            if stream is not None:
+                key += f"|{stream}"
+            self.rng = random.Random(key)
+
+    def schedule_from(self, bit_time):
+        raise NotImplementedError
+
+    def errors_at(self, bit_time):
+        """Consumes the errors scheduled up to bit_time; returns the targets of those at bit_time."""
+        targets = []
+        while self.next_error <= bit_time:
+            if self.next_error == bit_time:
+                targets.append(self.target())
+                self.errors += 1
+            self.schedule_from(self.next_error + 1)
+        return targets
+
+    def target(self):
+        return ALL_NODES
+
+    def snapshot_state(self):
+        return {k: v for k, v in self.__dict__.items() if k != "rng"} | {"rng": self.rng.getstate()}
+
+    def restore_state(self, state):
+        for key, value in state.items():
+            if key != "rng":
+                setattr(self, key, value)
+        self.rng.setstate(state["rng"])
+
+
+class BERChannel(ChannelModel):
+    """Independent bit errors with a fixed bit error rate, seen by every node."""
+
+    def __init__(self, ber, seed=None):
+        super().__init__(seed)
+        self.ber = ber
+
+    def schedule_from(self, bit_time):
+        self.next_error = bit_time + geometric_skip(self.rng, self.ber)
+
+
+class GilbertElliottChannel(ChannelModel):
+    """
+    Two-state burst model: the channel stays in the good or bad state for a
+    geometric number of bits (p_good_to_bad / p_bad_to_good per bit) and uses
+    that state's bit error rate meanwhile.
+    """
+
+    def __init__(self, ber_good, ber_bad, p_good_to_bad, p_bad_to_good, seed=None):
+        super().__init__(seed)
+        self.ber_good = ber_good
+        self.ber_bad = ber_bad
+        self.p_good_to_bad = p_good_to_bad
+        self.p_bad_to_good = p_bad_to_good
+        self.bad = False
+        self.state_end = 0
+
+    def attach(self, bus, stream=None):
+        self.seed_from(bus, stream)
+        self.bad = False
+        self.state_end = bus.bit_time + 1 + geometric_skip(self.rng, self.p_good_to_bad)
+        self.schedule_from(bus.bit_time)
+
+    def schedule_from(self, bit_time):
+        # sojourn times and error gaps are both memoryless, so the error gap is
+        # simply redrawn whenever the state changes before the next error
+        while True:
+            while bit_time >= self.state_end:
+                self.bad = not self.bad
+                leave = self.p_bad_to_good if self.bad else self.p_good_to_bad
+                self.state_end += 1 + geometric_skip(self.rng, leave)
+            ber = self.ber_bad if self.bad else self.ber_good
+            candidate = bit_time + geometric_skip(self.rng, ber)
+            if candidate < self.state_end or candidate == math.inf:
+                self.next_error = candidate
+                return
+            bit_time = self.state_end
+
+
+class NodeDisturbance(BERChannel):
+    """Bit errors seen by a single node only (local EMC disturbance, bad transceiver, ...)."""
+
+    def __init__(self, node_id, ber, seed=None):
+        super().__init__(ber, seed)
+        self.node_id = node_id
+
+    def target(self):
+        return self.node_id
+
+
+class CompositeChannel(ChannelModel):
+    def __init__(self, *models):
+        super().__init__()
+        self.models = list(models)
+
+    def attach(self, bus, stream=None):
+        for i, model in enumerate(self.models):
+            model.attach(bus, i if stream is None else f"{stream}.{i}")
+        self.next_error = min((m.next_error for m in self.models), default=math.inf)
+
+    def schedule_from(self, bit_time):
+        self.next_error = min((m.next_error for m in self.models), default=math.inf)
+
+    def errors_at(self, bit_time):
+        targets = []
+        for model in self.models:
+            if model.next_error <= bit_time:
+                targets.extend(model.errors_at(bit_time))
+        self.errors += len(targets)
+        self.schedule_from(bit_time)
+        return targets
+
+    def snapshot_state(self):
+        return {"models": [m.snapshot_state() for m in self.models], "next_error": self.next_error}
+
+    def restore_state(self, state):
+        for model, model_state in zip(self.models, state["models"]):
+            model.restore_state(model_state)
+        self.next_error = state["next_error"]
+
+
+class FrameBitFlip(ChannelModel):
+    """
+    Disturbs the wire exactly once: when node `node_id` transmits bit `bit_index`
+    (index into the stuffed bitstream) of a data or remote frame. Used for
+    deterministic fault injection, e.g. by can_fault_campaign.py.
+    """
+
+    def __init__(self, node_id, bit_index):
+        super().__init__(0)
+        self.node_id = node_id
+        self.bit_index = bit_index
+        self.fired_at = None
+        self.bus = None
+
+    def attach(self, bus, stream=None):
+        self.bus = bus
+        self.next_error = 0 if self.fired_at is None else math.inf
+
+    def schedule_from(self, bit_time):
+        pass
+
+    def errors_at(self, bit_time):
+        node = self.bus.current_winner
+        if (self.fired_at is None and node is not None and node.node_id == self.node_id
+                and node.current_bit_index - 1 == self.bit_index):
+            self.fired_at = bit_time
+            self.next_error = math.inf
+            self.errors += 1
+            return [ALL_NODES]
+        return []
+
+    def snapshot_state(self):
+        state = super().snapshot_state()
+        del state["bus"]
+        return state
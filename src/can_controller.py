@@ -0,0 +1,157 @@
+from can_node import CANNode, TRANSMITTING
+from can_message import DataFrame, RemoteFrame
+
+
+class ControllerNode(CANNode):
+    """
+    CANNode with a CAN controller model between the bus and the host.
+
+    Transmit: the host queues frames in software (host_queue); only the frames in
+    the `tx_mailboxes` transmit mailboxes (message_queue) take part in arbitration,
+    lowest identifier first. A high-priority frame waiting behind full mailboxes of
+    lower-priority frames is a priority inversion and is counted.
+
+    Receive: accepted frames go to a FIFO of `rx_fifo_depth` entries that the host
+    drains at `host_service_rate` frames per second (None = the host keeps up with
+    the bus). A frame arriving at a full FIFO is an overrun: it is dropped, or with
+    rx_overwrite=True it replaces the oldest entry, which is dropped instead.
+    """
+
+    def __init__(self, node_id, bus=None, produced_ids=None, filters=None,
+                 message_interval=0.025, node_comp="None",
+                 tx_mailboxes=3, rx_fifo_depth=2, host_service_rate=None, rx_overwrite=False):
+        super().__init__(node_id, bus, produced_ids, filters, message_interval, node_comp)
+        self.tx_mailboxes = tx_mailboxes
+        self.rx_fifo_depth = rx_fifo_depth
+        self.host_service_rate = host_service_rate
+        self.rx_overwrite = rx_overwrite
+
+        self.host_queue = []
+        self.rx_fifo = []
+        self.rx_next_service = 0  # bit_time at which the host reads the next FIFO entry
+        self.rx_frames = 0
+        self.rx_overruns = 0
+        self.frames_dropped = 0
+        self.host_frames_read = 0
+        self.rx_fifo_max = 0
+        self.tx_priority_inversions = 0
+
+    def set_bus(self, bus):
+        if self.bus is not None:
+            self.bus.remove_listener(self.on_bus_event)
+        super().set_bus(bus)
+        if bus is not None:
+            bus.add_listener(self.on_bus_event)
+
+    def mailboxes_used(self):
+        return sum(1 for msg in self.message_queue if isinstance(msg, (DataFrame, RemoteFrame)))
+
+    def fill_mailboxes(self):
+        while self.host_queue and self.mailboxes_used() < self.tx_mailboxes:
+            msg = self.host_queue.pop(0)
+            self.message_queue.append(msg)
+            self.reorder_message_queue()
+
+    def add_message_to_queue(self, message):
+        if not isinstance(message, (DataFrame, RemoteFrame)):
+            return super().add_message_to_queue(message)
+        if not self.admit_frame(message):
+            return False
+        # the host queueing the frame is the input; moving it into a mailbox (now or when
+        # one frees up while the bus steps) follows from the controller state
+        self.host_queue.append(message)
+        self.fill_mailboxes()
+        self.notify_queued(message)
+        return True
+
+    def enqueue_frame(self, msg):
+        if not isinstance(msg, (DataFrame, RemoteFrame)):
+            return super().enqueue_frame(msg)
+        if not self.admit_frame(msg):
+            return False
+        self.host_queue.append(msg)
+        self.mode = TRANSMITTING
+        self.fill_mailboxes()
+        self.notify_queued(msg)
+        return True
+
+    def on_bus_event(self, event, *args):
+        if not args or args[0] is not self:
+            return
+        if event == "frame_received":
+            self.receive_into_fifo(args[1])
+        elif event == "frame_transmitted":
+            msg = args[1]
+            if any(m.identifier is not None and m.identifier < msg.identifier for m in self.host_queue):
+                self.tx_priority_inversions += 1
+        elif event == "frame_complete":
+            self.fill_mailboxes()
+
+    def service_bits(self):
+        return self.bus.bitrate / self.host_service_rate
+
+    def service_rx_fifo(self, now=None):
+        """Lets the host read the FIFO entries it has had time for up to bit_time `now`."""
+        if not self.rx_fifo or self.host_service_rate is None:
+            return
+        now = self.bus.bit_time if now is None else now
+        while self.rx_fifo and self.rx_next_service <= now:
+            self.rx_fifo.pop(0)
+            self.host_frames_read += 1
+            if self.rx_fifo:
+                self.rx_next_service += self.service_bits()
+
+    def receive_into_fifo(self, msg):
+        self.rx_frames += 1
+        if self.host_service_rate is None:
+            self.host_frames_read += 1
+            return
+        now = self.bus.bit_time
+        self.service_rx_fifo(now)
+        if len(self.rx_fifo) >= self.rx_fifo_depth:
+            self.rx_overruns += 1
+            self.frames_dropped += 1
+            print(f"Node {self.node_id} => RX FIFO overrun, frame {msg.identifier} lost.")
+            if not self.rx_overwrite:
+                return
+            self.rx_fifo.pop(0)
+        if not self.rx_fifo:
+            self.rx_next_service = max(self.rx_next_service, now) + self.service_bits()
+        self.rx_fifo.append(msg)
+        self.rx_fifo_max = max(self.rx_fifo_max, len(self.rx_fifo))
+
+    def controller_stats(self):
+        self.service_rx_fifo()
+        return {
+            "host_queue": len(self.host_queue),
+            "mailboxes_used": self.mailboxes_used(),
+            "tx_priority_inversions": self.tx_priority_inversions,
+            "rx_frames": self.rx_frames,
+            "rx_fifo": len(self.rx_fifo),
+            "rx_fifo_max": self.rx_fifo_max,
+            "rx_overruns": self.rx_overruns,
+            "frames_dropped": self.frames_dropped,
+            "host_frames_read": self.host_frames_read,
+        }
+
+    def snapshot_state(self, frame_index):
+        state = super().snapshot_state(frame_index)
+        state["host_queue"] = [frame_index(msg) for msg in self.host_queue]
+        state["rx_fifo"] = [frame_index(msg) for msg in self.rx_fifo]
+        return state
+
+    def restore_state(self, state, frames):
+        super().restore_state(state, frames)
+        self.host_queue = [frames[i] for i in state["host_queue"]]
+        self.rx_fifo = [frames[i] for i in state["rx_fifo"]]
+
+    def reset_node(self):
+        super().reset_node()
+        self.rx_fifo.clear()
+        self.rx_next_service = 0
+        self.rx_frames = 0
+        self.rx_overruns = 0
+        self.frames_dropped = 0
+        self.host_frames_read = 0
+        self.rx_fifo_max = 0
+        self.tx_priority_inversions = 0
@@ -0,0 +1,218 @@
+import threading
+import time
+from collections import namedtuple
+
+from can_node import TRANSMITTING
+from can_realtime import RealTimeRunner
+
+# Read-only views of the simulation, published by SimulationEngine. They only hold
+# plain values (tuples, strings, ints), so a GUI thread can keep and render one while
+# the engine keeps stepping the live bus.
+FrameView = namedtuple("FrameView", "frame_class frame_type identifier sent_by error_type "
+                                    "error_bit_index bits sections ack_index")
+NodeView = namedtuple("NodeView", "node_id component state mode tec rec queue_length bit_index head")
+BusView = namedtuple("BusView", "clock bit_time state current_bit winner arbitration nodes events changes")
+# events: (serial, event, node_id, FrameView or None, error_type) of frame_transmitted
+# and error_frame bus events, so nothing is lost between the views a GUI renders.
+# changes: (node_id, fields) of what changed since the view the GUI took before, with
+# node_id None for the bus itself, so a GUI redraws only what changed.
+
+NODE_FIELDS = ("component", "state", "mode", "tec", "rec", "queue_length")  # plus "head" (new queue head)
+BUS_FIELDS = ("state", "winner")
+
+
+def frame_view(msg):
+    bits = tuple(msg.get_bitstream())
+    return FrameView(type(msg), msg.frame_type, msg.identifier, msg.sender_id, msg.error_type,
+                     msg.error_bit_index, bits, dict(msg.sections), len(bits) - 12)
+
+
+def frame_key(msg):
+    # what changes a queued frame's bits after it was built: the ACK slot and error injection
+    return (msg.ack_slot, msg.error_type, msg.error_bit_index, id(msg.transmitted_bitstream))
+
+
+def node_view(nd, head=None):
+    if head is None and nd.message_queue:
+        head = frame_view(nd.message_queue[0])
+    return NodeView(nd.node_id, getattr(nd, "component", "None"), nd.state, nd.mode,
+                    nd.transmit_error_counter, nd.receive_error_counter,
+                    len(nd.message_queue), nd.current_bit_index, head)
+
+
+class SimulationEngine:
+    """
+    engine = SimulationEngine(bus, rate=2000, step=playground.step_bus)
+    engine.resume()
+    ... every 1/30 s in the GUI:  view = engine.latest()
+
+    Runs a CANBus in a worker thread at `rate` bits per second (paced by a
+    RealTimeRunner) and publishes a BusView at most `frame_rate` times a second and
+    whenever it pauses. The GUI renders the newest view on its own timer, the states
+    in between are skipped, so the bit rate no longer depends on redraw time or on
+    the Tk timer resolution.
+
+    The worker holds `lock` while it steps. Code on other threads that changes the
+    bus or its nodes (queueing frames, adding nodes, resetting) takes the lock too,
+    or pauses the engine first.
+    """
+
+    def __init__(self, bus, rate=1000.0, step=None, frame_rate=30.0, wake_interval=0.005):
+        self.bus = bus
+        self.step_bus = step if step is not None else bus.simulate_step
+        self.frame_rate = frame_rate
+        self.wake_interval = wake_interval
+        self.runner = RealTimeRunner(bus, bitrate=rate, wake_interval=wake_interval, step=self.step)
+        self.lock = threading.RLock()
+        self.view_lock = threading.Lock()
+        self.resumed = threading.Event()
+        self.running = False
+        self.closing = False
+        self.clock = 0
+        self.arbitration = ""
+        self.events = []
+        self.event_serial = 0
+        self.consumed_serial = 0
+        self.view = None
+        self.previous_nodes = {}  # node_id -> (NodeView, queue head, frame_key) of the last published view
+        self.previous_bus = None
+        self.dirty = {}           # node_id (None: bus) -> fields changed since the GUI's last view
+        self.next_publish = 0.0
+        bus.add_listener(self.on_bus_event)
+        self.worker = threading.Thread(target=self.work, name="can-engine", daemon=True)
+        self.worker.start()
+
+    def step(self):
+        self.step_bus()
+        self.clock += 1
+        bus = self.bus
+        if bus.current_winner:
+            self.arbitration = ""
+        elif sum(1 for nd in bus.nodes if nd.mode == TRANSMITTING) > 1:
+            self.arbitration += f"{bus.current_bit}"
+
+    def on_bus_event(self, event, *args):
+        if event == "frame_transmitted":
+            node, msg = args
+            self.add_event(event, node.node_id, frame_view(msg), None)
+        elif event == "error_frame":
+            _, error_type, msg = args
+            if msg is not None:
+                self.add_event(event, msg.sender_id, frame_view(msg), error_type)
+
+    def add_event(self, event, node_id, frame, error_type):
+        self.event_serial += 1
+        self.events.append((self.event_serial, event, node_id, frame, error_type))
+
+    def work(self):
+        while True:
+            self.resumed.wait()
+            if self.closing:
+                return
+            with self.lock:
+                if self.running:
+                    self.runner.poll()
+                    now = time.perf_counter()
+                    if now >= self.next_publish:
+                        self.publish()
+                        self.next_publish = now + 1.0 / self.frame_rate
+            time.sleep(self.wake_interval)
+
+    def publish(self):
+        """Builds a view of the current state; the caller holds the lock."""
+        bus = self.bus
+        winner = bus.current_winner.node_id if bus.current_winner else None
+        with self.view_lock:
+            nodes = self.track_changes(bus, winner)
+            self.events = [e for e in self.events if e[0] > self.consumed_serial]
+            changes = tuple((node_id, tuple(fields)) for node_id, fields in self.dirty.items())
+            self.view = BusView(self.clock, bus.bit_time, bus.state, bus.current_bit, winner,
+                                self.arbitration, nodes, tuple(self.events), changes)
+        return self.view
+
+    def track_changes(self, bus, winner):
+        """Node views of the bus; what differs from the previous view is merged into self.dirty."""
+        nodes = []
+        current = {}
+        for nd in bus.nodes:
+            head = nd.message_queue[0] if nd.message_queue else None
+            key = frame_key(head) if head is not None else None
+            previous = self.previous_nodes.get(nd.node_id)
+            if previous is None:
+                nv = node_view(nd)
+                changed = NODE_FIELDS + ("head",)
+            else:
+                old, old_head, old_key = previous
+                # the same frame keeps its FrameView, its bits are not copied again
+                same_frame = head is not None and head is old_head and key == old_key
+                nv = node_view(nd, old.head if same_frame else None)
+                changed = tuple(f for f in NODE_FIELDS if getattr(nv, f) != getattr(old, f))
+                if head is not old_head:
+                    changed += ("head",)
+            if changed:
+                self.dirty.setdefault(nd.node_id, set()).update(changed)
+            current[nd.node_id] = (nv, head, key)
+            nodes.append(nv)
+        for node_id in self.previous_nodes.keys() - current.keys():
+            self.dirty.setdefault(node_id, set()).add("removed")
+        self.previous_nodes = current
+
+        bus_values = (bus.state, winner)
+        if self.previous_bus is None:
+            changed = BUS_FIELDS
+        else:
+            changed = tuple(f for f, new, old in zip(BUS_FIELDS, bus_values, self.previous_bus) if new != old)
+        if changed:
+            self.dirty.setdefault(None, set()).update(changed)
+        self.previous_bus = bus_values
+        return tuple(nodes)
+
+    def latest(self):
+        """Newest published view (None before the first one); its events and changes count as delivered."""
+        with self.view_lock:
+            if self.view is not None and self.view.events:
+                self.consumed_serial = max(self.consumed_serial, self.view.events[-1][0])
+            self.dirty = {}
+            return self.view
+
+    def refresh(self):
+        """Publishes the current state right away (e.g. after a change while paused) and returns it."""
+        with self.lock:
+            self.publish()
+        return self.latest()
+
+    def resume(self):
+        with self.lock:
+            if not self.running:
+                self.runner.start()
+                self.running = True
+                self.resumed.set()
+
+    def pause(self):
+        """Stops stepping; when it returns the worker is between bits and the bus may be changed."""
+        with self.lock:
+            self.running = False
+            self.resumed.clear()
+            self.publish()
+
+    def set_rate(self, rate):
+        with self.lock:
+            self.runner.bitrate = rate
+            self.runner.start()
+
+    def reset(self):
+        with self.lock:
+            self.clock = 0
+            self.arbitration = ""
+            self.events = []
+            self.previous_nodes = {}
+            self.previous_bus = None
+            self.publish()
+
+    def close(self):
+        with self.lock:
+            self.running = False
+            self.closing = True
+            self.resumed.set()
+        self.bus.remove_listener(self.on_bus_event)
+        self.worker.join()
@@ -1,7 +1,124 @@
 from can_message import CANMessage, DataFrame, ErrorFrame, OverloadFrame, RemoteFrame
 
+CRC_POLYNOMIAL = 0b100010010000001  # same register as CANMessage.calculate_crc
+
+# destuffed bit positions of the fields in front of the data field
+RTR_BIT = 12
+DLC_BITS = range(13, 17)
+DATA_START = 19
+
 class CANErrorHandler:
-    def inject_error(self, error_type, message):
+    def __init__(self):
+        self.start_frame()
+
+    def start_frame(self):
+        """Resets the streaming receive checks at a start of frame."""
+        self.rx_pos = 0  # destuffed bit position in the frame
+        self.rx_run_level = None
+        self.rx_run_length = 0
+        self.rx_stuffing = True
+        self.rx_rtr = 0
+        self.rx_dlc = 0
+        self.rx_data_end = None
+        self.rx_crc_end = None
+        self.rx_crc = 0
+        self.rx_crc_received = 0
+        self.rx_error = None
+
+    def receive_bit(self, level):
+        """
+        Streaming receive checks for one bus level: destuffing (stuff_error), the CRC
+        register over SOF..data compared with the received CRC at the CRC delimiter
+        (crc_error) and the fixed-form delimiters / EOF (form_error).
+        Returns the detected error type (kept until the next start_frame) or None.
+        """
+        if self.rx_error is not None:
+            return self.rx_error
+        pos = self.rx_pos
+
+        if self.rx_stuffing:
+            if self.rx_run_length == 5:
+                # stuff bit: must differ from the run, is dropped afterwards
+                if level == self.rx_run_level:
+                    self.rx_error = "stuff_error"
+                    return self.rx_error
+                self.rx_run_level = level
+                self.rx_run_length = 1
+                if pos == self.rx_crc_end:
+                    self.rx_stuffing = False
+                return None
+
+            if pos > 0:  # SOF is not part of the stuffed section
+                if level == self.rx_run_level:
+                    self.rx_run_length += 1
+                else:
+                    self.rx_run_level = level
+                    self.rx_run_length = 1
+
+            if pos < DATA_START or pos < self.rx_data_end:
+                crc = ((self.rx_crc << 1) | level) & 0x7FFF
+                if crc & 0x4000:
+                    crc ^= CRC_POLYNOMIAL
+                self.rx_crc = crc
+                if pos == RTR_BIT:
+                    self.rx_rtr = level
+                elif pos in DLC_BITS:
+                    self.rx_dlc = (self.rx_dlc << 1) | level
+                elif pos == DATA_START - 1:
+                    data_bytes = 0 if self.rx_rtr else min(self.rx_dlc, 8)
+                    self.rx_data_end = DATA_START + 8 * data_bytes
+                    self.rx_crc_end = self.rx_data_end + 15
+            else:
+                self.rx_crc_received = (self.rx_crc_received << 1) | level
+
+            self.rx_pos = pos + 1
+            if self.rx_pos == self.rx_crc_end and self.rx_run_length != 5:
+                self.rx_stuffing = False
+            return None
+
+        self.rx_pos = pos + 1
+        offset = pos - self.rx_crc_end
+        if offset == 0:
+            if self.rx_crc != self.rx_crc_received:
+                self.rx_error = "crc_error"
+            elif level == 0:
+                self.rx_error = "form_error"
+        elif 2 <= offset < 10 and level == 0:  # ACK delimiter and EOF (the ACK slot is driven by the receivers)
+            self.rx_error = "form_error"
+        return self.rx_error
+
+    def check_transmitted_bit(self, index, frame_length, sent, level):
+        """
+        Transmitter-side checks for bit `index` of its stuffed bitstream: the ACK slot
+        must read dominant (ack_error), every other bit must read back as sent
+        (bit_error, form_error in the delimiters / EOF). The intermission is not checked.
+        """
+        if index == frame_length - 12:
+            return "ack_error" if level == 1 else None
+        if index >= frame_length - 3 or not self.bit_monitoring_check(sent, level):
+            return None
+        if index >= frame_length - 13:
+            return "form_error"
+        return "bit_error"
+
+    def scan_frame(self, message):
+        """
+        Runs a frame's wire bitstream through the streaming checks (acknowledged by a
+        receiver, with its injected disturbance if any) and returns the first error or None.
+        """
+        checker = CANErrorHandler()
+        bitstream = message.get_bitstream()
+        flipped_index, original = message.bit_flipped
+        n = len(bitstream)
+        for index, level in enumerate(bitstream):
+            sent = original if index == flipped_index else level
+            if index == n - 12 and index != flipped_index:
+                level = 0
+            error_type = checker.check_transmitted_bit(index, n, sent, level) or checker.receive_bit(level)
+            if error_type:
+                return error_type
+        return None
+    def inject_error(self, error_type, message, rng=None):
         if isinstance(message, ErrorFrame) or isinstance(message, OverloadFrame):
             print(f"Cannot inject errors into {message.frame_type}.")
             return
@@ -12,7 +129,7 @@ class CANErrorHandler:
         }
 
         if error_type in valid_errors.get(message.frame_type, []):
-            getattr(message, f"corrupt_{error_type.split('_')[0]}")()  #calling corrupt method according to the error we want to inject
+            getattr(message, f"corrupt_{error_type.split('_')[0]}")(rng)  #calling corrupt method according to the error we want to inject
             print(f"{error_type} injected into message ID {message.identifier}.")
         else:
             print(f"{error_type} is not valid for {message.frame_type}.")
@@ -44,14 +161,4 @@ class CANErrorHandler:
         return message.ack_slot != 0 
     
     def detect_error(self, error_type, message):
-        if error_type == "bit_error":
-            return message.error_type == "bit_error"
-        elif error_type == "stuff_error":
-            return message.error_type == "stuff_error"
-        elif error_type == "crc_error":
-            return message.error_type == "crc_error"
-        elif error_type == "ack_error":
-            return message.error_type == "ack_error"
-        elif error_type == "form_error":
-            return message.error_type == "form_error"
-        return False
+        return self.scan_frame(message) == error_type
@@ -0,0 +1,254 @@
+import os
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+
+from can_bus import CANBus
+from can_channel import FrameBitFlip
+from can_node import CANNode
+from can_message import DataFrame, RemoteFrame, frame_state, frame_from_state
+
+# Fault-coverage campaign: every frame x every wire bit position x every fault kind
+# is run through the bit-accurate bus path on a small bus (one transmitter plus
+# receivers). A fault forces the wire to a level at one bit of the first attempt:
+#   bit_flip         inverts the bit
+#   stuff_violation  repeats the previous bit (six equal bits where a stuff bit was due)
+#   ack_missing      forces recessive (a missing ACK in the ACK slot)
+#   form_violation   forces dominant (breaks delimiters / EOF)
+# A fault that forces the level the wire already has cannot be observed and is
+# recorded as MASKED without running it.
+
+FAULT_KINDS = ["bit_flip", "stuff_violation", "ack_missing", "form_violation"]
+ERROR_TYPES = ["bit_error", "stuff_error", "crc_error", "ack_error", "form_error"]
+
+MASKED = 0      # forced level equals the wire level
+UNDETECTED = 1  # frame completed without an error frame
+DETECTED = 2    # an error frame was raised
+LOST = 3        # neither completed nor detected within the horizon
+NOT_APPLICABLE = -1  # bit position beyond the frame's length
+
+TRANSMITTER_ID = 1
+
+
+def wire_levels(msg):
+    """Bus levels of a fault-free transmission (the ACK slot is driven dominant by the receivers)."""
+    levels = msg.get_bitstream()
+    levels[len(levels) - 12] = 0
+    return levels
+
+
+def forced_level(kind, levels, position):
+    if kind == "bit_flip":
+        return 1 - levels[position]
+    if kind == "stuff_violation":
+        return levels[position - 1] if position > 0 else 1  # bus idle (recessive) before SOF
+    if kind == "ack_missing":
+        return 1
+    if kind == "form_violation":
+        return 0
+    raise ValueError(f"Unknown fault kind {kind}")
+
+
+class FaultCoverageMatrix:
+    """
+    Results of a campaign as flat typed arrays indexed by (frame, bit position, fault kind).
+    Positions past a frame's length hold NOT_APPLICABLE; error_type is an index into
+    ERROR_TYPES, reporter is 0 for the transmitter and 1.. for the receivers, -1 = none.
+    """
+
+    FIELDS = {
+        "outcome": "b",
+        "error_type": "b",
+        "detect_bit": "h",     # frame bit index at which the error frame was raised
+        "reporter": "b",
+        "tec_delta": "h",      # transmitter TEC change when the error was signalled
+        "rec_delta": "h",      # largest receiver REC change when the error was signalled
+        "retransmitted": "b",  # 1 if the frame went through on a later attempt
+    }
+
+    def __init__(self, frame_count, max_bits, kinds=FAULT_KINDS):
+        self.frame_count = frame_count
+        self.max_bits = max_bits
+        self.kinds = list(kinds)
+        size = frame_count * max_bits * len(self.kinds)
+        for name, code in self.FIELDS.items():
+            setattr(self, name, array(code, [NOT_APPLICABLE]) * size)
+
+    def index(self, frame, position, kind):
+        return (frame * self.max_bits + position) * len(self.kinds) + kind
+
+    def store_frame(self, frame, rows):
+        """rows: {field: array over (position, kind)} as returned by run_frame_faults()."""
+        start = self.index(frame, 0, 0)
+        for name in self.FIELDS:
+            values = rows[name]
+            getattr(self, name)[start:start + len(values)] = values
+
+    def cell(self, frame, position, kind):
+        i = self.index(frame, position, self.kinds.index(kind) if isinstance(kind, str) else kind)
+        return {name: getattr(self, name)[i] for name in self.FIELDS}
+
+    def summary(self):
+        """Per fault kind: outcome counts, detections per error type and coverage (detected / observable)."""
+        result = {}
+        n_kinds = len(self.kinds)
+        for k, kind in enumerate(self.kinds):
+            outcomes = {"masked": 0, "undetected": 0, "detected": 0, "lost": 0}
+            by_type = dict.fromkeys(ERROR_TYPES, 0)
+            retransmitted = 0
+            for i in range(k, len(self.outcome), n_kinds):
+                outcome = self.outcome[i]
+                if outcome == NOT_APPLICABLE:
+                    continue
+                outcomes[("masked", "undetected", "detected", "lost")[outcome]] += 1
+                if outcome == DETECTED:
+                    by_type[ERROR_TYPES[self.error_type[i]]] += 1
+                    retransmitted += self.retransmitted[i]
+            observable = outcomes["undetected"] + outcomes["detected"] + outcomes["lost"]
+            result[kind] = {
+                **outcomes,
+                "by_error_type": by_type,
+                "retransmitted": retransmitted,
+                "coverage": outcomes["detected"] / observable if observable else 1.0,
+            }
+        return result
+
+
+def build_campaign_bus(receivers):
+    bus = CANBus(seed=0)
+    for node_id in range(TRANSMITTER_ID, TRANSMITTER_ID + receivers + 1):
+        bus.connect_node(CANNode(node_id))
+    return bus
+
+
+def run_frame_faults(state, receivers=2, kinds=FAULT_KINDS, max_bits=None):
+    """
+    Runs every bit position x fault kind for one frame (given as frame_state()).
+    A fault-free pass snapshots the bus before each transmitted bit, so each fault
+    run restores the snapshot instead of replaying the frame's prefix.
+    """
+    msg = frame_from_state(state)
+    levels = wire_levels(msg)
+    # freeze the frame to its wire bitstream (as error injection does), so the bus
+    # does not re-stuff it on every get_bitstream() call
+    msg.transmitted_bitstream = levels.copy()
+    n_bits = len(levels)
+    max_bits = max_bits or n_bits
+    horizon = 3 * n_bits + 50
+
+    bus = build_campaign_bus(receivers)
+    tx = bus.nodes[0]
+    tx.add_message_to_queue(msg)
+
+    snapshots = {}
+    clean_bits = 0
+    while len(snapshots) < n_bits and clean_bits < horizon:
+        before = bus.snapshot()
+        bus.simulate_step()
+        clean_bits += 1
+        if bus.current_winner is tx and tx.message_queue and tx.message_queue[0] is msg:
+            snapshots.setdefault(tx.current_bit_index - 1, before)
+        elif not tx.message_queue or tx.message_queue[0] is not msg:
+            snapshots.setdefault(n_bits - 1, before)  # the last bit completes the frame
+            break
+
+    record = {}
+
+    def on_bus_event(event, *args):
+        if event == "error_frame" and "error_type" not in record:
+            reporter, error_type, _ = args
+            record["error_type"] = ERROR_TYPES.index(error_type)
+            record["error_time"] = bus.bit_time
+            record["reporter"] = bus.nodes.index(reporter)
+            record["tec_delta"] = tx.transmit_error_counter - record["tec"]
+            record["rec_delta"] = max(nd.receive_error_counter - rec
+                                      for nd, rec in zip(bus.nodes[1:], record["rec"]))
+        elif event == "frame_transmitted" and args[0] is tx:
+            record["transmitted"] = True
+
+    bus.add_listener(on_bus_event)
+    rows = {name: array(code, [NOT_APPLICABLE]) * (max_bits * len(kinds))
+            for name, code in FaultCoverageMatrix.FIELDS.items()}
+
+    for position in range(n_bits):
+        snap = snapshots.get(position)
+        for k, kind in enumerate(kinds):
+            i = position * len(kinds) + k
+            if snap is None or forced_level(kind, levels, position) == levels[position]:
+                rows["outcome"][i] = MASKED
+                continue
+
+            bus.set_channel(None)
+            bus.restore(snap)
+            injector = FrameBitFlip(tx.node_id, position)
+            bus.set_channel(injector)
+            record.clear()
+            record["tec"] = tx.transmit_error_counter
+            record["rec"] = [nd.receive_error_counter for nd in bus.nodes[1:]]
+
+            for _ in range(horizon):
+                bus.simulate_step()
+                if record.get("transmitted"):
+                    break
+                if "error_type" in record and not tx.message_queue and bus.current_winner is None:
+                    break  # not retransmitted (e.g. form errors) and the bus is done
+
+            if "error_type" in record:
+                rows["outcome"][i] = DETECTED
+                rows["error_type"][i] = record["error_type"]
+                rows["detect_bit"][i] = position + record["error_time"] - injector.fired_at
+                rows["reporter"][i] = record["reporter"]
+                rows["tec_delta"][i] = record["tec_delta"]
+                rows["rec_delta"][i] = record["rec_delta"]
+                rows["retransmitted"][i] = 1 if record.get("transmitted") else 0
+            else:
+                rows["outcome"][i] = UNDETECTED if record.get("transmitted") else LOST
+    bus.set_channel(None)
+    return rows
+
+
+def _campaign_task(task):
+    frame, state, receivers, kinds, max_bits = task
+    with open(os.devnull, "w") as sink, redirect_stdout(sink):
+        return frame, run_frame_faults(state, receivers, kinds, max_bits)
+
+
+class FaultCampaign:
+    """
+    campaign = FaultCampaign(frames, receivers=2)
+    matrix = campaign.run()
+    matrix.summary()["bit_flip"]["coverage"]
+
+    Frames are distributed over a process pool (one task per frame); only data
+    and remote frames are meaningful inputs.
+    """
+
+    def __init__(self, frames, receivers=2, kinds=FAULT_KINDS, max_workers=None):
+        self.frames = [msg for msg in frames if isinstance(msg, (DataFrame, RemoteFrame))]
+        self.receivers = receivers
+        self.kinds = list(kinds)
+        self.max_workers = max_workers
+        self.max_bits = max((len(msg.get_bitstream()) for msg in self.frames), default=0)
+
+    def tasks(self):
+        return [(f, frame_state(msg), self.receivers, self.kinds, self.max_bits)
+                for f, msg in enumerate(self.frames)]
+
+    def run(self, progress=None, processes=True):
+        matrix = FaultCoverageMatrix(len(self.frames), self.max_bits, self.kinds)
+        tasks = self.tasks()
+        if not processes:
+            for done, task in enumerate(tasks, 1):
+                frame, rows = _campaign_task(task)
+                matrix.store_frame(frame, rows)
+                if progress:
+                    progress(done, len(tasks))
+            return matrix
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = [pool.submit(_campaign_task, task) for task in tasks]
+            for done, fut in enumerate(as_completed(futures), 1):
+                frame, rows = fut.result()
+                matrix.store_frame(frame, rows)
+                if progress:
+                    progress(done, len(tasks))
+        return matrix
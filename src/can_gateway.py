@@ -0,0 +1,246 @@
+import heapq
+import math
+import multiprocessing
+import os
+from contextlib import nullcontext, redirect_stdout
+
+from can_message import DataFrame, RemoteFrame
+from can_node import CANNode
+
+# Multi-segment networks: every segment is an ordinary CANBus, gateways forward
+# frames between segments. Segments advance in lock-step windows of the minimum
+# gateway latency (conservative lookahead): a frame completed inside a window can
+# only be due on another segment in a later window, so during a window segments
+# never need to talk to each other and can run in separate worker processes.
+# Cross-segment time is in seconds because segments may run at different bitrates.
+
+
+class GatewayRoute:
+    def __init__(self, src, dst, ids=None, translate=None, delay=0.0002):
+        """
+        Forwards frames from segment `src` to segment `dst`.
+        ids: identifiers to forward (any container, None = all).
+        translate: dict or picklable function mapping source id -> destination id.
+        delay: forwarding latency in seconds, must be > 0.
+        """
+        if delay <= 0:
+            raise ValueError("Gateway delay must be positive (it is the synchronization lookahead)")
+        self.src = src
+        self.dst = dst
+        self.ids = set(ids) if ids is not None and not isinstance(ids, range) else ids
+        self.translate = translate
+        self.delay = delay
+
+    def accepts(self, identifier):
+        return self.ids is None or identifier in self.ids
+
+    def translate_id(self, identifier):
+        if self.translate is None:
+            return identifier
+        if isinstance(self.translate, dict):
+            return self.translate.get(identifier, identifier)
+        return self.translate(identifier)
+
+    def __repr__(self):
+        return f"GatewayRoute({self.src} -> {self.dst}, delay={self.delay})"
+
+
+class SegmentRunner:
+    """Owns one segment's bus and its gateway port node; used in-process or inside a worker."""
+
+    def __init__(self, name, factory, gateway_node_id, routes):
+        self.name = name
+        self.bus = factory()
+        self.routes = routes
+        self.gateway = next((nd for nd in self.bus.nodes if nd.node_id == gateway_node_id), None)
+        if self.gateway is None:
+            self.gateway = CANNode(gateway_node_id)
+            self.bus.connect_node(self.gateway)
+        self.pending = []  # heap of (due_bit, seq, identifier, frame_type, data)
+        self.seq = 0
+        self.outgoing = []
+        self.forwarded = 0
+        self.injected = 0
+        self.bus.add_listener(self.on_bus_event)
+
+    def on_bus_event(self, event, *args):
+        if event != "frame_transmitted":
+            return
+        node, msg = args
+        if node is self.gateway:
+            return
+        now = self.bus.bit_time / self.bus.bitrate
+        for route in self.routes:
+            if route.accepts(msg.identifier):
+                self.outgoing.append((route.dst, now + route.delay, route.translate_id(msg.identifier),
+                                      msg.frame_type, list(msg.data_field)))
+                self.forwarded += 1
+
+    def inject(self, frames):
+        for (due_time, identifier, frame_type, data) in frames:
+            due_bit = math.ceil(due_time * self.bus.bitrate)
+            heapq.heappush(self.pending, (due_bit, self.seq, identifier, frame_type, data))
+            self.seq += 1
+
+    def advance(self, until, frames):
+        """Runs the segment up to time `until` (seconds) and returns the frames to forward."""
+        self.inject(frames)
+        end_bit = math.floor(until * self.bus.bitrate)
+        bus = self.bus
+        while bus.bit_time < end_bit:
+            while self.pending and self.pending[0][0] <= bus.bit_time:
+                (_, _, identifier, frame_type, data) = heapq.heappop(self.pending)
+                if frame_type == "Remote":
+                    msg = RemoteFrame(identifier, self.gateway.node_id, rng=bus.stimulus_rng)
+                else:
+                    msg = DataFrame(identifier, self.gateway.node_id, data)
+                self.gateway.add_message_to_queue(msg)
+                self.injected += 1
+            bus.simulate_step()
+        out = self.outgoing
+        self.outgoing = []
+        return out, self.stats()
+
+    def stats(self):
+        return {
+            "bit_time": self.bus.bit_time,
+            "forwarded": self.forwarded,
+            "injected": self.injected,
+            "gateway_queue": len(self.gateway.message_queue),
+            "pending": len(self.pending),
+        }
+
+
+def _segment_worker(conn, name, factory, gateway_node_id, routes, quiet):
+    sink = open(os.devnull, "w") if quiet else None
+    try:
+        with redirect_stdout(sink) if quiet else nullcontext():
+            runner = SegmentRunner(name, factory, gateway_node_id, routes)
+            while True:
+                cmd, args = conn.recv()
+                if cmd == "advance":
+                    conn.send(runner.advance(*args))
+                elif cmd == "call":
+                    conn.send(args[0](runner.bus))
+                elif cmd == "stop":
+                    break
+    finally:
+        if sink is not None:
+            sink.close()
+        conn.close()
+
+
+class MultiBusNetwork:
+    """
+    net = MultiBusNetwork()
+    net.add_segment("powertrain", make_powertrain_bus, gateway_node_id=99)
+    net.add_segment("body", make_body_bus, gateway_node_id=99)
+    net.add_route("powertrain", "body", ids=[0x100, 0x101], translate={0x100: 0x300}, delay=0.0005)
+    net.run(duration=1.0)
+
+    Segment factories must be picklable (module-level functions) when processes=True.
+    """
+
+    def __init__(self, processes=True, quiet=True):
+        self.processes = processes
+        self.quiet = quiet
+        self.segments = {}  # name -> (factory, gateway_node_id)
+        self.routes = []
+        self.time = 0.0
+        self.runners = {}
+        self.workers = {}
+        self.inbox = {}
+        self.segment_stats = {}
+        self.windows = 0
+        self._sink = None
+
+    def add_segment(self, name, factory, gateway_node_id):
+        if self.runners or self.workers:
+            raise RuntimeError("Cannot add segments to a running network")
+        self.segments[name] = (factory, gateway_node_id)
+
+    def add_route(self, src, dst, ids=None, translate=None, delay=0.0002):
+        if src not in self.segments or dst not in self.segments:
+            raise ValueError(f"Unknown segment in route {src} -> {dst}")
+        route = GatewayRoute(src, dst, ids, translate, delay)
+        self.routes.append(route)
+        return route
+
+    def lookahead(self):
+        if not self.routes:
+            return math.inf
+        return min(route.delay for route in self.routes)
+
+    def start(self):
+        self.inbox = {name: [] for name in self.segments}
+        for name, (factory, gateway_node_id) in self.segments.items():
+            routes = [r for r in self.routes if r.src == name]
+            if self.processes:
+                parent, child = multiprocessing.Pipe()
+                proc = multiprocessing.Process(target=_segment_worker,
+                                               args=(child, name, factory, gateway_node_id, routes, self.quiet),
+                                               daemon=True)
+                proc.start()
+                child.close()
+                self.workers[name] = (proc, parent)
+            else:
+                with self._output():
+                    self.runners[name] = SegmentRunner(name, factory, gateway_node_id, routes)
+
+    def stop(self):
+        for (proc, conn) in self.workers.values():
+            conn.send(("stop", ()))
+            proc.join()
+            conn.close()
+        self.workers.clear()
+        self.runners.clear()
+        if self._sink is not None:
+            self._sink.close()
+            self._sink = None
+
+    def advance(self, until):
+        """Runs all segments to time `until` (seconds), one lookahead window at a time."""
+        if not self.runners and not self.workers:
+            self.start()
+        window = self.lookahead()
+        while self.time < until:
+            end = min(until, self.time + window)
+            frames = {name: self.inbox[name] for name in self.segments}
+            self.inbox = {name: [] for name in self.segments}
+
+            if self.workers:
+                for name, (_, conn) in self.workers.items():
+                    conn.send(("advance", (end, frames[name])))
+                results = {name: conn.recv() for name, (_, conn) in self.workers.items()}
+            else:
+                with self._output():
+                    results = {name: runner.advance(end, frames[name]) for name, runner in self.runners.items()}
+
+            for name, (outgoing, stats) in results.items():
+                self.segment_stats[name] = stats
+                for (dst, due_time, identifier, frame_type, data) in outgoing:
+                    self.inbox[dst].append((due_time, identifier, frame_type, data))
+            self.time = end
+            self.windows += 1
+
+    def run(self, duration):
+        try:
+            self.advance(self.time + duration)
+        finally:
+            self.stop()
+        return self.segment_stats
+
+    def call(self, name, fn):
+        """Runs fn(bus) on a segment's bus (inside its worker) and returns the result."""
+        if self.workers:
+            conn = self.workers[name][1]
+            conn.send(("call", (fn,)))
+            return conn.recv()
+        return fn(self.runners[name].bus)
+
+    def _output(self):
+        if not self.quiet:
+            return nullcontext()
+        if self._sink is None:
+            self._sink = open(os.devnull, "w")
+        return redirect_stdout(self._sink)
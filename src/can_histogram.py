@@ -0,0 +1,43 @@
+class LatencyHistogram:
+    """Fixed-width histogram of latencies in bit times; mergeable across workers."""
+
+    def __init__(self, bin_width=50, counts=None):
+        self.bin_width = bin_width
+        self.counts = dict(counts) if counts else {}
+
+    def add(self, value):
+        b = int(value // self.bin_width)
+        self.counts[b] = self.counts.get(b, 0) + 1
+
+    def merge(self, other):
+        if other.bin_width != self.bin_width:
+            raise ValueError("Cannot merge histograms with different bin widths")
+        for b, c in other.counts.items():
+            self.counts[b] = self.counts.get(b, 0) + c
+        return self
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def quantile(self, q):
+        """Upper edge of the bin holding the q-quantile (0 <= q <= 1), None if empty."""
+        total = self.total()
+        if not total:
+            return None
+        seen = 0
+        for b in sorted(self.counts):
+            seen += self.counts[b]
+            if seen >= q * total:
+                return (b + 1) * self.bin_width
+        return (max(self.counts) + 1) * self.bin_width
+
+    def encode(self):
+        return ";".join(f"{b}:{c}" for b, c in sorted(self.counts.items()))
+
+    @classmethod
+    def decode(cls, text, bin_width=50):
+        counts = {}
+        for part in text.split(";") if text else []:
+            b, c = part.split(":")
+            counts[int(b)] = int(c)
+        return cls(bin_width, counts)
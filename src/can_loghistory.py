@@ -0,0 +1,86 @@
+import collections
+import itertools
+import tempfile
+from array import array
+
+
+class LogHistory:
+    """
+    Log entries, newest first (history[0] is the latest), with a bounded memory
+    footprint: the `capacity` newest entries are kept in a deque, older ones are
+    appended to a spill file and stay readable by index. Without spill they are
+    dropped (and counted in `dropped`). The spill file is a temporary file unless
+    spill_path is given; entries are stored as UTF-8 with their offsets kept in an
+    array, so reading an old entry is one seek.
+    """
+
+    def __init__(self, capacity=1000, spill=True, spill_path=None):
+        self.capacity = capacity
+        self.spill = spill
+        self.spill_path = spill_path
+        self.recent = collections.deque()
+        self.spill_file = None
+        self.offsets = array("Q")  # file offset of each spilled entry, oldest first
+        self.spill_end = 0
+        self.dropped = 0
+
+    def append(self, entry):
+        self.recent.appendleft(entry)
+        if len(self.recent) > self.capacity:
+            oldest = self.recent.pop()
+            if self.spill:
+                self.spill_entry(oldest)
+            else:
+                self.dropped += 1
+
+    def spill_entry(self, entry):
+        if self.spill_file is None:
+            self.spill_file = open(self.spill_path, "w+b") if self.spill_path else tempfile.TemporaryFile()
+        data = entry.encode("utf-8")
+        self.spill_file.seek(self.spill_end)
+        self.spill_file.write(data)
+        self.offsets.append(self.spill_end)
+        self.spill_end += len(data)
+
+    def __len__(self):
+        return len(self.recent) + len(self.offsets)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("log history index out of range")
+        if index < len(self.recent):
+            return self.recent[index]
+        return self.read_spilled(len(self.offsets) - 1 - (index - len(self.recent)))
+
+    def read_spilled(self, i):
+        start = self.offsets[i]
+        end = self.offsets[i + 1] if i + 1 < len(self.offsets) else self.spill_end
+        self.spill_file.seek(start)
+        return self.spill_file.read(end - start).decode("utf-8")
+
+    def latest(self):
+        return self.recent[0] if self.recent else None
+
+    def window(self, start, count):
+        """Entries start .. start+count-1 (newest first), reading only those."""
+        start = max(start, 0)
+        stop = min(start + count, len(self))
+        entries = list(itertools.islice(self.recent, start, min(stop, len(self.recent))))
+        for index in range(max(start, len(self.recent)), stop):
+            entries.append(self[index])
+        return entries
+
+    def clear(self):
+        self.recent.clear()
+        self.offsets = array("Q")
+        self.spill_end = 0
+        self.dropped = 0
+        if self.spill_file is not None:
+            self.spill_file.truncate(0)
+
+    def close(self):
+        if self.spill_file is not None:
+            self.spill_file.close()
+            self.spill_file = None
@@ -1,12 +1,12 @@
 import random
 
 class CANMessage:
-    def __init__(self, identifier, sent_by, data=None, frame_type="Data", error_type=None):
+    def __init__(self, identifier, sent_by, data=None, frame_type="Data", error_type=None, rng=None, dlc=None):
         self.start_of_frame = [0]
         self.identifier = identifier
         self.frame_type = frame_type
         self.rtr = [0] if frame_type == "Data" else [1]
-        self.control_field = self.calculate_control_field(data)
+        self.control_field = self.calculate_control_field(data, rng, dlc)
         self.data_field = data if data else [] 
         self.crc = self.calculate_crc()
         self.crc_delimiter = [1]
@@ -22,14 +22,18 @@ class CANMessage:
         self.retransmit_error = True
         self.unstuff_bitstream = None
         self.sections = {}
+        self.stuff_indices = []  # positions of the stuff bits in the transmitted bitstream
 
-    def calculate_control_field(self, data):
+    def calculate_control_field(self, data, rng=None, dlc=None):
         data_length_code_bits = "0000"
         if data:
             data_length_code = min(len(data), 8) 
             data_length_code_bits = f"{data_length_code:04b}"
-        else:
-            bytes_nr = random.randint(1, 8)
+        elif self.frame_type == "Remote" and dlc is not None:
+            # DLC of the data frame answering the request (CANBus.response_dlc())
+            data_length_code_bits = f"{min(dlc, 8):04b}"
+        elif self.frame_type == "Remote":
+            bytes_nr = (rng or random).randint(1, 8)
             #it should know for the data length code for the message it is requesting
             data_length_code_bits = f"{bytes_nr:04b}"
             #for a data frame message with that id we should request this number of bytes
@@ -131,9 +135,11 @@ class CANMessage:
         end_stuff = self.sections["crc_end"] + 1
         stuffing_section = bitstream[1:end_stuff] 
         stuff_idx = None
+        self.stuff_indices = []
         if self.error_type != "stuff_error":
             stuffed_section, stuff_idx = self.apply_bit_stuffing(stuffing_section)
             bitstream = [bitstream[0]] + stuffed_section + bitstream[-13:]
+            self.stuff_indices = [i + 1 for i in stuff_idx]  # the stuffed section starts after SOF
 
             offsets = self.compute_section_offsets(stuff_idx, self.sections)
             for key, offset in offsets.items():
@@ -168,7 +174,7 @@ class CANMessage:
         else:
             return f"CANMessage(type={self.frame_type})"
 
-    def corrupt_bit(self):
+    def corrupt_bit(self, rng=None):
         bitstream = self.get_bitstream()
         identifier_length = 1 + 11 
         start_of_corruptible_bits = identifier_length + 1 + 6 
@@ -176,7 +182,7 @@ class CANMessage:
         max_corrupt_bit = 1 + 11 + 1 + 6 + (8 * len(self.data_field)) + 15 - 1 
 
         if len(bitstream) > start_of_corruptible_bits and start_of_corruptible_bits < max_corrupt_bit:
-            bit_to_flip = random.randint(start_of_corruptible_bits, max_corrupt_bit)
+            bit_to_flip = (rng or random).randint(start_of_corruptible_bits, max_corrupt_bit)
             original_bit = bitstream[bit_to_flip]
             bitstream[bit_to_flip] = 1 - bitstream[bit_to_flip] 
             self.bit_flipped = [bit_to_flip, original_bit]
@@ -188,7 +194,7 @@ class CANMessage:
         else:
             print("No valid position for bit corruption found or bitstream too short.")
 
-    def corrupt_stuff(self):
+    def corrupt_stuff(self, rng=None):
         bitstream = self.get_bitstream()[:] 
         identifier_length = 1 + 11 
         start_of_corruptible_bits = identifier_length + 1 + 6 
@@ -196,7 +202,7 @@ class CANMessage:
         self.error_type = "stuff_error"
 
         bytes_in_data = len(self.data_field)
-        random_byte = random.randint(0, bytes_in_data - 1)
+        random_byte = (rng or random).randint(0, bytes_in_data - 1)
         self.data_field[random_byte] = 63
 
         i = 1
@@ -211,20 +217,16 @@ class CANMessage:
 
         self.transmitted_bitstream = self.get_bitstream().copy()
 
-    def corrupt_crc(self):
+    def corrupt_crc(self, rng=None):
         self.crc ^= 0x1  
         self.error_type = "crc_error"
         self.error_bit_index = len(self.get_bitstream()) - 14
         print(f"CRC error injected by flipping bit at index {self.error_bit_index}.")
 
-        bitstream = self.get_bitstream()
-        if len(bitstream) >= self.error_bit_index +1:
-            bitstream[self.error_bit_index] = 1 - bitstream[self.error_bit_index]
-            self.transmitted_bitstream = bitstream.copy()
-        else:
-            print("Bitstream too short to inject CRC error.")
+        # the flipped CRC is already in the bitstream (flipping the wire bit again would restore it)
+        self.transmitted_bitstream = self.get_bitstream()
 
-    def corrupt_ack(self):
+    def corrupt_ack(self, rng=None):
         self.ack_slot = 1
         self.error_bit_index = self.get_ack_index()
         self.error_type = "ack_error"
@@ -233,11 +235,13 @@ class CANMessage:
         bitstream = self.get_bitstream()
         if len(bitstream) > self.error_bit_index:
             bitstream[self.error_bit_index] = 1
+            # the slot stays recessive on the wire instead of the receivers' dominant ACK
+            self.bit_flipped = [self.error_bit_index, 0]
             self.transmitted_bitstream = bitstream.copy()
         else:
             print("Bitstream too short to inject ACK error.")
 
-    def corrupt_form(self):
+    def corrupt_form(self, rng=None):
         self.end_of_frame = [0] * 7  
         self.error_type = "form_error"
         self.error_bit_index = len(self.get_bitstream()) - 10
@@ -260,13 +264,31 @@ class CANMessage:
     def get_bitstream_length(self):
         return len(self.get_bitstream())
 
+def copy_attributes(attrs):
+    # frame attributes are scalars or flat lists/dicts of scalars, but frames change
+    # their lists in place (error injection), so those are copied
+    return {key: value.copy() if isinstance(value, (list, dict)) else value for key, value in attrs.items()}
+
+def frame_state(msg):
+    """Plain-data copy of a frame (class + attribute copy), used by snapshots and replay."""
+    return (type(msg), copy_attributes(msg.__dict__))
+
+def frame_from_state(state):
+    cls, attrs = state
+    msg = cls.__new__(cls)
+    msg.__dict__.update(copy_attributes(attrs))
+    return msg
+
 class DataFrame(CANMessage):
     def __init__(self, identifier, sent_by, data):
         super().__init__(identifier, sent_by, data, frame_type="Data")
 
 class RemoteFrame(CANMessage):
-    def __init__(self, identifier, sent_by):
-        super().__init__(identifier, sent_by, data=None, frame_type="Remote")
+    def __init__(self, identifier, sent_by, rng=None, dlc=None):
+        super().__init__(identifier, sent_by, data=None, frame_type="Remote", rng=rng, dlc=dlc)
+
+    def dlc(self):
+        return int(self.control_field[:4], 2)
 
 class ErrorFrame(CANMessage):
     def __init__(self, sent_by):
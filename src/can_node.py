@@ -1,6 +1,6 @@
 from can_message import DataFrame, ErrorFrame, RemoteFrame, OverloadFrame
 from can_error_handler import CANErrorHandler
-import time
+from can_ratelimit import RateLimiter, DEFER
 import random
 
 TRANSMITTING = "transmitting"
@@ -27,6 +27,9 @@ class CANNode:
         self.current_bit_index = 0
         self.node_comp = node_comp
         self.error_detected = False
+        self.overload_pending = 0  # overload frames requested for the next interframe space
+        self.rate_limiter = None
+        self.response_handlers = {}  # identifier -> (handler, dlc), answers remote frames
 
         self.error_handler = CANErrorHandler()
 
@@ -36,12 +39,90 @@ class CANNode:
     def has_pending_message(self):
         return len(self.message_queue) > 0
 
+    def set_rate_limit(self, interval=None, burst=1, per_id=None, policy=DEFER):
+        """
+        Token-bucket limit in simulated time (interval defaults to message_interval),
+        see can_ratelimit.RateLimiter. Set rate_limiter to None to remove it.
+        """
+        self.rate_limiter = RateLimiter(self.message_interval if interval is None else interval,
+                                        burst, per_id, policy)
+        return self.rate_limiter
+
+    def set_response_handler(self, identifier, handler, dlc=None):
+        """
+        Answers remote frames for `identifier`: handler(node, remote_frame) returns the
+        payload bytes, which are sent back as a data frame. With `dlc` the payload is
+        cut or zero-padded to dlc bytes and requesters send that DLC in their remote
+        frames. handler=None removes the handler.
+        """
+        if handler is None:
+            self.response_handlers.pop(identifier, None)
+        else:
+            self.response_handlers[identifier] = (handler, dlc)
+
+    def respond_to_remote(self, message):
+        """Queues the data frame answering a received remote frame, if there is a handler for its ID."""
+        entry = self.response_handlers.get(message.identifier)
+        if entry is None or self.state == BUS_OFF:
+            return None
+        handler, dlc = entry
+        data = list(handler(self, message) or [])
+        if dlc is not None:
+            data = (data + [0] * dlc)[:dlc]
+        response = DataFrame(message.identifier, self.node_id, data[:8])
+        print(f"Node {self.node_id} => answering remote frame {message.identifier} with {len(response.data_field)} bytes.")
+        self.add_message_to_queue(response)
+        return response
+
+    def admit_frame(self, message):
+        if self.rate_limiter is None or self.bus is None:
+            return True
+        if self.rate_limiter.admit(message, self.bus.bit_time, self.bus.bitrate):
+            return True
+        print(f"Node {self.node_id} => rate limit, frame {message.identifier} dropped.")
+        return False
+
+    def ready_to_transmit(self):
+        """
+        Whether a queued frame may enter arbitration now (rate limiter with the defer
+        policy). The first frame that may is moved to the front, so a deferred frame
+        does not hold back the frames queued behind it.
+        """
+        if self.rate_limiter is None:
+            return True
+        for i, msg in enumerate(self.message_queue):
+            if self.rate_limiter.ready(msg, self.bus.bit_time, self.bus.bitrate):
+                if i:
+                    self.message_queue.insert(0, self.message_queue.pop(i))
+                return True
+        return False
+
+    def record_transmission(self, message):
+        self.last_transmission_time = self.bus.bit_time / self.bus.bitrate
+        if self.rate_limiter is not None:
+            self.rate_limiter.transmitted(message, self.bus.bit_time, self.bus.bitrate)
+
     def add_message_to_queue(self, message):
+        """Queues a frame; False if the rate limiter dropped it."""
+        if not self.admit_frame(message):
+            return False
         self.message_queue.append(message)
         self.reorder_message_queue()
+        self.notify_queued(message)
+        return True
+
+    def notify_queued(self, message):
+        # frames queued while the bus steps (remote-frame answers, ...) are not inputs from outside
+        if self.bus is not None and self.bus.listeners:
+            self.bus.notify("frame_generated" if self.bus.stepping else "frame_queued", self, message)
 
     def reorder_message_queue(self):
-        self.message_queue.sort(key=lambda x: x.identifier)
+        # error/overload frames (no identifier) stay in front; a frame already on the bus keeps its place
+        first = 0
+        if self.bus is not None and (self.bus.current_winner is self or self in self.bus.arbitration_contenders):
+            first = 1
+        self.message_queue[first:] = sorted(self.message_queue[first:],
+                                            key=lambda x: -1 if x.identifier is None else x.identifier)
 
     def set_component(self, node_comp):
         self.node_comp = node_comp
@@ -59,11 +140,13 @@ class CANNode:
             print(f"Node {self.node_id} is in BUS_OFF state and cannot transmit.")
             return
 
+        rng = self.bus.stimulus_rng if self.bus is not None else random
         frame_type_lower = frame_type.lower()
         if frame_type_lower == "data":
             msg = DataFrame(message_id, self.node_id, data)
         elif frame_type_lower == "remote":
-            msg = RemoteFrame(message_id, self.node_id)
+            dlc = self.bus.response_dlc(message_id) if self.bus is not None else None
+            msg = RemoteFrame(message_id, self.node_id, rng=rng, dlc=dlc)
         elif frame_type_lower == "error":
             msg = ErrorFrame(sent_by=self.node_id)
         elif frame_type_lower == "overload":
@@ -74,14 +157,22 @@ class CANNode:
 
         if error_type:
             print(f"Injecting {error_type} error into message.")
-            self.error_handler.inject_error(error_type, msg)
-        elif interactive and random.random() < 0.1:
-            random_err = random.choice(["bit_error","stuff_error","crc_error","ack_error","form_error"])
+            self.error_handler.inject_error(error_type, msg, rng)
+        elif interactive and rng.random() < 0.1:
+            random_err = rng.choice(["bit_error","stuff_error","crc_error","ack_error","form_error"])
             print(f"Randomly injecting {random_err} error into message.")
-            self.error_handler.inject_error(random_err, msg)
+            self.error_handler.inject_error(random_err, msg, rng)
+
+        self.enqueue_frame(msg)
 
+    def enqueue_frame(self, msg):
+        """Puts a frame built by send_message into the transmit queue."""
+        if not self.admit_frame(msg):
+            return False
         self.message_queue.append(msg)
         self.mode = TRANSMITTING
+        self.notify_queued(msg)
+        return True
 
     def transmit_bit(self):
         if self.state == BUS_OFF:
@@ -94,17 +185,6 @@ class CANNode:
         bs = msg.get_bitstream()
         if self.current_bit_index < len(bs):
             transmitted_bit = bs[self.current_bit_index]
-            # Check for forced bit_error
-            if (self.mode == TRANSMITTING 
-                and not self.bus.in_arbitration
-                and msg.error_type == "bit_error"
-                and self.current_bit_index == msg.error_bit_index + 1):
-                print(f"Node {self.node_id}: forced bit_error at bit {self.current_bit_index}")
-                self.bus.broadcast_error_frame("bit_error", msg)
-                self.stop_transmitting()
-                self.current_bit_index = 0
-                return None
-
             self.current_bit_index += 1
             return transmitted_bit
         return None
@@ -139,31 +219,15 @@ class CANNode:
         print(f"Node {self.node_id} => sent an ACK bit.")
         return True
 
-    def process_received_bit(self, message, winner_node):
+    def process_received_bit(self, message, winner_node, level):
+        """Runs the receive checks on the bus level; returns the detected error type or None."""
         if self.state == BUS_OFF:
-            return True
-        if self.mode != RECEIVING:
-            return True
-
-        current_bit_index = winner_node.current_bit_index - 1
-        if message.error_type == "ack_error" and current_bit_index == message.error_bit_index + 1:
-            print(f"Node {self.node_id} => detected ack_error at bit {current_bit_index}")
-            self.bus.broadcast_error_frame("ack_error", message)
-            return False
-        if message.error_type == "stuff_error" and current_bit_index == message.error_bit_index + 1:
-            print(f"Node {self.node_id} => detected stuff_error at bit {current_bit_index}")
-            self.bus.broadcast_error_frame("stuff_error", message)
-            return False
-        if message.error_type == "crc_error" and current_bit_index == message.error_bit_index + 1:
-            print(f"Node {self.node_id} => detected crc_error at bit {current_bit_index}")
-            self.bus.broadcast_error_frame("crc_error", message)
-            return False
-        if message.error_type == "form_error" and current_bit_index == message.error_bit_index + 1:
-            print(f"Node {self.node_id} => detected form_error at bit {current_bit_index}")
-            self.bus.broadcast_error_frame("form_error", message)
-            return False
-
-        return True
+            return None
+        error_type = self.error_handler.receive_bit(level)
+        if error_type is None or self.mode != RECEIVING:
+            return None
+        print(f"Node {self.node_id} => detected {error_type} at bit {winner_node.current_bit_index - 1}")
+        return error_type
 
     def detect_and_handle_error(self, message):
         if self.error_handler.detect_error(message.error_type, message):
@@ -171,8 +235,17 @@ class CANNode:
             return True
         return False
 
-    def handle_overload_frame(self):
-        time.sleep(0.1)
+    def handle_overload_frame(self, count=1):
+        """
+        Requests overload delay: the bus sends an overload frame (flag + delimiter) after
+        the current frame instead of blocking, see CANBus.max_consecutive_overloads.
+        Requests beyond that limit are counted in bus.overload_requests_dropped.
+        """
+        limit = self.bus.max_consecutive_overloads if self.bus is not None else count
+        requested = self.overload_pending + count
+        self.overload_pending = min(requested, limit)
+        if self.bus is not None:
+            self.bus.overload_requests_dropped += requested - self.overload_pending
 
     def handle_error_frame(self, error_type):
         if self.state == BUS_OFF:
@@ -231,9 +304,33 @@ class CANNode:
                 print(f"Node {self.node_id} => enters ERROR_ACTIVE state.")
             self.state = ERROR_ACTIVE
 
+    def snapshot_state(self, frame_index):
+        """
+        Plain-data copy of the node. Frames are replaced by their index in the
+        snapshot's frame table; configuration lists (produced_ids, filters) are
+        shared, they are only ever replaced, never modified in place.
+        """
+        state = {k: v for k, v in self.__dict__.items() if k not in ("bus", "error_handler", "message_queue")}
+        state["message_queue"] = [frame_index(msg) for msg in self.message_queue]
+        state["error_handler"] = dict(self.error_handler.__dict__)
+        if self.rate_limiter is not None:
+            state["rate_limiter"] = self.rate_limiter.copy()
+        return state
+
+    def restore_state(self, state, frames):
+        for key, value in state.items():
+            if key not in ("message_queue", "error_handler", "rate_limiter"):
+                setattr(self, key, value)
+        self.rate_limiter = state["rate_limiter"].copy() if state.get("rate_limiter") is not None else None
+        if "error_handler" in state:
+            self.error_handler.__dict__.update(state["error_handler"])
+        self.message_queue = [frames[i] for i in state["message_queue"]]
+
     def reset_node(self):
         self.transmit_error_counter = 0
         self.receive_error_counter = 0
         self.state = ERROR_ACTIVE
         self.mode = WAITING
         self.current_bit_index = 0
+        self.overload_pending = 0
+        self.error_handler.start_frame()
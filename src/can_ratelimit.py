@@ -0,0 +1,94 @@
+import copy
+import math
+
+DEFER = "defer"
+DROP = "drop"
+
+
+class RateLimiter:
+    """
+    Token buckets in simulated time for one node: one for the whole node (`interval`
+    seconds per frame, None = unlimited) and optionally one per identifier
+    (per_id: {identifier: interval in seconds}). Every bucket holds up to `burst`
+    tokens and gains one token per interval; a frame needs a token in each of its buckets.
+
+    policy "defer": frames stay queued and enter arbitration only once their buckets
+    hold a token, the token is spent when the frame went through (traffic shaping).
+    policy "drop": the token is spent when the frame is queued, frames queued
+    without a token are discarded (policing).
+    Error and overload frames are never limited.
+    """
+
+    def __init__(self, interval, burst=1, per_id=None, policy=DEFER):
+        if policy not in (DEFER, DROP):
+            raise ValueError(f"Unknown rate limit policy {policy!r}")
+        self.interval = interval
+        self.burst = burst
+        self.per_id = dict(per_id) if per_id else {}
+        self.policy = policy
+        self.buckets = {}  # None (node) or identifier -> [tokens, bit_time of the last update]
+        self.passed = 0
+        self.shaped = 0   # frames that had to wait for a token
+        self.dropped = 0
+        self.waiting = set()  # identifiers counted in shaped, until a frame of theirs went through
+
+    def limits(self, identifier):
+        if self.interval:
+            yield None, self.interval
+        interval = self.per_id.get(identifier)
+        if interval:
+            yield identifier, interval
+
+    def tokens(self, key, interval, now, bitrate):
+        tokens, last = self.buckets.get(key, (self.burst, now))
+        return min(self.burst, tokens + (now - last) / (interval * bitrate))
+
+    def conforms(self, msg, now, bitrate):
+        return all(self.tokens(key, interval, now, bitrate) >= 1
+                   for key, interval in self.limits(msg.identifier))
+
+    def consume(self, msg, now, bitrate):
+        for key, interval in self.limits(msg.identifier):
+            self.buckets[key] = [self.tokens(key, interval, now, bitrate) - 1, now]
+
+    def admit(self, msg, now, bitrate):
+        """Enqueue check: False if the frame has to be dropped."""
+        if self.policy != DROP or msg.identifier is None:
+            return True
+        if not self.conforms(msg, now, bitrate):
+            self.dropped += 1
+            return False
+        self.consume(msg, now, bitrate)
+        self.passed += 1
+        return True
+
+    def ready(self, msg, now, bitrate):
+        """Arbitration entry check for a queued frame."""
+        if self.policy != DEFER or msg.identifier is None or self.conforms(msg, now, bitrate):
+            return True
+        if msg.identifier not in self.waiting:
+            self.waiting.add(msg.identifier)
+            self.shaped += 1
+        return False
+
+    def transmitted(self, msg, now, bitrate):
+        if self.policy != DEFER or msg.identifier is None:
+            return
+        self.consume(msg, now, bitrate)
+        self.passed += 1
+        self.waiting.discard(msg.identifier)
+
+    def next_token_time(self, msg, now, bitrate):
+        """bit_time at which msg conforms again (now if it already does)."""
+        due = now
+        for key, interval in self.limits(msg.identifier):
+            missing = 1 - self.tokens(key, interval, now, bitrate)
+            if missing > 0:
+                due = max(due, now + math.ceil(missing * interval * bitrate))
+        return due
+
+    def stats(self):
+        return {"passed": self.passed, "shaped": self.shaped, "dropped": self.dropped}
+
+    def copy(self):
+        return copy.deepcopy(self)
@@ -0,0 +1,108 @@
+import math
+import time
+
+
+class RealTimeRunner:
+    """
+    Advances a CANBus so that bus.bit_time follows the wall clock at bus.bitrate.
+
+    Every wake-up runs all bits that became due since the last one, so pacing does
+    not depend on how often we get scheduled. Due bits are computed from the start
+    time (absolute schedule) instead of summing sleeps, which keeps the simulation
+    from drifting. When the simulation cannot keep up, the lag is reported through
+    `on_behind(lag_bits, lag_seconds)` and, past `max_lag` seconds, the schedule is
+    re-anchored so the runner does not try to catch up a backlog forever.
+    `step` is what one bit costs (bus.simulate_step unless given, e.g. a step that
+    also injects stimulus); it must advance bus.bit_time by one.
+    """
+
+    def __init__(self, bus, bitrate=None, wake_interval=0.001, max_batch_bits=None,
+                 max_lag=0.5, on_behind=None, clock=time.perf_counter, sleep=time.sleep, step=None):
+        self.bus = bus
+        self.bitrate = bitrate if bitrate else bus.bitrate
+        self.wake_interval = wake_interval
+        self.max_batch_bits = max_batch_bits
+        self.max_lag = max_lag
+        self.on_behind = on_behind
+        self.clock = clock
+        self.sleep = sleep
+        self.step = step if step is not None else bus.simulate_step
+
+        self.running = False
+        self.start_time = None
+        self.start_bit = 0
+        self.wakeups = 0
+        self.behind_count = 0
+        self.resync_count = 0
+        self.lag_bits = 0
+        self.max_lag_bits = 0
+
+    def start(self):
+        self.start_time = self.clock()
+        self.start_bit = self.bus.bit_time
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def due_bit(self, now=None):
+        now = self.clock() if now is None else now
+        return self.start_bit + math.floor((now - self.start_time) * self.bitrate)
+
+    def poll(self):
+        """Runs the bits due right now; returns how many bits were simulated."""
+        if self.start_time is None:
+            self.start()
+        self.wakeups += 1
+        due = self.due_bit()
+        todo = due - self.bus.bit_time
+        if self.max_batch_bits is not None:
+            todo = min(todo, self.max_batch_bits)
+        for _ in range(max(0, todo)):
+            self.step()
+
+        due = self.due_bit()
+        self.lag_bits = max(0, due - self.bus.bit_time)
+        if self.lag_bits > 1:
+            self.behind_count += 1
+            self.max_lag_bits = max(self.max_lag_bits, self.lag_bits)
+            lag_seconds = self.lag_bits / self.bitrate
+            if self.on_behind:
+                self.on_behind(self.lag_bits, lag_seconds)
+            if self.max_lag is not None and lag_seconds > self.max_lag:
+                print(f"Real-time runner is {lag_seconds:.3f}s behind => resynchronizing.")
+                self.resync_count += 1
+                self.start()
+        return max(0, todo)
+
+    def run(self, duration=None, until_bit=None):
+        """Blocks and paces the bus until stop(), `duration` seconds or bus.bit_time >= until_bit."""
+        if self.start_time is None or not self.running:
+            self.start()
+        end_time = self.start_time + duration if duration is not None else None
+        next_wake = self.clock()
+        while self.running:
+            self.poll()
+            if until_bit is not None and self.bus.bit_time >= until_bit:
+                break
+            now = self.clock()
+            if end_time is not None and now >= end_time:
+                break
+            # wake-ups stay on a fixed grid, a late wake-up shortens the next sleep
+            next_wake += self.wake_interval
+            if next_wake < now:
+                next_wake = now
+            self.sleep(next_wake - now)
+        self.running = False
+
+    def stats(self):
+        elapsed = (self.clock() - self.start_time) if self.start_time is not None else 0
+        return {
+            "bit_time": self.bus.bit_time,
+            "elapsed": elapsed,
+            "wakeups": self.wakeups,
+            "lag_bits": self.lag_bits,
+            "max_lag_bits": self.max_lag_bits,
+            "behind_count": self.behind_count,
+            "resync_count": self.resync_count,
+        }
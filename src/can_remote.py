@@ -0,0 +1,62 @@
+from can_histogram import LatencyHistogram
+
+
+class RemoteRequestTracker:
+    """
+    Request-to-response latency of remote frames, kept by CANBus.remote_requests.
+    A remote frame that went through opens a request for its identifier; the next
+    data frame with that identifier that goes through answers every open request
+    for it. Latency is counted in bit times from the end of the remote frame to
+    the end of the data frame, overall and per identifier. Like BitAccounting
+    this is a measurement and not part of bus snapshots.
+    """
+
+    def __init__(self, bin_width=50):
+        self.bin_width = bin_width
+        self.reset()
+
+    def reset(self):
+        self.pending = {}  # identifier -> [(bit_time, requesting node id), ...]
+        self.histogram = LatencyHistogram(self.bin_width)
+        self.by_id = {}    # identifier -> LatencyHistogram
+        self.requests = 0
+        self.responses = 0
+        self.latency_sum = 0
+        self.latency_max = 0
+
+    def request(self, msg, bit_time):
+        self.requests += 1
+        self.pending.setdefault(msg.identifier, []).append((bit_time, msg.sender_id))
+
+    def response(self, msg, bit_time):
+        """Closes the requests a data frame answers; returns their latencies."""
+        waiting = self.pending.pop(msg.identifier, None)
+        if not waiting:
+            return []
+        latencies = [bit_time - start for start, _ in waiting]
+        hist = self.by_id.setdefault(msg.identifier, LatencyHistogram(self.bin_width))
+        for latency in latencies:
+            self.histogram.add(latency)
+            hist.add(latency)
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+        self.responses += len(latencies)
+        return latencies
+
+    def unanswered(self):
+        return sum(len(waiting) for waiting in self.pending.values())
+
+    def summary(self):
+        mean = self.latency_sum / self.responses if self.responses else 0.0
+        return {
+            "requests": self.requests,
+            "responses": self.responses,
+            "unanswered": self.unanswered(),
+            "latency_mean": mean,
+            "latency_max": self.latency_max,
+            "latency_p50": self.histogram.quantile(0.5),
+            "latency_p99": self.histogram.quantile(0.99),
+            "by_id": {ident: {"responses": h.total(), "latency_p50": h.quantile(0.5),
+                              "latency_p99": h.quantile(0.99)}
+                      for ident, h in sorted(self.by_id.items())},
+        }
@@ -0,0 +1,117 @@
+import bisect
+
+from can_message import frame_state, frame_from_state
+
+QUEUES = ("message_queue", "host_queue")  # where a queued frame can be (host_queue: ControllerNode)
+
+
+class ReplaySession:
+    """
+    Deterministic record/replay for a CANBus with automatic checkpoints.
+
+    Every frame queued from outside (send_message / add_message_to_queue) is
+    recorded with the bit_time it was queued at, the queue it went to (the transmit
+    queue, or the host queue of a ControllerNode) with its position there, and the
+    node's mode afterwards. Frames the simulation queues itself while stepping
+    ("frame_generated", e.g. remote-frame answers) are not inputs: replay produces
+    them again. A snapshot is taken every `checkpoint_interval`
+    bits while stepping through the session, so seek(bit) restores the nearest
+    earlier checkpoint and replays at most `checkpoint_interval` bits.
+
+    Determinism relies on all randomness going through bus.rng / bus.stimulus_rng.
+    Direct edits of node attributes (e.g. forcing a TEC value) are not recorded.
+    """
+
+    def __init__(self, bus, checkpoint_interval=1000):
+        self.bus = bus
+        self.checkpoint_interval = checkpoint_interval
+        self.input_times = []
+        self.inputs = []  # (bit_time, node_index, queue_name, queue_position, frame_state, mode)
+        self.checkpoint_times = []
+        self.checkpoints = []
+        self.head = bus.bit_time
+        self.start = bus.bit_time
+        self.replaying = False
+
+        self.add_checkpoint()
+        bus.add_listener(self.on_bus_event)
+
+    def close(self):
+        self.bus.remove_listener(self.on_bus_event)
+
+    def on_bus_event(self, event, *args):
+        if event != "frame_queued" or self.replaying:
+            return
+        node, msg = args
+        now = self.bus.bit_time
+        if now < self.head:
+            self.truncate(now)
+        for queue_name in QUEUES:
+            queue = getattr(node, queue_name, ())
+            position = next((i for i, m in enumerate(queue) if m is msg), None)
+            if position is not None:
+                break
+        else:
+            return
+        record = (now, self.bus.nodes.index(node), queue_name, position, frame_state(msg), node.mode)
+        idx = bisect.bisect_right(self.input_times, now)
+        self.input_times.insert(idx, now)
+        self.inputs.insert(idx, record)
+
+    def truncate(self, bit_time):
+        """Forgets recorded inputs and checkpoints after bit_time (a new branch starts there)."""
+        del_inputs = bisect.bisect_right(self.input_times, bit_time)
+        del self.input_times[del_inputs:]
+        del self.inputs[del_inputs:]
+        del_checkpoints = bisect.bisect_right(self.checkpoint_times, bit_time)
+        del self.checkpoint_times[del_checkpoints:]
+        del self.checkpoints[del_checkpoints:]
+        self.head = bit_time
+
+    def add_checkpoint(self):
+        now = self.bus.bit_time
+        idx = bisect.bisect_left(self.checkpoint_times, now)
+        if idx < len(self.checkpoint_times) and self.checkpoint_times[idx] == now:
+            return
+        self.checkpoint_times.insert(idx, now)
+        self.checkpoints.insert(idx, self.bus.snapshot())
+
+    def apply_inputs(self, bit_time):
+        lo = bisect.bisect_left(self.input_times, bit_time)
+        hi = bisect.bisect_right(self.input_times, bit_time)
+        if lo == hi:
+            return
+        self.replaying = True
+        try:
+            for (_, node_index, queue_name, position, state, mode) in self.inputs[lo:hi]:
+                node = self.bus.nodes[node_index]
+                getattr(node, queue_name).insert(position, frame_from_state(state))
+                node.mode = mode
+        finally:
+            self.replaying = False
+
+    def step(self, bits=1):
+        """Advances the bus, re-applying recorded inputs when stepping through already recorded history."""
+        for _ in range(bits):
+            self.bus.simulate_step()
+            now = self.bus.bit_time
+            # checkpoints are taken before the inputs of their bit, seek() re-applies them
+            if (now - self.start) % self.checkpoint_interval == 0:
+                self.add_checkpoint()
+            if now <= self.head:
+                self.apply_inputs(now)
+            else:
+                self.head = now
+
+    def seek(self, bit_time):
+        """Puts the bus in the state it had at bit_time (after the inputs queued at that bit)."""
+        if bit_time < self.start or bit_time > self.head:
+            raise ValueError(f"bit_time {bit_time} outside recorded range [{self.start}, {self.head}]")
+        idx = bisect.bisect_right(self.checkpoint_times, bit_time) - 1
+        self.bus.restore(self.checkpoints[idx])
+        self.apply_inputs(self.checkpoint_times[idx])
+        while self.bus.bit_time < bit_time:
+            self.bus.simulate_step()
+            if (self.bus.bit_time - self.start) % self.checkpoint_interval == 0:
+                self.add_checkpoint()
+            self.apply_inputs(self.bus.bit_time)
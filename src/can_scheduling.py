@@ -0,0 +1,217 @@
+import math
+import os
+from contextlib import nullcontext, redirect_stdout
+
+from can_message import DataFrame
+from can_node import BUS_OFF
+
+# all times in this module are in bit times, the same unit as one CANBus.simulate_step()
+FRAME_OVERHEAD_BITS = 1 + 11 + 1 + 6 + 15 + 1 + 1 + 1 + 7 + 3  # SOF ... intermission
+STUFFABLE_OVERHEAD_BITS = 11 + 1 + 6 + 15  # identifier..crc, see CANMessage.get_bitstream
+
+
+def frame_bits(dlc, worst_case=True):
+    """
+    Length in bits of a data frame with `dlc` bytes, as built by CANMessage.
+    With worst_case the maximum number of stuff bits is added.
+    """
+    bits = FRAME_OVERHEAD_BITS + 8 * dlc
+    if worst_case:
+        bits += (STUFFABLE_OVERHEAD_BITS + 8 * dlc - 1) // 4
+    return bits
+
+
+class MessageSpec:
+    def __init__(self, name, node_id, period, deadline=None, dlc=8, jitter=0):
+        self.name = name
+        self.node_id = node_id
+        self.period = period
+        self.deadline = deadline if deadline is not None else period
+        self.dlc = dlc
+        self.jitter = jitter
+        self.transmission_time = frame_bits(dlc)
+
+    def __repr__(self):
+        return (f"MessageSpec(name={self.name}, node={self.node_id}, period={self.period}, "
+                f"deadline={self.deadline}, dlc={self.dlc})")
+
+
+def response_time(spec, higher, lower, limit=None):
+    """
+    Worst-case response time of `spec` given the sets of higher and lower priority
+    messages (revised CAN schedulability analysis, Davis et al. 2007).
+    The result only depends on the two sets, not on the order inside them, which is
+    what makes Audsley's priority assignment applicable.
+    Returns None if the load is >= 100% or as soon as the response time exceeds `limit`.
+    """
+    c_m = spec.transmission_time
+    blocking = max((lp.transmission_time for lp in lower), default=0)
+    hp = [(h.period, h.jitter, h.transmission_time) for h in higher]
+
+    if c_m / spec.period + sum(c / t for (t, _, c) in hp) >= 1:
+        return None  # busy period never ends
+
+    # length of the level-m busy period
+    busy = c_m
+    while True:
+        nxt = blocking + sum(math.ceil((busy + j) / t) * c for (t, j, c) in hp)
+        nxt += math.ceil((busy + spec.jitter) / spec.period) * c_m
+        if nxt == busy:
+            break
+        busy = nxt
+
+    instances = math.ceil((busy + spec.jitter) / spec.period)
+    worst = 0
+    w = blocking
+    for q in range(instances):
+        w = max(w, blocking + q * c_m)
+        while True:
+            nxt = blocking + q * c_m + sum(math.ceil((w + j + 1) / t) * c for (t, j, c) in hp)
+            if nxt == w:
+                break
+            w = nxt
+            if limit is not None and spec.jitter + w - q * spec.period + c_m > limit:
+                return None
+        worst = max(worst, spec.jitter + w - q * spec.period + c_m)
+    return worst
+
+
+def audsley_assign(specs, margin=0):
+    """
+    Audsley's optimal priority assignment. Fills priority levels from the lowest
+    up; at each level the candidate with the largest slack is placed there.
+    A message is schedulable when its response time is <= deadline - margin.
+    Returns the specs ordered from highest to lowest priority, or None.
+    """
+    unassigned = list(specs)
+    lowest_first = []
+    while unassigned:
+        best = None
+        best_slack = None
+        for cand in unassigned:
+            higher = [s for s in unassigned if s is not cand]
+            limit = cand.deadline - margin
+            r = response_time(cand, higher, lowest_first, limit=limit)
+            if r is None or r > limit:
+                continue
+            slack = cand.deadline - r
+            if best is None or slack > best_slack:
+                best, best_slack = cand, slack
+        if best is None:
+            return None
+        unassigned.remove(best)
+        lowest_first.append(best)
+    lowest_first.reverse()
+    return lowest_first
+
+
+class PriorityAssignment:
+    def __init__(self, order, identifiers, response_times, margin):
+        self.order = order
+        self.identifiers = identifiers
+        self.response_times = response_times
+        self.margin = margin
+
+    def slack(self, spec):
+        return spec.deadline - self.response_times[spec.name]
+
+    def min_slack(self):
+        return min(self.slack(s) for s in self.order)
+
+    def ids_by_node(self):
+        by_node = {}
+        for spec in self.order:
+            by_node.setdefault(spec.node_id, []).append(self.identifiers[spec.name])
+        return by_node
+
+    def apply_to_bus(self, bus):
+        """Writes the assigned identifiers back as produced_ids of the bus nodes."""
+        by_node = self.ids_by_node()
+        for nd in bus.nodes:
+            if nd.node_id in by_node:
+                nd.produced_ids = sorted(by_node[nd.node_id])
+
+    def __repr__(self):
+        return f"PriorityAssignment(min_slack={self.min_slack()}, ids={self.identifiers})"
+
+
+def optimize_priorities(specs, id_pool=None):
+    """
+    Searches for the identifier assignment with the maximum minimum slack.
+    OPA is optimal for any fixed margin, so a binary search over the margin
+    finds the largest slack that can still be guaranteed for every message.
+    Returns a PriorityAssignment or None if the set is unschedulable.
+    """
+    specs = list(specs)
+    if len({s.name for s in specs}) != len(specs):
+        raise ValueError("MessageSpec names must be unique")
+    id_pool = sorted(id_pool) if id_pool is not None else list(range(len(specs)))
+    if len(id_pool) < len(specs):
+        raise ValueError(f"Need {len(specs)} identifiers, only {len(id_pool)} available")
+
+    order = audsley_assign(specs)
+    if order is None:
+        return None
+
+    lo, hi = 0, min(s.deadline for s in specs)
+    best_order, best_margin = order, 0
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        candidate = audsley_assign(specs, margin=mid)
+        if candidate is None:
+            hi = mid - 1
+        else:
+            lo = mid
+            best_order, best_margin = candidate, mid
+
+    identifiers = {}
+    response_times = {}
+    for level, spec in enumerate(best_order):
+        identifiers[spec.name] = id_pool[level]
+        response_times[spec.name] = response_time(spec, best_order[:level], best_order[level + 1:])
+    return PriorityAssignment(best_order, identifiers, response_times, best_margin)
+
+
+def verify_with_simulator(bus, specs, assignment, horizon, quiet=True):
+    """
+    Runs periodic traffic for `horizon` bit times on the frame-level simulator
+    using the assigned identifiers and returns {name: worst observed response time}.
+    Messages still queued past their deadline at the end of the run are reported as None.
+    """
+    nodes = {nd.node_id: nd for nd in bus.nodes}
+    next_release = {s.name: s.jitter for s in specs}
+    outstanding = []
+    observed = {s.name: 0 for s in specs}
+
+    sink = open(os.devnull, "w") if quiet else None
+    try:
+        with redirect_stdout(sink) if quiet else nullcontext():
+            for clock in range(horizon):
+                for spec in specs:
+                    if next_release[spec.name] != clock:
+                        continue
+                    next_release[spec.name] += spec.period
+                    node = nodes[spec.node_id]
+                    if node.state == BUS_OFF:
+                        continue
+                    msg = DataFrame(assignment.identifiers[spec.name], node.node_id, [0x55] * spec.dlc)
+                    node.add_message_to_queue(msg)
+                    outstanding.append((clock, spec, node, msg))
+
+                bus.simulate_step()
+
+                still = []
+                for (start, spec, node, msg) in outstanding:
+                    if any(m is msg for m in node.message_queue):
+                        still.append((start, spec, node, msg))
+                    else:
+                        observed[spec.name] = max(observed[spec.name], clock + 1 - start)
+                outstanding = still
+    finally:
+        if sink is not None:
+            sink.close()
+
+    for (start, spec, _, _) in outstanding:
+        if horizon - start > spec.deadline:
+            observed[spec.name] = None
+    return observed
@@ -3,17 +3,23 @@ from CTkMessagebox import CTkMessagebox
 from tkinter import HORIZONTAL, simpledialog
 import tkinter as tk
 from tkinter import ttk
-import random
-import time
 
 from can_bus import CANBus
 from can_node import CANNode, TRANSMITTING, RECEIVING, WAITING, BUS_OFF, ERROR_PASSIVE, ERROR_ACTIVE
 from can_message import CANMessage, DataFrame, RemoteFrame, ErrorFrame, OverloadFrame
+from can_engine import SimulationEngine
+from can_loghistory import LogHistory
+from can_bitformat import BitfieldFormatter, INTERMISSION
 
 LOW = "low"
 MEDIUM = "medium"
 HIGH = "high"
 
+FRAME_INTERVAL_MS = 33  # the playground redraws the newest engine view at ~30 fps
+# ms per bit: UP/DOWN move one step slower/faster, below 250 ms only during a node failure
+SPEED_STEPS = tuple(range(2500, 0, -250)) + (200, 150, 100, 50, 10, 1, 0.1, 0.05)
+FAST_SPEED = 0.05  # space: 20000 bit/s, the engine is not tied to the redraw rate
+
 COMPONENTS = {
     "Control Unit": {"id_range": (0, 511), "listens_to": ["Control Unit", "Sensors", "Actuators"]},
     "Power Supply Unit": {"id_range": (512, 1023), "listens_to": ["Control Unit", "Power Supply Unit", "Sensors"]},
@@ -72,8 +78,13 @@ class Playground(ctk.CTkFrame):
         self.max_nodes = 50
         self.schedule_times = []
 
-        self.clock_running = False
-        self.clock = 0
+        self.engine = SimulationEngine(self.bus, rate=1000, step=self.step_bus)
+        self.rendered_view = None
+        self.last_event_serial = 0
+        self.drawn_nodes = {}       # node_id -> (info text, frame fill, filter fill) on the canvas
+        self.drawn_transmitter = None
+        self.redraw_all = True      # canvas items were (re)created, draw every node
+        self.bitfields = BitfieldFormatter()
 
         self.stuff_in = {}
 
@@ -83,8 +94,6 @@ class Playground(ctk.CTkFrame):
         self.previous_frame_type = None
         self.previous_error_type = None
 
-        self.arbitration = "" 
-
         self.grid_columnconfigure(0, weight=1)
         self.grid_rowconfigure(0, weight=1)
 
@@ -118,40 +127,28 @@ class Playground(ctk.CTkFrame):
         self.app.bind("<Down>", lambda e: self.decrease_speed())
         self.app.bind("<space>", lambda e: self.small_clock())
 
-        self.speed = 1000
+        self.speed = 1000  # ms per bit
+        self.engine.set_rate(1000 / self.speed)
         self.after_id = None 
 
         self.node_failure_active = False 
 
     def increase_speed(self):
-        if self.speed < 2500:
-            self.speed += 250
-            print(f"{self.speed}")
+        step = SPEED_STEPS.index(self.speed)
+        if step > 0:
+            self.speed = SPEED_STEPS[step - 1]
             self.reschedule_clock()
 
     def decrease_speed(self):
-        if self.node_failure_active == False:
-            if self.speed > 250:
-                self.speed -= 250
-                print(f"{self.speed}")
-                self.reschedule_clock()
-        else:
-            if self.speed > 250:
-                self.speed -= 250
-                print(f"{self.speed}")
-                self.reschedule_clock()
-            elif (self.speed <= 250) and (self.speed > 50):
-                self.speed -= 50
-                print(f"{self.speed}")
-                self.reschedule_clock()
-            elif self.speed == 50:
-                self.speed = 10
-                print(f"{self.speed}")
-                self.reschedule_clock()
+        step = SPEED_STEPS.index(self.speed)
+        last = len(SPEED_STEPS) - 1 if self.node_failure_active else SPEED_STEPS.index(250)
+        if step < last:
+            self.speed = SPEED_STEPS[step + 1]
+            self.reschedule_clock()
 
     def small_clock(self):
         if self.aux:
-            self.speed = 1
+            self.speed = FAST_SPEED
             self.aux = False
         else:
             self.speed = 500
@@ -159,11 +156,28 @@ class Playground(ctk.CTkFrame):
         self.reschedule_clock()
 
     def reschedule_clock(self):
-        if self.after_id is not None:
-            self.after_cancel(self.after_id)
-            print(f"Rescheduling clock with new speed: {self.speed} ms")
-        if self.clock_running:
-            self.after_id = self.after(self.speed, self.update_clock)
+        print(f"Rescheduling clock with new speed: {self.speed} ms ({1000 / self.speed:g} bit/s)")
+        self.engine.set_rate(1000 / self.speed)
+
+    @property
+    def clock(self):
+        return self.engine.clock
+
+    @clock.setter
+    def clock(self, value):
+        with self.engine.lock:
+            self.engine.clock = value
+
+    @property
+    def clock_running(self):
+        return self.engine.running
+
+    @clock_running.setter
+    def clock_running(self, running):
+        if running:
+            self.engine.resume()
+        else:
+            self.engine.pause()
 
     def add_node(self, node_id=None, position=None, component_name=None):
         if len(self.nodes) >= self.max_nodes:
@@ -186,17 +200,18 @@ class Playground(ctk.CTkFrame):
         node.transmit_error_counter = 0
         node.receive_error_counter = 0
 
-        self.nodes[node_id] = node
-        self.node_positions[node_id] = position
-        self.next_node_id += 1
+        with self.engine.lock:
+            self.nodes[node_id] = node
+            self.node_positions[node_id] = position
+            self.next_node_id += 1
 
-        if component_name:
-            self.assign_node_to_component(node_id, component_name)
-        else:
-            node.produced_ids = list(range(0, 2048))
-            node.filters = list(range(0, 2048))
+            if component_name:
+                self.assign_node_to_component(node_id, component_name)
+            else:
+                node.produced_ids = list(range(0, 2048))
+                node.filters = list(range(0, 2048))
 
-        self.bus.connect_node(node)
+            self.bus.connect_node(node)
         self.draw_nodes()
         self.adjust_canvas_and_bus()
 
@@ -247,6 +262,8 @@ class Playground(ctk.CTkFrame):
         for label in self.node_info_labels.values():
             self.canvas.delete(label)
         self.node_info_labels.clear()
+        self.drawn_nodes.clear()
+        self.redraw_all = True
 
         for node_id, (x, y) in self.node_positions.items():
             node_width = 100
@@ -330,392 +347,326 @@ class Playground(ctk.CTkFrame):
         node = self.nodes.get(node_id)
         return getattr(node, "component", "None")
 
-    def update_node_info(self, node_id):
+    def update_node_info(self, node_id, view=None):
         if node_id not in self.nodes or node_id not in self.node_info_labels:
             return
+        if view is None:
+            # e.g. a scenario changed a node by hand: take a fresh view and draw it
+            self.render(self.engine.refresh())
+            return
+        for nv in view.nodes:
+            if nv.node_id == node_id:
+                self.draw_node_state(nv, self.transmitter(view))
+
+    def transmitter(self, view):
+        """The first transmitting node with a frame, the one the node panels show."""
+        for nv in view.nodes:
+            if nv.mode == TRANSMITTING and nv.head is not None:
+                return nv
+        return None
+
+    def transmitter_key(self, tx):
+        # what the receivers' filter colour depends on
+        if tx is None:
+            return None
+        return (tx.node_id, tx.head.identifier, tx.head.frame_class,
+                tx.bit_index <= tx.head.sections.get("rtr_start", 0))
 
-        node = self.nodes[node_id]
-        comp_name = self.get_component_name(node_id)
-
-        #delete old info text
-        #self.canvas.delete(self.node_info_labels[node_id])
-
+    def node_fills(self, node, tx):
+        """(frame fill, filter fill) of a node panel; None leaves the current fill."""
+        if node.state == BUS_OFF:
+            return "#400000", "#400000"
+        if node.mode == TRANSMITTING:
+            return "green", "grey30"
+        if node.mode == RECEIVING:
+            if tx is None:
+                return "grey30", None
+            msg = tx.head
+            if issubclass(msg.frame_class, (OverloadFrame, ErrorFrame)):
+                return "grey30", "green"
+            if tx.bit_index <= msg.sections["rtr_start"]:
+                return "grey30", "#f5c71a"
+            if msg.identifier in self.nodes[node.node_id].filters:
+                return "grey30", "green"
+            return "grey30", "red"
+        return "grey30", "grey30"
+
+    def draw_node_state(self, node, tx):
+        """Updates the canvas items of a node panel whose value differs from what is drawn."""
+        node_id = node.node_id
         info_text = (
-            f"Component: {comp_name}\n"
+            f"Component: {node.component}\n"
             f"State: {node.state}\n"
             f"Mode: {node.mode}\n"
-            f"TEC: {node.transmit_error_counter}\n"
-            f"REC: {node.receive_error_counter}"
+            f"TEC: {node.tec}\n"
+            f"REC: {node.rec}"
         )
-        self.canvas.itemconfig(self.node_info_labels[node_id], text=info_text)
+        frame_fill, filter_fill = self.node_fills(node, tx)
+        drawn_text, drawn_frame, drawn_filter = self.drawn_nodes.get(node_id, (None, None, None))
 
         visuals = self.node_visuals.get(node_id, {})
         frame_id = visuals.get("frame", None)
         filter_id = visuals.get("filter", None)
 
-        msg = None
-        cnt = 0
-        idx = None
-        for nd in self.nodes.keys():
-            transmitting_node = self.nodes[nd]
-            if transmitting_node.mode == TRANSMITTING and transmitting_node.message_queue:
-                idx = self.nodes[nd].current_bit_index
-                msg = self.nodes[nd].message_queue[0]
-                cnt += 1
-                break
-
-        if node.state == BUS_OFF:
-            if frame_id:
-                self.canvas.itemconfig(frame_id, fill="#400000")
-            if filter_id:
-                self.canvas.itemconfig(filter_id, fill="#400000")
-            return
-        
-        if node.mode == TRANSMITTING:
-            if frame_id:
-                if cnt > 1:
-                    self.canvas.itemconfig(frame_id, fill="#f5c71a")
-                else:
-                    msg = node.message_queue[0]
-                    self.canvas.itemconfig(frame_id, fill="green")
-            if filter_id:
-                self.canvas.itemconfig(filter_id, fill="grey30")
-        elif node.mode == RECEIVING:
-            if frame_id:
-                self.canvas.itemconfig(frame_id, fill="grey30")
-            if filter_id: 
-                if isinstance(msg, OverloadFrame) or isinstance(msg, ErrorFrame):
-                    self.canvas.itemconfig(filter_id, fill="green")
-                else:
-                    if cnt > 1:
-                        self.canvas.itemconfig(filter_id, fill="yellow")
-                    elif cnt == 1:
-                        print(msg)
-                        print(msg.get_bitstream())
-                        print(msg.sections)
-                        if idx <= msg.sections["rtr_start"]:
-                            self.canvas.itemconfig(filter_id, fill="#f5c71a")
-                        else:
-                            if msg.identifier in node.filters:
-                                self.canvas.itemconfig(filter_id, fill="green")
-                            else:
-                                self.canvas.itemconfig(filter_id, fill="red")
-        else:
-            if frame_id:
-                self.canvas.itemconfig(frame_id, fill="grey30")
-            if filter_id:
-                self.canvas.itemconfig(filter_id, fill="grey30")
+        if info_text != drawn_text:
+            self.canvas.itemconfig(self.node_info_labels[node_id], text=info_text)
+        if frame_id and frame_fill is not None and frame_fill != drawn_frame:
+            self.canvas.itemconfig(frame_id, fill=frame_fill)
+        if filter_id and filter_fill is not None and filter_fill != drawn_filter:
+            self.canvas.itemconfig(filter_id, fill=filter_fill)
+        self.drawn_nodes[node_id] = (info_text, frame_fill or drawn_frame, filter_fill or drawn_filter)
 
-    def start_clock(self):
-        if not self.clock_running:
-            self.clock_running = True
-            self.update_clock()
-
-    def update_clock(self):
-        current_clock = self.clock
+    def step_bus(self):
+        """One bit of the simulation, run by the engine's worker thread."""
         #maybe we have more msg at the same time
+        rng = self.bus.stimulus_rng
         while self.clock in self.schedule_times:
-            node = random.choice(list(self.nodes.values()))
-            data = [random.randint(0, 255) for _ in range(random.randint(1, 8))]
-            msg = CANMessage(identifier=random.choice(node.produced_ids), sent_by=node.node_id, data=data)
+            node = rng.choice(list(self.nodes.values()))
+            data = [rng.randint(0, 255) for _ in range(rng.randint(1, 8))]
+            msg = CANMessage(identifier=rng.choice(node.produced_ids), sent_by=node.node_id, data=data)
             node.add_message_to_queue(msg)
 
             #remove first occurence of the clock
             self.schedule_times.remove(self.clock)
             self.schedule_times.append(self.clock + 100)
-        if self.clock_running: 
-            self.clock += 1
-            self.display_clock()
+        self.bus.simulate_step()
 
-            self.bus.simulate_step()
-
-            self.refresh_nodes_and_log()
-            self.update_bus_status()
+    def start_clock(self):
+        if not self.clock_running:
+            self.clock_running = True
+            self.update_clock()
 
-            self.after_id = self.after(self.speed, self.update_clock)
+    def update_clock(self):
+        # the engine steps the bus in its own thread; here we only draw its newest view
+        if self.after_id is not None:
+            self.after_cancel(self.after_id)
+            self.after_id = None
+        view = self.engine.latest()
+        if view is not None and view is not self.rendered_view:
+            self.render(view)
+        if self.clock_running:
+            self.after_id = self.after(FRAME_INTERVAL_MS, self.update_clock)
+
+    def render(self, view):
+        self.rendered_view = view
+        self.display_clock(view.clock)
+        self.refresh_nodes_and_log(view)
+        self.update_bus_status(view)
+
+    def display_clock(self, clock=None):
+        clock = self.clock if clock is None else clock
+        self.canvas.itemconfig(self.clock_label, text=f"Clock = {clock}")
+
+    def refresh_nodes_and_log(self, view):
+        # only panels whose node changed are redrawn; a new transmitter (or one passing
+        # its RTR bit) changes the filter colour of every receiving node
+        changed = {node_id for node_id, _ in view.changes}
+        tx = self.transmitter(view)
+        tx_key = self.transmitter_key(tx)
+        tx_changed = tx_key != self.drawn_transmitter
+        self.drawn_transmitter = tx_key
+        redraw_all = self.redraw_all
+        self.redraw_all = False
+
+        for nv in view.nodes:
+            node_id = nv.node_id
+            if node_id not in self.nodes:
+                continue
+
+            if redraw_all or node_id in changed or (tx_changed and nv.mode == RECEIVING):
+                self.draw_node_state(nv, tx)
+
+            if nv.mode == TRANSMITTING and node_id not in self.transmit_start_times:
+                if nv.head is not None and nv.bit_index >= 1:
+                    started = view.clock - nv.bit_index + 1
+                    self.transmit_start_times[node_id] = started
+                    print(f"started transmission of msg {nv.head.identifier} at {started}")
+
+        for serial, event, node_id, msg, error_type in view.events:
+            if serial <= self.last_event_serial:
+                continue
+            self.last_event_serial = serial
+            if event == "error_frame":
+                self.app.log_panel.add_log(f"{msg.frame_type} frame sent by node {node_id} with ID={msg.identifier}. Error detected: {msg.error_type or error_type}. (unsuccessful transmission)")
+            elif msg.identifier:
+                bitstream = ''.join(str(b) for b in msg.bits)
+                self.app.log_panel.add_log(f"{msg.frame_type} frame sent by node {node_id} with ID={msg.identifier}. (successful transmission)\nBitstream: {bitstream}")
+            else:
+                self.app.log_panel.add_log(f"{msg.frame_type} frame sent by node {node_id}. (successful transmission)")
 
-    def display_clock(self):
-        self.canvas.itemconfig(self.clock_label, text=f"Clock = {self.clock}")
+    def update_bus_status(self, view):
+        status = []
+        if view.state == "Idle":
+            status.append("Bus: IDLE.")
 
-    def refresh_nodes_and_log(self):
-        for node_id in list(self.nodes.keys()):
-            node = self.nodes[node_id]
-            old_mode = self.canvas.itemcget(self.node_visuals[node_id]["frame"], "fill")  
-
-            self.update_node_info(node_id)
-
-            if node.mode == TRANSMITTING:
-                if node_id not in self.transmit_start_times:
-                    if node.message_queue:
-                        msg = node.message_queue[0]
-                        if node.current_bit_index == 1:
-                            self.transmit_start_times[node_id] = self.clock
-                            print(self.clock)
-                            print(f"started transmission of msg {msg.identifier} at {self.clock}")
-
-            if node.has_pending_message() and node.state != BUS_OFF:
-                msg = node.message_queue[0]
-                print(f"Node {node_id} has pending message: {msg}")
-                bitstream = ''.join(str(b) for b in msg.get_bitstream())
-                if msg.error_type:
-                    if node.current_bit_index == msg.error_bit_index:
-                        self.app.log_panel.previous_logs.insert(0, f"{msg.frame_type} frame sent by node {node_id} with ID={msg.identifier}. Error detected: {msg.error_type}. (unsuccessful transmission)")
-                elif node.current_bit_index >= len(msg.get_bitstream()) - 1:
-                    if msg.identifier:
-                        self.app.log_panel.previous_logs.insert(0, f"{msg.frame_type} frame sent by node {node_id} with ID={msg.identifier}. (successful transmission)\nBitstream: {bitstream}")
-                    else:
-                        self.app.log_panel.previous_logs.insert(0, f"{msg.frame_type} frame sent by node {node_id}. (successful transmission)")
-
-    def update_bus_status(self):
-        self.app.log_panel.clear_log()
-        if self.bus.state == "Idle":
-            self.app.log_panel.add_log("Bus: IDLE.")
-
-        tx_nodes = [n for n in self.nodes.values() if n.mode == TRANSMITTING]
+        tx_nodes = [n for n in view.nodes if n.mode == TRANSMITTING and n.head is not None]
         if tx_nodes:
             for nd in tx_nodes:
-                msg = nd.message_queue[0]
+                msg = nd.head
                 if msg.identifier: 
-                    self.app.log_panel.add_log(f"Transmitting: Node {nd.node_id} with message of type {msg.frame_type} frame with ID={msg.identifier}.\n")
+                    status.append(f"Transmitting: Node {nd.node_id} with message of type {msg.frame_type} frame with ID={msg.identifier}.\n")
                 else:
-                    self.app.log_panel.add_log(f"Transmitting: Node {nd.node_id} with message of type {msg.frame_type} frame.\n")
+                    status.append(f"Transmitting: Node {nd.node_id} with message of type {msg.frame_type} frame.\n")
         else:
-            self.app.log_panel.add_log("Transmitting: None\n")
+            status.append("Transmitting: None\n")
 
-        if self.bus.current_winner:
-            self.arbitration = ""
-            node = self.bus.current_winner
-            msg = node.message_queue[0] if node.message_queue else None
+        if view.winner is not None:
+            node = next((n for n in view.nodes if n.node_id == view.winner), None)
+            msg = node.head if node else None
             if msg:
-                bs = msg.get_bitstream()
-                idx = node.current_bit_index 
-                partial = bs[:idx]
-
-                #partial_str = "".join(str(b) for b in partial)
-                field_str, str_manage = self.format_bitfields(msg, partial)
-                self.app.log_panel.add_log("Bus: BUSY")
+                field_str, str_manage = self.format_bitfields(node, view)
+                status.append("Bus: BUSY")
                 
-                self.app.log_panel.add_log(f"{str_manage}")
-                self.app.log_panel.add_log(f"{field_str}")
-        else: #more than one tranmsitting node; append the min bit sent by the transmitting nodes
+                status.append(f"{str_manage}")
+                status.append(f"{field_str}")
+        else: #more than one tranmsitting node; the engine collects the min bit sent by the transmitting nodes
             if len(tx_nodes) > 1:
-                self.arbitration += f"{self.bus.current_bit}"
-                self.app.log_panel.add_log(f"Bus: BUSY (in arbitration) \n{self.arbitration}")
-
-        # if self.app.log_panel.previous_logs:
-        #     self.app.log_panel.add_log(line for line in self.app.log_panel.previous_logs)
-
-        if len(self.app.log_panel.previous_logs) > 0:
-            self.app.log_panel.add_log("\nPrevious Message:")
-            self.app.log_panel.add_log(self.app.log_panel.previous_logs[0])
+                status.append(f"Bus: BUSY (in arbitration) \n{view.arbitration}")
 
-    def format_bitfields(self, msg, partial_bits):
-        if isinstance(msg, ErrorFrame):
-            error_flag = partial_bits[:6]
-            error_delimiter = partial_bits[6:14]
+        # the previous messages are in the log panel's history view
+        self.app.log_panel.set_status("\n".join(status).split("\n"))
 
-            def b2s(b): return "".join(str(x) for x in b)
-            ef_str  = f"{b2s(error_flag):<6}\t{b2s(error_delimiter):<8}"
-            sect_name = ""
-
-            if len(partial_bits) < 7:
-                sect_name = "Error Flag"
-            else:
-                sect_name = "Error Delimiter"
-
-            return ef_str, f"(Transmitting {sect_name})"
-        elif isinstance(msg, OverloadFrame):
-            overload_flag = partial_bits[:6]
-            overload_delimiter = partial_bits[6:14]
+    def format_bitfields(self, node, view):
+        """(fields sent so far, status note) of the frame a node is sending, or None if it is not shown."""
+        msg = node.head
+        field_str = self.bitfields.update(node.node_id, msg, node.bit_index)
+        if field_str is None:
+            return None
+        pos_error, sect_name = self.bitfields.section()
+        if issubclass(msg.frame_class, (ErrorFrame, OverloadFrame)):
+            return field_str, f"(Transmitting {sect_name})"
+
+        transmitting_idx = node.bit_index - 1
+        if sect_name == INTERMISSION:
+            str_manage = "(intermission)"
+            field_str += "(finished sending)"
+        else:
+            str_manage = f"(Transmitting {sect_name})"
+            if msg.ack_index == transmitting_idx:
+                receivers = [n for n in view.nodes if n.mode == RECEIVING and n.node_id in self.nodes
+                             and msg.identifier in self.nodes[n.node_id].filters]
+                receivers_str = ", ".join(str(n.node_id) for n in receivers)
+                str_manage += f" Nodes {receivers_str} sent ACK bit."
 
-            def b2s(b): return "".join(str(x) for x in b)
-            of_str = f"{b2s(overload_flag):<6}\t{b2s(overload_delimiter):<8}"
-            sect_name = ""
+        if not issubclass(msg.frame_class, RemoteFrame) and transmitting_idx == msg.error_bit_index:
+            str_manage = f"ERROR DETECTED: {msg.error_type} at bit {transmitting_idx}"
+            spaces = " " * (pos_error + transmitting_idx)
+            field_str += f"\n{spaces}^"
 
-            if len(partial_bits) < 7:
-                sect_name = "Overload Flag"
-            else:
-                sect_name = "Overload Delimiter"
-
-            return of_str, f"(Transmitting {sect_name})"
-        elif isinstance(msg, RemoteFrame):
-            sof = partial_bits[:1]
-            id_end = msg.sections["rtr_start"]
-            ctrl_end = msg.sections["control_start"]
-            crc_start = msg.sections["crc_start"] 
-            id_bits = partial_bits[1:id_end]
-            rtr = partial_bits[id_end:(id_end+1)]
-            ctrl = partial_bits[(id_end+1):crc_start]
-            #doesnt send data
-            crc_end = msg.sections["crc_end"]
-            crc_delim_start = msg.get_ack_index() - 1
-            crc_field = partial_bits[crc_start:crc_end]
-            # print(crc_end)
-            # print(f"{crc_delim_start}")
-            crc_delimiter = partial_bits[crc_end:(crc_end+1)]
-            ack_start = msg.get_ack_index()
-            ack_field = partial_bits[(crc_end+1):(crc_end+2)]
-            ack_delimiter = partial_bits[(crc_end+2):(crc_end+3)]
-            eof = partial_bits[(crc_end+3):(crc_end+10)]
-            intermission = partial_bits[(crc_end+10):]
-
-            sect_name = ""
-            transmitting_idx = len(partial_bits) - 1
-            if transmitting_idx == 0:
-                sect_name = "Start of Frame Bit" 
-            elif transmitting_idx < id_end:
-                sect_name = "Identifier Bits"
-            elif transmitting_idx < id_end + 1:
-                sect_name = "Remote Transmission Request Bit"
-            elif transmitting_idx < crc_start:
-                sect_name = "Control Field Bits"
-            elif transmitting_idx < (crc_end):
-                sect_name = "Cyclic Redundancy Check Bits"
-            elif transmitting_idx < (crc_end+1):
-                sect_name = "CRC Delimiter Bit"
-            elif transmitting_idx < (crc_end+2):
-                sect_name = "Acknowledgement Bit"
-            elif transmitting_idx < (crc_end+3):
-                sect_name = "Acknowledgement Delimiter Bit"
-            elif transmitting_idx < (crc_end+10):
-                sect_name = "End of Frame Bits"
-            else:
-                sect_name = "Intermission Bits"
-
-            # print(f"sections: {msg.sections}")
-            # print(f"{transmitting_idx}: {sect_name}")
-
-            def b2s(b): return "".join(str(x) for x in b)
-            rf_str = f"{b2s(sof)} {b2s(id_bits)} {b2s(rtr)} {b2s(ctrl)} {b2s(crc_field)} {b2s(crc_delimiter)} {b2s(ack_field)} {b2s(ack_delimiter)} {b2s(eof)}"
-
-            receivers = [n for n in self.nodes.values() if n.mode == RECEIVING and msg.identifier in n.filters]
-            receivers_str = ", ".join(str(n.node_id) for n in receivers) 
-            str_manage = ""
-            if sect_name == "Intermission Bits":
-                str_manage = "(intermission)"
-                rf_str += "(finished sending)"
-            else: 
-                str_manage = f"(Transmitting {sect_name})"
-                if msg.get_ack_index() == len(partial_bits) - 1:
-                    #give a little delay before sending the ack bit
-                    time.sleep(1)
-                    str_manage += f" Nodes {receivers_str} sent ACK bit."
-
-            return rf_str, str_manage
-        elif isinstance(msg, DataFrame) or msg.frame_type == "Data":
-            sof = partial_bits[:1]
-            id_end = msg.sections["rtr_start"]
-            ctrl_end = msg.sections["control_start"]
-            data_start = msg.sections["data_start"]
-            data_end = msg.sections["crc_start"]
-            id_bits = partial_bits[1:id_end]
-            rtr = partial_bits[id_end:(id_end+1)]
-            ctrl = partial_bits[(id_end+1):data_start]
-            data = partial_bits[data_start:data_end]
-            crc_end = msg.sections["crc_end"]
-            crc_field = partial_bits[data_end:crc_end]
-            crc_delimiter = partial_bits[crc_end:(crc_end+1)]
-            ack_field = partial_bits[(crc_end+1):(crc_end+2)]
-            ack_delimiter = partial_bits[(crc_end+2):(crc_end+3)]
-            eof = partial_bits[(crc_end+3):(crc_end+10)]
-            intermission = partial_bits[(crc_end+10):]
-
-            sect_name = ""
-            error_found = None
-            transmitting_idx = len(partial_bits) - 1
-            pos_error = 0
-            
-            if transmitting_idx == msg.error_bit_index:
-                error_found = f"ERROR DETECTED: {msg.error_type} at bit {transmitting_idx}"
-            if transmitting_idx == 0:
-                sect_name = "Start of Frame Bit"
-            elif transmitting_idx < id_end:
-                pos_error = 1
-                sect_name = "Identifier Bits"
-            elif transmitting_idx < id_end + 1:
-                pos_error = 2
-                sect_name = "Remote Transmission Request Bit"
-            elif transmitting_idx < data_start:
-                pos_error = 3
-                sect_name = "Control Field Bits"
-            elif transmitting_idx < data_end:
-                pos_error = 4
-                sect_name = "Data Field Bits"
-            elif transmitting_idx < crc_end:
-                pos_error = 5
-                sect_name = "Cyclic Redundancy Check Bits"
-            elif transmitting_idx < (crc_end+1):
-                pos_error = 6
-                sect_name = "CRC Delimiter Bit"
-                msg.ack_slot = 0
-            elif transmitting_idx < (crc_end+2):
-                pos_error = 7
-                sect_name = "Acknowledgement Bit"
-            elif transmitting_idx < (crc_end+3):
-                pos_error = 8
-                sect_name = "Acknowledgement Delimiter Bit"
-            elif transmitting_idx < (crc_end+10):
-                pos_error = 9
-                sect_name = "End of Frame Bits"
-            else:
-                sect_name = "Intermission Bits"
-
-            def b2s(b): return "".join(str(x) for x in b)
-            df_str = f"{b2s(sof)} {b2s(id_bits)} {b2s(rtr)} {b2s(ctrl)} {b2s(data)} {b2s(crc_field)} {b2s(crc_delimiter)} {b2s(ack_field)} {b2s(ack_delimiter)} {b2s(eof)}"
-            receivers = [n for n in self.nodes.values() if n.mode == RECEIVING and msg.identifier in n.filters]
-            receivers_str = ", ".join(str(n.node_id) for n in receivers)
-            str_manage = ""
-            if sect_name == "Intermission Bits":
-                str_manage = "(intermission)"
-                df_str += "(finished sending)"
-            else:
-                str_manage = f"(Transmitting {sect_name})"
-                if msg.get_ack_index() == len(partial_bits) - 1:
-                    #give a little delay before sending the ack bit
-                    time.sleep(1)
-                    str_manage += f" Nodes {receivers_str} sent ACK bit."
-
-            spaces = ""
-            if error_found is not None:
-                str_manage = f"{error_found}"
-                spaces = " " * (pos_error + transmitting_idx)
-                df_str += f"\n{spaces}^"
-
-            return df_str, str_manage
-        else:
-            return None
+        return field_str, str_manage
 
     def reset_clock(self):
         self.clock_running = False
-        self.clock = 0
+        self.engine.reset()
+        self.last_event_serial = 0
         self.display_clock()
 
 class LogPanel(ctk.CTkFrame):
-    def __init__(self, parent):
+    """
+    Left: the live bus status, rewritten line by line where it changed.
+    Right: the message history, newest first, kept in a bounded LogHistory (older
+    entries spill to disk). Only the `visible_entries` entries in view are put into
+    the text widget; new entries are inserted at the top while the view follows the
+    newest, and the scrollbar moves the window over the whole history.
+    """
+
+    def __init__(self, parent, capacity=1000, visible_entries=8):
         super().__init__(parent)
         self.log_frame = ctk.CTkFrame(self)
         self.log_frame.pack(fill="both", expand=True, padx=10, pady=10)
 
-        self.log_text = ctk.CTkTextbox(self.log_frame, state="disabled", wrap="none", height=200)
-        self.log_text.grid(row=0, column=0, sticky="nsew")
+        self.status_text = ctk.CTkTextbox(self.log_frame, state="disabled", wrap="none", height=200)
+        self.status_text.grid(row=0, column=0, sticky="nsew")
+
+        self.log_text = ctk.CTkTextbox(self.log_frame, state="disabled", wrap="none", height=200,
+                                       activate_scrollbars=False)
+        self.log_text.grid(row=0, column=1, sticky="nsew", padx=(10, 0))
+        self.log_scroll = ctk.CTkScrollbar(self.log_frame, command=self.scroll_history)
+        self.log_scroll.grid(row=0, column=2, sticky="ns")
+        self.log_text.bind("<MouseWheel>", self.on_mouse_wheel)
 
         self.log_frame.grid_rowconfigure(0, weight=1)
         self.log_frame.grid_columnconfigure(0, weight=1)
+        self.log_frame.grid_columnconfigure(1, weight=1)
 
+        self.status_text.configure(font=("Courier New", 14))
         self.log_text.configure(font=("Courier New", 14))
 
-        self.previous_logs = []
+        self.history = LogHistory(capacity=capacity)
+        self.visible_entries = visible_entries
+        self.offset = 0          # history index of the top entry in view (0: following the newest)
+        self.shown = []          # line count of each entry in view
+        self.status_lines = []
+
+    def set_status(self, lines):
+        """Shows the status lines, touching only the lines that differ from what is shown."""
+        shown = self.status_lines
+        self.status_text.configure(state="normal")
+        for i, line in enumerate(lines):
+            if i < len(shown):
+                if shown[i] != line:
+                    self.status_text.delete(f"{i + 1}.0", f"{i + 1}.end")
+                    self.status_text.insert(f"{i + 1}.0", line)
+            else:
+                self.status_text.insert("end", f"\n{line}" if i else line)
+        if len(lines) < len(shown):
+            self.status_text.delete(f"{len(lines)}.end" if lines else "1.0", "end")
+        self.status_text.configure(state="disabled")
+        self.status_lines = list(lines)
 
     def add_log(self, message):
+        self.history.append(message)
+        if self.offset > 0:
+            # the user looks at older entries: keep them in view
+            self.offset += 1
+        else:
+            self.log_text.configure(state="normal")
+            self.log_text.insert("1.0", f"{message}\n" if self.shown else message)
+            self.shown.insert(0, message.count("\n") + 1)
+            if len(self.shown) > self.visible_entries:
+                del self.shown[self.visible_entries:]
+                self.log_text.delete(f"{sum(self.shown)}.end", "end")
+            self.log_text.configure(state="disabled")
+        self.update_scrollbar()
+
+    def draw_history(self):
+        entries = self.history.window(self.offset, self.visible_entries)
         self.log_text.configure(state="normal")
-        self.log_text.insert("end", f"{message}\n")
+        self.log_text.delete("1.0", "end")
+        self.log_text.insert("1.0", "\n".join(entries))
         self.log_text.configure(state="disabled")
-        self.log_text.see("end")
+        self.shown = [entry.count("\n") + 1 for entry in entries]
+        self.update_scrollbar()
+
+    def update_scrollbar(self):
+        total = len(self.history)
+        if total == 0:
+            self.log_scroll.set(0, 1)
+        else:
+            self.log_scroll.set(self.offset / total, (self.offset + len(self.shown)) / total)
+
+    def scroll_history(self, action, value, unit=None):
+        if action == "moveto":
+            offset = int(float(value) * len(self.history))
+        else:
+            step = self.visible_entries if unit == "pages" else 1
+            offset = self.offset + int(value) * step
+        offset = max(0, min(offset, len(self.history) - self.visible_entries))
+        if offset != self.offset:
+            self.offset = offset
+            self.draw_history()
+
+    def on_mouse_wheel(self, event):
+        self.scroll_history("scroll", -1 if event.delta > 0 else 1, "units")
+        return "break"
 
     def clear_log(self):
-        self.log_text.configure(state="normal")
-        self.log_text.delete("1.0", "end")
-        self.log_text.configure(state="disabled")
+        self.set_status([])
+
+    def clear_history(self):
+        self.history.clear()
+        self.offset = 0
+        self.draw_history()
 
 class PredefinedScenarios(ctk.CTkFrame):
     def __init__(self, master, playground, log_panel):
@@ -908,6 +859,7 @@ class PredefinedScenarios(ctk.CTkFrame):
             return
         
         self.run_active = True
+        rng = self.playground.bus.stimulus_rng
 
         # 1) Basic frame transmissions
         if self.active_scenario == "frame":
@@ -921,8 +873,8 @@ class PredefinedScenarios(ctk.CTkFrame):
                 return
 
             if frame_type == "Data Frame":
-                data = [random.randint(0, 255) for _ in range(random.randint(1, 8))]
-                msg = DataFrame(identifier=random.choice(sender_node.produced_ids), sent_by=sender_node.node_id, data=data)
+                data = [rng.randint(0, 255) for _ in range(rng.randint(1, 8))]
+                msg = DataFrame(identifier=rng.choice(sender_node.produced_ids), sent_by=sender_node.node_id, data=data)
                 sender_node.add_message_to_queue(msg)
                 # self.log_panel.add_log(
                 #     f"[Scenario] Node {sender_node.node_id} queued DataFrame (ID={msg.identifier}) with data={data}."
@@ -930,8 +882,9 @@ class PredefinedScenarios(ctk.CTkFrame):
 
             elif frame_type == "Remote Frame":
                 msg = RemoteFrame(
-                    identifier=random.choice(sender_node.produced_ids),
-                    sent_by=sender_node.node_id
+                    identifier=rng.choice(sender_node.produced_ids),
+                    sent_by=sender_node.node_id,
+                    rng=rng
                 )
                 sender_node.add_message_to_queue(msg)
                 # self.log_panel.add_log(
@@ -966,11 +919,11 @@ class PredefinedScenarios(ctk.CTkFrame):
 
             msg_ids = [] 
             for node in active_nodes: 
-                data = [random.randint(0, 255)] 
+                data = [rng.randint(0, 255)] 
                 #produce an id that is not the same as any other node msg queue; if 2 are the same, no node will win the arbitration
-                msg_id = random.choice(node.produced_ids)
+                msg_id = rng.choice(node.produced_ids)
                 while msg_id in msg_ids:
-                    msg_id = random.choice(node.produced_ids)
+                    msg_id = rng.choice(node.produced_ids)
                 msg = DataFrame(identifier=msg_id, sent_by=node.node_id, data=data)
                 node.add_message_to_queue(msg)
                 self.log_panel.add_log(f"Node {node.node_id} queued DataFrame ID={msg.identifier} ({msg.identifier :011b}) for arbitration.")
@@ -985,9 +938,9 @@ class PredefinedScenarios(ctk.CTkFrame):
                 return
             self.playground.node_failure_active = True
 
-            data = [random.randint(0, 255) for _ in range(random.randint(1, 8))]
+            data = [rng.randint(0, 255) for _ in range(rng.randint(1, 8))]
 
-            msg = CANMessage(identifier=random.choice(node.produced_ids), sent_by=node.node_id, data=data, frame_type="Data", error_type=error_type)
+            msg = CANMessage(identifier=rng.choice(node.produced_ids), sent_by=node.node_id, data=data, frame_type="Data", error_type=error_type)
             node.add_message_to_queue(msg)
 
             # if not node.has_pending_message():
@@ -1008,7 +961,7 @@ class PredefinedScenarios(ctk.CTkFrame):
             }
             mapped_error = error_mapping.get(error_type)
             if mapped_error:
-                getattr(msg, f"corrupt_{mapped_error}")()
+                getattr(msg, f"corrupt_{mapped_error}")(rng)
                 print(f"error index: {msg.error_bit_index}")
             else:
                 self.log_panel.add_log("Invalid or unsupported error type.")
@@ -1070,9 +1023,9 @@ class PredefinedScenarios(ctk.CTkFrame):
 
     def reset_scenario(self):
         self.run_active = False
+        self.playground.clock_running = False
         self.playground.node_failure_active = False
         self.playground.reset()
-        self.playground.arbitration = ""
         self.default_scenario_menu()
         self.pause_btn.configure(text="Pause")
         self.run_btn.configure(state="normal")
@@ -1097,7 +1050,7 @@ class PredefinedScenarios(ctk.CTkFrame):
         self.playground.reset_clock()
         self.playground.clock_running = False
         self.playground.previous_frame = None
-        self.log_panel.previous_logs.clear()
+        self.log_panel.clear_history()
 
     def select_node_dialog(self, prompt):
         if not self.playground.nodes:
@@ -1241,9 +1194,10 @@ class InteractiveSimulation(ctk.CTkFrame):
                 return
 
             err = error_var.get()
-            data = random.choices(range(256), k=random.randint(1, 8))
+            rng = self.playground.bus.stimulus_rng
+            data = rng.choices(range(256), k=rng.randint(1, 8))
             message = DataFrame(
-                identifier=random.choice(sender_node.produced_ids),
+                identifier=rng.choice(sender_node.produced_ids),
                 sent_by=node_id,
                 data=data
             )
@@ -1258,9 +1212,10 @@ class InteractiveSimulation(ctk.CTkFrame):
                 }
                 mapped = error_map.get(err)
                 if mapped and hasattr(message, f"corrupt_{mapped}"):
-                    getattr(message, f"corrupt_{mapped}")()
+                    getattr(message, f"corrupt_{mapped}")(rng)
 
-            sender_node.add_message_to_queue(message)
+            with self.playground.engine.lock:
+                sender_node.add_message_to_queue(message)
             self.log_panel.add_log(f"Queued message from Node {node_id}, Error={err}, ID={message.identifier}")
 
         send_btn = ctk.CTkButton(window, text="Send Message", command=send_message)
@@ -1288,6 +1243,7 @@ class InteractiveSimulation(ctk.CTkFrame):
 
     def reset_simulation(self):
         self.run_active = False
+        self.playground.clock_running = False
         self.playground.reset()
         self.pause_btn.configure(text="Pause")
         self.run_btn.configure(state="normal")
@@ -1313,7 +1269,7 @@ class InteractiveSimulation(ctk.CTkFrame):
         self.playground.reset_clock()
         self.playground.clock_running = False
         self.playground.previous_frame = None
-        self.log_panel.previous_logs.clear()
+        self.log_panel.clear_history()
 
     # def edit_node_config(self):
     #     window = ctk.CTkToplevel(self)
@@ -1452,8 +1408,9 @@ class InteractiveSimulation(ctk.CTkFrame):
             if selection.startswith("Node "):
                 node_id = int(selection.split()[1])
                 if node_id in self.playground.nodes:
-                    del self.playground.nodes[node_id]
-                    del self.playground.node_positions[node_id]
+                    with self.playground.engine.lock:
+                        del self.playground.nodes[node_id]
+                        del self.playground.node_positions[node_id]
                     if node_id in self.playground.node_visuals:
                         for item in self.playground.node_visuals[node_id]:
                             self.playground.canvas.delete(item)
@@ -1475,15 +1432,16 @@ class InteractiveSimulation(ctk.CTkFrame):
                 node_id = int(selection.split()[1])
                 if node_id in self.playground.nodes:
                     comp_name = component_var.get()
-                    if comp_name in COMPONENTS:
-                        self.playground.assign_node_to_component(node_id, comp_name)
-                    else:
-                        if comp_name != "None":
-                            self.log_panel.add_log("Invalid component selected.")
+                    with self.playground.engine.lock:
+                        if comp_name in COMPONENTS:
+                            self.playground.assign_node_to_component(node_id, comp_name)
                         else:
-                            self.playground.nodes[node_id].component = None
-                            self.playground.nodes[node_id].produced_ids = list(range(0, 2048))
-                            self.playground.nodes[node_id].filters = list(range(0, 2048))
+                            if comp_name != "None":
+                                self.log_panel.add_log("Invalid component selected.")
+                            else:
+                                self.playground.nodes[node_id].component = None
+                                self.playground.nodes[node_id].produced_ids = list(range(0, 2048))
+                                self.playground.nodes[node_id].filters = list(range(0, 2048))
 
                     # filters_text = filter_entry.get()
                     # if filters_text.strip():
@@ -1530,7 +1488,7 @@ class InteractiveSimulation(ctk.CTkFrame):
 
     def generate_messages(self):
         self.message_load = self.message_load.lower()
-        self.playground.schedule_times = []
+        schedule_times = []
         if self.message_load == LOW:
             num_messages = int(len(self.playground.nodes) / 3)
         elif self.message_load == MEDIUM:
@@ -1548,9 +1506,13 @@ class InteractiveSimulation(ctk.CTkFrame):
             #make uniform times (values from all intervals where interval = (t2-t1)/num_messages)
             interval = int((t2 - t1) / num_messages)
             for i in (range(num_messages + 1)):
-                self.playground.schedule_times.append(t1 + i * interval)
+                schedule_times.append(t1 + i * interval)
+
+            print(f"{schedule_times}")
 
-            print(f"{self.playground.schedule_times}")
+        # the engine's worker reads the schedule while it steps
+        with self.playground.engine.lock:
+            self.playground.schedule_times = schedule_times
 
 if __name__ == "__main__":
     ctk.set_appearance_mode("dark")
@@ -0,0 +1,175 @@
+import csv
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout
+
+from can_bus import CANBus, IDLE
+from can_node import CANNode, BUS_OFF
+from can_message import DataFrame
+from can_histogram import LatencyHistogram
+
+ERROR_TYPES = ["bit_error", "stuff_error", "crc_error", "ack_error", "form_error"]
+METRICS = ["frames_queued", "frames_ok", "error_frames", "bus_off_nodes", "busy_bits",
+           "bus_load", "latency_mean", "latency_max"]
+
+# load levels as in the GUI: messages per 100 bit times relative to the node count
+LOAD_LEVELS = {"low": 1 / 3, "medium": 1.0, "high": 3.0}
+
+
+def parameter_grid(**axes):
+    """parameter_grid(bitrate=[125000, 500000], load=["low", "high"]) -> list of dicts."""
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[n] for n in names))]
+
+
+def task_key(params, rep):
+    return ",".join(f"{k}={params[k]}" for k in sorted(params)) + f",rep={rep}"
+
+
+def task_seed(base_seed, params, rep):
+    # stable across processes and runs (random.Random hashes str seeds with sha512)
+    return random.Random(f"{base_seed}|{task_key(params, rep)}").getrandbits(32)
+
+
+def build_bus(params, seed):
+    bus = CANBus(bitrate=params.get("bitrate", 500000), seed=seed)
+    for node_id in range(1, params.get("node_count", 4) + 1):
+        bus.connect_node(CANNode(node_id))
+    return bus
+
+
+def run_scenario(params, seed, duration_bits=10000, bin_width=50):
+    """
+    Runs one scenario and returns (metrics, LatencyHistogram).
+    params: bitrate, node_count, load ("low"/"medium"/"high" or messages per 100 bits),
+    error_rate (probability that a queued frame carries an injected error).
+    """
+    bus = build_bus(params, seed)
+    rng = bus.stimulus_rng
+    load = params.get("load", "medium")
+    per_100_bits = LOAD_LEVELS[load] * len(bus.nodes) if isinstance(load, str) else load
+    rate = per_100_bits / 100.0
+    error_rate = params.get("error_rate", 0.0)
+
+    queued_at = {}
+    hist = LatencyHistogram(bin_width)
+    counts = {"frames_queued": 0, "frames_ok": 0, "error_frames": 0, "busy_bits": 0}
+    latencies = []
+
+    def on_bus_event(event, *args):
+        if event == "frame_transmitted":
+            start = queued_at.pop(id(args[1]), None)
+            if start is not None:
+                latency = bus.bit_time - start
+                latencies.append(latency)
+                hist.add(latency)
+            counts["frames_ok"] += 1
+        elif event == "error_frame":
+            counts["error_frames"] += 1
+
+    bus.add_listener(on_bus_event)
+    next_arrival = rng.expovariate(rate) if rate > 0 else float("inf")
+    while bus.bit_time < duration_bits:
+        while next_arrival <= bus.bit_time:
+            node = rng.choice(bus.nodes)
+            if node.state != BUS_OFF:
+                data = [rng.randint(0, 255) for _ in range(rng.randint(1, 8))]
+                msg = DataFrame(rng.choice(node.produced_ids), node.node_id, data)
+                if error_rate and rng.random() < error_rate:
+                    node.error_handler.inject_error(rng.choice(ERROR_TYPES), msg, rng)
+                queued_at[id(msg)] = bus.bit_time
+                node.add_message_to_queue(msg)
+                counts["frames_queued"] += 1
+            next_arrival += rng.expovariate(rate)
+        bus.simulate_step()
+        if bus.state != IDLE:
+            counts["busy_bits"] += 1
+
+    metrics = dict(counts)
+    metrics["bus_off_nodes"] = sum(1 for nd in bus.nodes if nd.state == BUS_OFF)
+    metrics["bus_load"] = counts["busy_bits"] / duration_bits
+    metrics["latency_mean"] = sum(latencies) / len(latencies) if latencies else 0.0
+    metrics["latency_max"] = max(latencies) if latencies else 0
+    return metrics, hist
+
+
+def _run_task(task):
+    params, rep, seed, duration_bits, bin_width = task
+    with open(os.devnull, "w") as sink, redirect_stdout(sink):
+        metrics, hist = run_scenario(params, seed, duration_bits, bin_width)
+    return params, rep, seed, metrics, hist.encode()
+
+
+class SweepRunner:
+    """
+    Runs every parameter combination `repetitions` times in a process pool.
+    Each finished task is appended to `results_path` (one column per parameter,
+    metric and the encoded latency histogram) and flushed, so an interrupted
+    sweep resumes by skipping the tasks already in the file.
+    """
+
+    def __init__(self, grid, results_path, repetitions=10, duration_bits=10000,
+                 base_seed=0, max_workers=None, bin_width=50):
+        self.grid = list(grid)
+        self.results_path = results_path
+        self.repetitions = repetitions
+        self.duration_bits = duration_bits
+        self.base_seed = base_seed
+        self.max_workers = max_workers
+        self.bin_width = bin_width
+        self.param_names = sorted({name for params in self.grid for name in params})
+        self.columns = ["task", "rep", "seed"] + self.param_names + METRICS + ["latency_hist"]
+
+    def completed_tasks(self):
+        if not os.path.exists(self.results_path):
+            return set()
+        with open(self.results_path, newline="") as f:
+            return {row["task"] for row in csv.DictReader(f)}
+
+    def pending_tasks(self):
+        done = self.completed_tasks()
+        tasks = []
+        for params in self.grid:
+            for rep in range(self.repetitions):
+                if task_key(params, rep) not in done:
+                    seed = task_seed(self.base_seed, params, rep)
+                    tasks.append((params, rep, seed, self.duration_bits, self.bin_width))
+        return tasks
+
+    def run(self, progress=None):
+        tasks = self.pending_tasks()
+        new_file = not os.path.exists(self.results_path) or os.path.getsize(self.results_path) == 0
+        with open(self.results_path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=self.columns)
+            if new_file:
+                writer.writeheader()
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = [pool.submit(_run_task, task) for task in tasks]
+                for done, fut in enumerate(as_completed(futures), 1):
+                    params, rep, seed, metrics, hist = fut.result()
+                    row = {"task": task_key(params, rep), "rep": rep, "seed": seed, "latency_hist": hist}
+                    row.update(params)
+                    row.update(metrics)
+                    writer.writerow(row)
+                    f.flush()
+                    if progress:
+                        progress(done, len(tasks))
+        return self.load_results()
+
+    def load_results(self):
+        with open(self.results_path, newline="") as f:
+            return list(csv.DictReader(f))
+
+    def summarize(self):
+        """Merges repetitions: {param tuple: (mean metrics, merged LatencyHistogram)}."""
+        groups = {}
+        for row in self.load_results():
+            key = tuple((name, row[name]) for name in self.param_names)
+            metrics, hist, n = groups.get(key, ({m: 0.0 for m in METRICS}, LatencyHistogram(self.bin_width), 0))
+            for m in METRICS:
+                metrics[m] += float(row[m])
+            hist.merge(LatencyHistogram.decode(row["latency_hist"], self.bin_width))
+            groups[key] = (metrics, hist, n + 1)
+        return {key: ({m: v / n for m, v in metrics.items()}, hist) for key, (metrics, hist, n) in groups.items()}
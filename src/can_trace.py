@@ -0,0 +1,608 @@
+import bisect
+import gzip
+import lzma
+import mmap
+import os
+import struct
+from array import array
+
+from can_message import RemoteFrame
+
+# Trace files of what the bus transmitted, written while the simulation runs.
+#   candump  candump -l log lines: "(0.001234) can1 123#0102", "123#R4" for remote frames,
+#            error and overload frames as SocketCAN error frames (CAN_ERR_FLAG set)
+#   asc      Vector ASC: "   0.001234 1  123             Tx   d 2 01 02",
+#            error frames as "ErrorFrame" with the ECC field of the error type
+#   binary   fixed-size records (BINARY_RECORD) after BINARY_MAGIC and the bitrate
+# In the text formats the transmitting node is the interface (candump) / channel (asc),
+# for error frames the node that signalled the error. Timestamps are simulated seconds,
+# plus the recorder's start_time in the text formats; binary records hold the bit_time,
+# so their timestamps start at 0.
+#
+# Reading (read_trace) yields records as tuples
+#   (timestamp, kind, node, identifier, dlc, data, error_type)
+# with node / identifier / error_type None where the trace has none. Files are never
+# loaded as a whole: binary traces are memory-mapped, text traces are parsed line by line.
+#
+# The recorder also writes a sidecar index (<trace>.idx, see TraceIndex): the records are
+# grouped in blocks with the time and byte offset of each block's first record and,
+# per identifier, the list of blocks containing it, so a query by ID and time window
+# only reads the blocks that can match.
+
+FORMATS = ("candump", "asc", "binary")
+COMPRESSION = (None, "gzip", "lzma")
+
+DATA, REMOTE, ERROR, OVERLOAD = 0, 1, 2, 3
+ERROR_TYPES = ["bit_error", "stuff_error", "crc_error", "ack_error", "form_error"]
+NO_ID = 0xFFFF
+ANY_ID = -1  # TraceIndex queries: records of every identifier
+
+BINARY_MAGIC = b"CANTRC1\0"
+BINARY_HEADER = struct.Struct("<8sI")           # magic, bitrate
+BINARY_RECORD = struct.Struct("<QBBHBB8s")      # bit_time, kind, node, identifier, dlc, error type + 1, data
+
+INDEX_MAGIC = b"CANIDX1\0"
+INDEX_HEADER = struct.Struct("<8sBBIIIQQ")     # magic, format, compression, block_records, blocks, ids, records, end offset
+
+# SocketCAN error frame encoding (linux/can/error.h)
+CAN_ERR_FLAG = 0x20000000
+CAN_ERR_PROT = 0x00000008
+CAN_ERR_ACK = 0x00000020
+CAN_ERR_PROT_BIT = 0x01
+CAN_ERR_PROT_FORM = 0x02
+CAN_ERR_PROT_STUFF = 0x04
+CAN_ERR_PROT_OVERLOAD = 0x20
+CAN_ERR_PROT_LOC_CRC_SEQ = 0x08
+
+# ECC register of the error code capture (error code in bits 7-6, segment in bits 4-0)
+ASC_ECC = {
+    "bit_error": 0b00000000,
+    "form_error": 0b01000000,
+    "stuff_error": 0b10000000,
+    "crc_error": 0b11001000,   # other error, CRC sequence
+    "ack_error": 0b11011001,   # other error, ACK slot
+}
+
+
+def socketcan_error(error_type, overload=False):
+    """(can_id, 8 data bytes) of the SocketCAN error frame for an error type."""
+    data = [0] * 8
+    if overload:
+        data[2] = CAN_ERR_PROT_OVERLOAD
+        return CAN_ERR_FLAG | CAN_ERR_PROT, data
+    if error_type == "ack_error":
+        return CAN_ERR_FLAG | CAN_ERR_ACK, data
+    if error_type == "crc_error":
+        data[3] = CAN_ERR_PROT_LOC_CRC_SEQ
+    else:
+        data[2] = {"bit_error": CAN_ERR_PROT_BIT, "form_error": CAN_ERR_PROT_FORM,
+                   "stuff_error": CAN_ERR_PROT_STUFF}.get(error_type, 0)
+    return CAN_ERR_FLAG | CAN_ERR_PROT, data
+
+
+def event_record(event, args):
+    """(kind, node_id, identifier, dlc, data, error_type) of a bus event worth recording, else None."""
+    if event == "frame_transmitted":
+        node, msg = args
+        kind = REMOTE if isinstance(msg, RemoteFrame) else DATA
+        data = [] if kind == REMOTE else msg.data_field
+        return kind, node.node_id, msg.identifier, int(msg.control_field[:4], 2), data, None
+    if event == "error_frame":
+        reporter, error_type, _ = args
+        return ERROR, reporter.node_id, None, 0, (), error_type
+    if event == "overload_frame":
+        return OVERLOAD, args[0].node_id, None, 0, (), None
+    return None
+
+
+def pack_binary_record(bit_time, kind, node_id, identifier, dlc, data, error_type=None):
+    error_code = ERROR_TYPES.index(error_type) + 1 if error_type in ERROR_TYPES else 0
+    return BINARY_RECORD.pack(bit_time, kind, node_id & 0xFF, NO_ID if identifier is None else identifier,
+                              dlc, error_code, bytes(data[:8]))
+
+
+def decode_binary_record(fields, bitrate):
+    """Record tuple of the unpacked fields of a BINARY_RECORD."""
+    bit_time, kind, node, identifier, dlc, error_code, data = fields
+    return (bit_time / bitrate, kind, node,
+            None if identifier == NO_ID else identifier, dlc,
+            data[:dlc] if kind == DATA else b"",
+            ERROR_TYPES[error_code - 1] if error_code else None)
+
+
+def open_trace(path, mode, compression=None):
+    """Opens a trace file in binary mode, compressed with gzip or lzma if asked to."""
+    if compression not in COMPRESSION:
+        raise ValueError(f"Unknown compression {compression!r}")
+    if compression == "gzip":
+        return gzip.open(path, mode, compresslevel=6)
+    if compression == "lzma":
+        return lzma.open(path, mode)
+    return open(path, mode)
+
+
+class TraceRecorder:
+    """
+    recorder = TraceRecorder(bus, "run.log", fmt="candump", compression="gzip")
+    ... bus.simulate_step() ...
+    recorder.close()
+
+    Writes every data/remote frame that went through, every error frame and every
+    overload frame as it happens. Records are collected in memory and written in
+    chunks of about `buffer_size` bytes, so recording costs one formatting call per
+    frame and a file write only every few thousand frames.
+    """
+
+    def __init__(self, bus, path, fmt="candump", compression=None, buffer_size=1 << 20,
+                 interface="can", start_time=0.0, index=True, index_block=1024):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown trace format {fmt!r}")
+        self.bus = bus
+        self.path = path
+        self.fmt = fmt
+        self.buffer_size = buffer_size
+        self.interface = interface
+        self.start_time = start_time
+        self.file = open_trace(path, "wb", compression)
+        self.chunks = []
+        self.buffered = 0
+        self.records = 0
+        self.bytes_written = 0
+        self.closed = False
+        self.index = TraceIndex(fmt, compression, index_block) if index else None
+
+        if fmt == "binary":
+            self.write(BINARY_HEADER.pack(BINARY_MAGIC, bus.bitrate))
+        elif fmt == "asc":
+            self.write(b"date Thu Jan 1 00:00:00.000 am 1970\nbase hex  timestamps absolute\n"
+                       b"no internal events logged\n")
+        bus.add_listener(self.on_bus_event)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def timestamp(self):
+        return self.start_time + self.bus.bit_time / self.bus.bitrate
+
+    def record_time(self):
+        """Timestamp of the record being written as read_trace decodes it, the clock of the index."""
+        if self.fmt == "binary":
+            return self.bus.bit_time / self.bus.bitrate
+        return float(f"{self.timestamp():.6f}")
+
+    def on_bus_event(self, event, *args):
+        record = event_record(event, args)
+        if record is not None:
+            self.record(*record)
+
+    def record(self, kind, node_id, identifier, dlc, data, error_type=None):
+        if self.fmt == "binary":
+            chunk = pack_binary_record(self.bus.bit_time, kind, node_id, identifier, dlc, data, error_type)
+        elif self.fmt == "candump":
+            chunk = self.candump_line(kind, node_id, identifier, dlc, data, error_type).encode("ascii")
+        else:
+            chunk = self.asc_line(kind, node_id, identifier, dlc, data, error_type).encode("ascii")
+        if self.index is not None:
+            self.index.add(self.record_time(), self.bytes_written + self.buffered, identifier)
+        self.records += 1
+        self.write(chunk)
+
+    def candump_line(self, kind, node_id, identifier, dlc, data, error_type):
+        if kind == REMOTE:
+            frame = f"{identifier:03X}#R{dlc:X}" if dlc else f"{identifier:03X}#R"
+        elif kind == DATA:
+            frame = f"{identifier:03X}#" + "".join(f"{b:02X}" for b in data)
+        else:
+            can_id, err_data = socketcan_error(error_type, overload=kind == OVERLOAD)
+            frame = f"{can_id:08X}#" + "".join(f"{b:02X}" for b in err_data)
+        return f"({self.timestamp():.6f}) {self.interface}{node_id} {frame}\n"
+
+    def asc_line(self, kind, node_id, identifier, dlc, data, error_type):
+        ts = f"{self.timestamp():11.6f}"
+        if kind == ERROR:
+            return f"{ts} {node_id}  ErrorFrame ECC: {ASC_ECC.get(error_type, 0):08b}\n"
+        if kind == OVERLOAD:
+            return f"// {ts} {node_id}  OverloadFrame\n"  # ASC has no overload frame event
+        if kind == REMOTE:
+            return f"{ts} {node_id}  {identifier:<15X} Tx   r {dlc:X}\n"
+        payload = "".join(f" {b:02X}" for b in data)
+        return f"{ts} {node_id}  {identifier:<15X} Tx   d {dlc:X}{payload}\n"
+
+    def write(self, chunk):
+        self.chunks.append(chunk)
+        self.buffered += len(chunk)
+        if self.buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.chunks:
+            return
+        block = b"".join(self.chunks)
+        self.file.write(block)
+        self.bytes_written += len(block)
+        self.chunks.clear()
+        self.buffered = 0
+
+    def close(self):
+        if self.closed:
+            return
+        self.bus.remove_listener(self.on_bus_event)
+        self.flush()
+        self.file.close()
+        if self.index is not None:
+            self.index.finish(self.bytes_written)
+            self.index.save(index_path(self.path))
+        self.closed = True
+
+
+def trace_format(path):
+    """(format, compression) guessed from the file name: .log = candump, .asc = asc, else binary; .gz / .xz."""
+    name = os.fspath(path)
+    compression = None
+    if name.endswith(".gz"):
+        compression, name = "gzip", name[:-3]
+    elif name.endswith(".xz"):
+        compression, name = "lzma", name[:-3]
+    if name.endswith(".log"):
+        return "candump", compression
+    if name.endswith(".asc"):
+        return "asc", compression
+    return "binary", compression
+
+
+def read_trace(path, fmt=None, compression=None, start=0):
+    """Iterates the records of a trace file; `start` skips that many records (binary traces seek directly)."""
+    if fmt is None:
+        fmt, guessed = trace_format(path)
+        compression = compression or guessed
+    if fmt == "binary":
+        reader = BinaryTraceReader(path, compression)
+        try:
+            yield from reader.records(start)
+        finally:
+            reader.close()
+        return
+    parse = parse_candump_line if fmt == "candump" else parse_asc_line
+    with open_trace(path, "rb", compression) as f:
+        skipped = 0
+        for line in f:
+            record = parse(line.decode("ascii", "replace"))
+            if record is None:
+                continue
+            if skipped < start:
+                skipped += 1
+                continue
+            yield record
+
+
+class BinaryTraceReader:
+    """
+    Random access to a binary trace. Uncompressed files are memory-mapped and
+    decoded one window of records at a time; compressed files can only be
+    streamed from the start.
+    """
+
+    def __init__(self, path, compression=None, window=4096):
+        self.path = path
+        self.compression = compression
+        self.window = window
+        self.file = open_trace(path, "rb", compression)
+        header = self.file.read(BINARY_HEADER.size)
+        if len(header) < BINARY_HEADER.size:
+            raise ValueError(f"{path}: not a binary CAN trace (file too short)")
+        magic, self.bitrate = BINARY_HEADER.unpack(header)
+        if magic != BINARY_MAGIC:
+            raise ValueError(f"{path}: not a binary CAN trace")
+        self.map = None
+        if compression is None:
+            size = os.fstat(self.file.fileno()).st_size
+            self.count = (size - BINARY_HEADER.size) // BINARY_RECORD.size
+            if self.count:
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self.count = None  # unknown without decompressing the whole file
+
+    def __len__(self):
+        if self.count is None:
+            raise TypeError("Record count of a compressed trace is unknown")
+        return self.count
+
+    def offset(self, index):
+        return BINARY_HEADER.size + index * BINARY_RECORD.size
+
+    def decode(self, fields):
+        return decode_binary_record(fields, self.bitrate)
+
+    def record(self, index):
+        return self.decode(BINARY_RECORD.unpack_from(self.map, self.offset(index)))
+
+    def records(self, start=0, stop=None):
+        if self.compression is not None:
+            yield from self.stream(start, stop)
+            return
+        stop = self.count if stop is None else min(stop, self.count)
+        view = memoryview(self.map) if self.map is not None else memoryview(b"")
+        try:
+            for first in range(start, stop, self.window):
+                last = min(first + self.window, stop)
+                chunk = view[self.offset(first):self.offset(last)]
+                for fields in BINARY_RECORD.iter_unpack(chunk):
+                    yield self.decode(fields)
+                chunk.release()
+        finally:
+            view.release()
+
+    def stream(self, start, stop):
+        size = BINARY_RECORD.size
+        self.file.seek(BINARY_HEADER.size)
+        index = 0
+        while stop is None or index < stop:
+            block = self.file.read(size * self.window)
+            block = block[:len(block) - len(block) % size]
+            if not block:
+                return
+            for fields in BINARY_RECORD.iter_unpack(block):
+                if stop is not None and index >= stop:
+                    return
+                if index >= start:
+                    yield self.decode(fields)
+                index += 1
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        self.file.close()
+
+
+def socketcan_error_type(can_id, data):
+    """Inverse of socketcan_error(): (kind, error_type) of a SocketCAN error frame."""
+    if can_id & CAN_ERR_ACK:
+        return ERROR, "ack_error"
+    prot = data[2] if len(data) > 2 else 0
+    if prot & CAN_ERR_PROT_OVERLOAD:
+        return OVERLOAD, None
+    if prot & CAN_ERR_PROT_BIT:
+        return ERROR, "bit_error"
+    if prot & CAN_ERR_PROT_FORM:
+        return ERROR, "form_error"
+    if prot & CAN_ERR_PROT_STUFF:
+        return ERROR, "stuff_error"
+    if len(data) > 3 and data[3] == CAN_ERR_PROT_LOC_CRC_SEQ:
+        return ERROR, "crc_error"
+    return ERROR, None
+
+
+def interface_node(name):
+    digits = len(name) - len(name.rstrip("0123456789"))
+    return int(name[-digits:]) if digits else None
+
+
+def parse_candump_line(line):
+    """Record of a candump -l line, None for lines that are not classic CAN frames."""
+    parts = line.split()
+    if len(parts) < 3 or not parts[0].startswith("(") or "#" not in parts[2] or "##" in parts[2]:
+        return None
+    try:
+        timestamp = float(parts[0][1:-1])
+        can_id, payload = parts[2].split("#", 1)
+        identifier = int(can_id, 16)
+        node = interface_node(parts[1])
+        if len(can_id) == 8 and identifier & CAN_ERR_FLAG:
+            data = bytes.fromhex(payload)
+            kind, error_type = socketcan_error_type(identifier, data)
+            return (timestamp, kind, node, None, 0, b"", error_type)
+        if len(can_id) != 3:
+            return None  # extended identifiers are not simulated
+        if payload.startswith("R"):
+            return (timestamp, REMOTE, node, identifier, int(payload[1:] or "0", 16), b"", None)
+        data = bytes.fromhex(payload)
+        return (timestamp, DATA, node, identifier, len(data), data, None)
+    except ValueError:
+        return None
+
+
+ASC_ERROR_TYPES = {ecc >> 6: error_type for error_type, ecc in ASC_ECC.items() if ecc >> 6 != 3}
+
+
+def parse_asc_line(line):
+    """Record of an ASC event line, None for headers, comments and events that are not frames."""
+    parts = line.split()
+    if len(parts) >= 4 and parts[0] == "//" and parts[3] == "OverloadFrame":
+        parts = parts[1:]
+    if len(parts) < 3:
+        return None
+    try:
+        timestamp = float(parts[0])
+        node = int(parts[1])
+    except ValueError:
+        return None
+    if parts[2] == "ErrorFrame":
+        error_type = None
+        if len(parts) >= 5 and parts[3] == "ECC:":
+            ecc = int(parts[4], 2)
+            error_type = ASC_ERROR_TYPES.get(ecc >> 6)
+            if error_type is None:
+                error_type = next((t for t, code in ASC_ECC.items() if code == ecc), None)
+        return (timestamp, ERROR, node, None, 0, b"", error_type)
+    if parts[2] == "OverloadFrame":
+        return (timestamp, OVERLOAD, node, None, 0, b"", None)
+    if len(parts) < 6 or parts[4] not in ("d", "r") or parts[2].endswith("x"):
+        return None
+    try:
+        identifier = int(parts[2], 16)
+        dlc = int(parts[5], 16)
+        if parts[4] == "r":
+            return (timestamp, REMOTE, node, identifier, dlc, b"", None)
+        data = bytes(int(b, 16) for b in parts[6:6 + dlc])
+    except ValueError:
+        return None
+    return (timestamp, DATA, node, identifier, dlc, data, None)
+
+
+def index_path(trace_path):
+    return os.fspath(trace_path) + ".idx"
+
+
+class TraceIndex:
+    """
+    Sidecar index of a trace file. Records are grouped in blocks of `block_records`;
+    per block the timestamp, byte offset (in the uncompressed stream) and index of
+    its first record are kept, and per identifier a sorted list of the blocks that
+    contain it (error and overload frames are listed under NO_ID).
+
+    index = TraceIndex.load("run.bin.idx")         # or TraceIndex.build("run.bin")
+    for record in index.query("run.bin", identifier=0x1A0, start=10.0, end=12.5): ...
+
+    Queries on uncompressed traces seek straight to the matching blocks; on
+    compressed traces seeking has to decompress up to the block.
+    """
+
+    def __init__(self, fmt, compression=None, block_records=1024):
+        self.fmt = fmt
+        self.compression = compression
+        self.block_records = block_records
+        self.times = array("d")
+        self.offsets = array("Q")
+        self.first_records = array("Q")
+        self.postings = {}  # identifier -> array("I") of block numbers
+        self.block_ids = set()
+        self.records = 0
+        self.end_offset = 0
+
+    def add(self, timestamp, offset, identifier):
+        if self.records % self.block_records == 0:
+            self.close_block()
+            self.times.append(timestamp)
+            self.offsets.append(offset)
+            self.first_records.append(self.records)
+        self.block_ids.add(NO_ID if identifier is None else identifier)
+        self.records += 1
+
+    def close_block(self):
+        block = len(self.times) - 1
+        for identifier in self.block_ids:
+            self.postings.setdefault(identifier, array("I")).append(block)
+        self.block_ids = set()
+
+    def finish(self, end_offset):
+        self.close_block()
+        self.end_offset = end_offset
+
+    def save(self, path):
+        ids = array("H", sorted(self.postings))
+        counts = array("I", (len(self.postings[i]) for i in ids))
+        with open(path, "wb") as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, FORMATS.index(self.fmt), COMPRESSION.index(self.compression),
+                                      self.block_records, len(self.times), len(ids),
+                                      self.records, self.end_offset))
+            for column in (self.times, self.offsets, self.first_records, ids, counts):
+                column.tofile(f)
+            for i in ids:
+                self.postings[i].tofile(f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            header = f.read(INDEX_HEADER.size)
+            magic, fmt, compression, block_records, blocks, n_ids, records, end_offset = INDEX_HEADER.unpack(header)
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"{path}: not a CAN trace index")
+            index = cls(FORMATS[fmt], COMPRESSION[compression], block_records)
+            index.records = records
+            index.end_offset = end_offset
+            for column in (index.times, index.offsets, index.first_records):
+                column.fromfile(f, blocks)
+            ids = array("H")
+            ids.fromfile(f, n_ids)
+            counts = array("I")
+            counts.fromfile(f, n_ids)
+            for identifier, count in zip(ids, counts):
+                postings = array("I")
+                postings.fromfile(f, count)
+                index.postings[identifier] = postings
+        return index
+
+    @classmethod
+    def build(cls, trace_path, fmt=None, compression=None, block_records=1024, save=True):
+        """Indexes an existing trace with one sequential pass (and saves the sidecar file)."""
+        if fmt is None:
+            fmt, guessed = trace_format(trace_path)
+            compression = compression or guessed
+        index = cls(fmt, compression, block_records)
+        if fmt == "binary":
+            offset = BINARY_HEADER.size
+            for record in read_trace(trace_path, fmt, compression):
+                index.add(record[0], offset, record[3])
+                offset += BINARY_RECORD.size
+        else:
+            parse = parse_candump_line if fmt == "candump" else parse_asc_line
+            offset = 0
+            with open_trace(trace_path, "rb", compression) as f:
+                for line in f:
+                    record = parse(line.decode("ascii", "replace"))
+                    if record is not None:
+                        index.add(record[0], offset, record[3])
+                    offset += len(line)
+        index.finish(offset)
+        if save:
+            index.save(index_path(trace_path))
+        return index
+
+    def blocks(self, identifier=ANY_ID, start=None, end=None):
+        """Block numbers that can hold records of identifier (any if not given) within [start, end] seconds."""
+        lo = 0 if start is None else max(bisect.bisect_right(self.times, start) - 1, 0)
+        hi = len(self.times) if end is None else bisect.bisect_right(self.times, end)
+        if identifier == ANY_ID:
+            return range(lo, hi)
+        postings = self.postings.get(NO_ID if identifier is None else identifier, array("I"))
+        return postings[bisect.bisect_left(postings, lo):bisect.bisect_left(postings, hi)]
+
+    def block_span(self, block):
+        """(first record, record count, byte offset, byte length) of a block."""
+        first = self.first_records[block]
+        last = self.first_records[block + 1] if block + 1 < len(self.times) else self.records
+        offset = self.offsets[block]
+        end = self.offsets[block + 1] if block + 1 < len(self.times) else self.end_offset
+        return first, last - first, offset, end - offset
+
+    def query(self, trace_path, identifier=ANY_ID, start=None, end=None):
+        """Records of identifier (None = error/overload frames, not given = all) with start <= time <= end."""
+        blocks = self.blocks(identifier, start, end)
+        if not blocks:
+            return
+        binary = self.fmt == "binary"
+        reader = BinaryTraceReader(trace_path, self.compression) if binary else None
+        f = reader.file if binary else open_trace(trace_path, "rb", self.compression)
+        parse = parse_candump_line if self.fmt == "candump" else parse_asc_line
+        try:
+            for block in blocks:
+                first, count, offset, length = self.block_span(block)
+                if reader is not None and reader.map is not None:
+                    records = reader.records(first, first + count)
+                else:
+                    f.seek(offset)
+                    chunk = f.read(length)
+                    if binary:
+                        records = map(reader.decode, BINARY_RECORD.iter_unpack(chunk))
+                    else:
+                        records = filter(None, map(parse, chunk.decode("ascii", "replace").splitlines()))
+                try:
+                    for record in records:
+                        if start is not None and record[0] < start:
+                            continue
+                        if end is not None and record[0] > end:
+                            return
+                        if identifier == ANY_ID or record[3] == identifier:
+                            yield record
+                finally:
+                    if hasattr(records, "close"):
+                        records.close()  # releases the memory-mapped window
+        finally:
+            if reader is not None:
+                reader.close()
+            else:
+                f.close()
@@ -0,0 +1,346 @@
+import glob
+import os
+
+import numpy as np
+
+from can_trace import (DATA, REMOTE, ERROR, OVERLOAD, NO_ID, ERROR_TYPES, BINARY_HEADER, BINARY_RECORD,
+                       BinaryTraceReader, read_trace, trace_format)
+
+# Columnar trace store: a trace converted to structured NumPy arrays saved as .npy
+# segments of up to `segment_rows` frames and loaded memory-mapped, so analytics run
+# as vectorized array operations instead of Python loops, one segment at a time: a
+# trace larger than RAM is never copied into memory as a whole.
+# This module needs NumPy; the rest of the simulator does not.
+
+FRAME_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("id", "<u2"),          # NO_ID for error and overload frames
+    ("dlc", "u1"),
+    ("payload", "u1", (8,)),
+    ("flags", "u1"),        # error type code in FLAG_ERROR_TYPE + FLAG_* kind bits
+    ("node", "u1"),
+])
+
+FLAG_ERROR_TYPE = 0x07  # can_trace.ERROR_TYPES index + 1, 0 = none
+FLAG_REMOTE = 0x08
+FLAG_ERROR = 0x10
+FLAG_OVERLOAD = 0x20
+KIND_FLAGS = {DATA: 0, REMOTE: FLAG_REMOTE, ERROR: FLAG_ERROR, OVERLOAD: FLAG_OVERLOAD}
+KIND_FLAG_TABLE = np.zeros(256, np.uint8)  # binary record kind -> flags
+for _kind, _flag in KIND_FLAGS.items():
+    KIND_FLAG_TABLE[_kind] = _flag
+
+# the binary trace record (can_trace.BINARY_RECORD) as a packed NumPy dtype
+BINARY_DTYPE = np.dtype([
+    ("bit_time", "<u8"),
+    ("kind", "u1"),
+    ("node", "u1"),
+    ("id", "<u2"),
+    ("dlc", "u1"),
+    ("error", "u1"),
+    ("data", "u1", (8,)),
+])
+assert BINARY_DTYPE.itemsize == BINARY_RECORD.size
+
+# nominal bits per frame for bus load: a standard data frame without stuff bits is
+# 44 + 8 * DLC bits plus 3 intermission bits; error/overload frames are flag + delimiter
+FRAME_BITS = 47
+ERROR_FRAME_BITS = 14
+
+
+def flags_of(kind, error_code):
+    return KIND_FLAGS[kind] | (error_code & FLAG_ERROR_TYPE)
+
+
+class ColumnarTraceStore:
+    """
+    store = ColumnarTraceStore.convert("run.bin", "run_columns/")
+    store = ColumnarTraceStore("run_columns/")      # later: memory-mapped segments
+    period_stats(store)
+
+    Segments are segment_00000.npy, segment_00001.npy, ... of FRAME_DTYPE rows in
+    time order.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.paths = sorted(glob.glob(os.path.join(directory, "segment_*.npy")))
+        self.segments = [np.load(path, mmap_mode="r") for path in self.paths]
+
+    def __len__(self):
+        return sum(len(seg) for seg in self.segments)
+
+    def frames(self):
+        """The memory-mapped segments in time order (nothing is copied); the analytics take them as they are."""
+        return self.segments
+
+    def column(self, name):
+        """One column over all segments as one array; only that column is read."""
+        if not self.segments:
+            return np.empty(0, FRAME_DTYPE[name])
+        return np.concatenate([seg[name] for seg in self.segments])
+
+    @classmethod
+    def convert(cls, trace_path, directory, fmt=None, compression=None, segment_rows=1 << 22):
+        """Converts a trace file to a columnar store in `directory` and opens it."""
+        if fmt is None:
+            fmt, guessed = trace_format(trace_path)
+            compression = compression or guessed
+        os.makedirs(directory, exist_ok=True)
+        for old in glob.glob(os.path.join(directory, "segment_*.npy")):
+            os.remove(old)
+        writer = SegmentWriter(directory, segment_rows)
+        if fmt == "binary" and compression is None:
+            reader = BinaryTraceReader(trace_path)
+            bitrate = reader.bitrate
+            reader.close()
+            count = (os.path.getsize(trace_path) - BINARY_HEADER.size) // BINARY_RECORD.size
+            if count > 0:  # a zero-length file cannot be mapped
+                records = np.memmap(trace_path, dtype=BINARY_DTYPE, mode="r", offset=BINARY_HEADER.size,
+                                    shape=(count,))
+                for first in range(0, count, segment_rows):
+                    writer.add_binary(records[first:first + segment_rows], bitrate)
+                del records
+        else:
+            for record in read_trace(trace_path, fmt, compression):
+                writer.add_record(record)
+        writer.close()
+        return cls(directory)
+
+
+class SegmentWriter:
+    def __init__(self, directory, segment_rows):
+        self.directory = directory
+        self.segment_rows = segment_rows
+        self.buffer = np.zeros(segment_rows, FRAME_DTYPE)
+        self.rows = 0
+        self.segments = 0
+
+    def add_binary(self, records, bitrate):
+        """Appends binary trace records (BINARY_DTYPE) with vectorized column copies."""
+        start = 0
+        while start < len(records):
+            n = min(len(records) - start, self.segment_rows - self.rows)
+            part = records[start:start + n]
+            out = self.buffer[self.rows:self.rows + n]
+            out["timestamp"] = part["bit_time"] / bitrate
+            out["id"] = part["id"]
+            out["dlc"] = part["dlc"]
+            out["payload"] = part["data"]
+            out["flags"] = KIND_FLAG_TABLE[part["kind"]] | (part["error"] & FLAG_ERROR_TYPE)
+            out["node"] = part["node"]
+            self.rows += n
+            start += n
+            if self.rows == self.segment_rows:
+                self.flush()
+
+    def add_record(self, record):
+        timestamp, kind, node, identifier, dlc, data, error_type = record
+        row = self.buffer[self.rows]
+        row["timestamp"] = timestamp
+        row["id"] = NO_ID if identifier is None else identifier
+        row["dlc"] = dlc
+        payload = bytes(data[:8])
+        row["payload"] = np.frombuffer(payload.ljust(8, b"\0"), np.uint8)
+        row["flags"] = flags_of(kind, ERROR_TYPES.index(error_type) + 1 if error_type in ERROR_TYPES else 0)
+        row["node"] = 0 if node is None else node & 0xFF
+        self.rows += 1
+        if self.rows == self.segment_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        path = os.path.join(self.directory, f"segment_{self.segments:05d}.npy")
+        np.save(path, self.buffer[:self.rows])
+        self.segments += 1
+        self.rows = 0
+
+    def close(self):
+        self.flush()
+
+
+# ---- analytics: `frames` is a store, its frames() (a list of segments) or one FRAME_DTYPE array ----
+
+def segments_of(frames):
+    if isinstance(frames, ColumnarTraceStore):
+        return frames.segments
+    if isinstance(frames, np.ndarray):
+        return (frames,)
+    return frames
+
+
+def frame_mask(frames, kind=DATA):
+    flags = frames["flags"]
+    if kind == ERROR:
+        return (flags & FLAG_ERROR) != 0
+    if kind == OVERLOAD:
+        return (flags & FLAG_OVERLOAD) != 0
+    if kind == REMOTE:
+        return (flags & FLAG_REMOTE) != 0
+    return (flags & (FLAG_REMOTE | FLAG_ERROR | FLAG_OVERLOAD)) == 0
+
+
+def period_stats(frames, kind=DATA):
+    """
+    Per identifier: frame count and mean / std (jitter) / min / max of the time
+    between consecutive frames. Returns a structured array sorted by identifier.
+    """
+    size = NO_ID + 1
+    counts = np.zeros(size, np.int64)
+    n = np.zeros(size, np.int64)
+    total = np.zeros(size)
+    squares = np.zeros(size)
+    low = np.full(size, np.inf)
+    high = np.full(size, -np.inf)
+    last = np.full(size, np.nan)  # timestamp of the last frame of each identifier in the segments before
+    for seg in segments_of(frames):
+        sel = seg[frame_mask(seg, kind)]
+        ids = sel["id"]
+        ts = sel["timestamp"]
+        order = np.lexsort((ts, ids))
+        ids = ids[order]
+        ts = ts[order]
+        seg_ids, first, seg_counts = np.unique(ids, return_index=True, return_counts=True)
+        counts[seg_ids] += seg_counts
+
+        same = ids[1:] == ids[:-1]
+        before = last[seg_ids]
+        carried = ~np.isnan(before)
+        gaps = np.concatenate((np.diff(ts)[same], ts[first][carried] - before[carried]))
+        gap_ids = np.concatenate((ids[1:][same], seg_ids[carried]))
+        n += np.bincount(gap_ids, minlength=size)
+        total += np.bincount(gap_ids, weights=gaps, minlength=size)
+        squares += np.bincount(gap_ids, weights=gaps * gaps, minlength=size)
+        np.minimum.at(low, gap_ids, gaps)
+        np.maximum.at(high, gap_ids, gaps)
+        last[seg_ids] = ts[first + seg_counts - 1]
+
+    unique_ids = np.flatnonzero(counts)
+    result = np.zeros(len(unique_ids), dtype=[("id", "<u2"), ("count", "<i8"), ("period_mean", "<f8"),
+                                              ("jitter", "<f8"), ("period_min", "<f8"), ("period_max", "<f8")])
+    result["id"] = unique_ids
+    result["count"] = counts[unique_ids]
+    n = n[unique_ids]
+    has = n > 0
+    mean = np.divide(total[unique_ids], n, out=np.zeros(len(n)), where=has)
+    var = np.divide(squares[unique_ids], n, out=np.zeros(len(n)), where=has) - mean * mean
+    result["period_mean"] = mean
+    result["jitter"] = np.sqrt(np.maximum(var, 0.0))
+    result["period_min"] = np.where(has, low[unique_ids], 0.0)
+    result["period_max"] = np.where(has, high[unique_ids], 0.0)
+    return result
+
+
+def inter_arrival_gaps(frames, identifier=None, kind=DATA):
+    """Times between consecutive frames (of one identifier, or of all frames), one array per segment."""
+    last = None
+    for seg in segments_of(frames):
+        mask = frame_mask(seg, kind)
+        if identifier is not None:
+            mask &= seg["id"] == identifier
+        ts = np.sort(seg["timestamp"][mask])
+        if not len(ts):
+            continue
+        if last is not None:
+            ts = np.concatenate((last, ts))
+        yield np.diff(ts)
+        last = ts[-1:]
+
+
+def inter_arrival_histogram(frames, identifier=None, bins=50, range_=None, kind=DATA):
+    """np.histogram of the times between consecutive frames (of one identifier, or of all frames)."""
+    if range_ is None:
+        low, high = np.inf, -np.inf
+        for gaps in inter_arrival_gaps(frames, identifier, kind):
+            if len(gaps):
+                low, high = min(low, gaps.min()), max(high, gaps.max())
+        range_ = (low, high) if low <= high else (0.0, 1.0)
+    hist, edges = np.histogram(np.empty(0), bins=bins, range=range_)
+    for gaps in inter_arrival_gaps(frames, identifier, kind):
+        hist += np.histogram(gaps, bins=edges)[0]
+    return hist, edges
+
+
+def frame_bits(frames):
+    """Nominal bits of every frame of a FRAME_DTYPE array (no stuff bits)."""
+    flags = frames["flags"]
+    bits = FRAME_BITS + 8 * frames["dlc"].astype(np.int64)
+    bits[(flags & FLAG_REMOTE) != 0] = FRAME_BITS
+    bits[(flags & (FLAG_ERROR | FLAG_OVERLOAD)) != 0] = ERROR_FRAME_BITS
+    return bits
+
+
+def bus_load(frames, bitrate, window=0.1, step=None):
+    """
+    Bus load over sliding windows of `window` seconds moved by `step` (default window / 10).
+    Returns (window start times, load) with load = nominal frame bits / window capacity.
+    """
+    step = step or window / 10
+    segments = [seg for seg in segments_of(frames) if len(seg)]
+    if not segments:
+        return np.empty(0), np.empty(0)
+    t0 = min(seg["timestamp"].min() for seg in segments)
+    per_step = np.zeros(0)
+    for seg in segments:
+        slot = ((seg["timestamp"] - t0) // step).astype(np.int64)
+        bits = np.bincount(slot, weights=frame_bits(seg))
+        if len(bits) > len(per_step):
+            per_step = np.concatenate((per_step, np.zeros(len(bits) - len(per_step))))
+        per_step[:len(bits)] += bits
+    width = max(int(round(window / step)), 1)
+    cumulative = np.concatenate(([0.0], np.cumsum(per_step)))
+    if len(per_step) < width:
+        sums = cumulative[-1:] - cumulative[:1]
+    else:
+        sums = cumulative[width:] - cumulative[:-width]
+    starts = t0 + np.arange(len(sums)) * step
+    return starts, sums / (window * bitrate)
+
+
+def error_bursts(frames, max_gap=0.01, min_errors=2):
+    """
+    Error frames grouped into bursts: consecutive error frames less than `max_gap`
+    seconds apart. Returns a structured array (start, end, errors) of the bursts
+    with at least `min_errors` error frames.
+    """
+    ts = np.sort(np.concatenate([seg["timestamp"][frame_mask(seg, ERROR)] for seg in segments_of(frames)]
+                                or [np.empty(0)]))
+    dtype = [("start", "<f8"), ("end", "<f8"), ("errors", "<i8")]
+    if not len(ts):
+        return np.zeros(0, dtype)
+    breaks = np.flatnonzero(np.diff(ts) > max_gap)
+    starts = np.r_[0, breaks + 1]
+    ends = np.r_[breaks, len(ts) - 1]
+    bursts = np.zeros(len(starts), dtype)
+    bursts["start"] = ts[starts]
+    bursts["end"] = ts[ends]
+    bursts["errors"] = ends - starts + 1
+    return bursts[bursts["errors"] >= min_errors]
+
+
+def top_talkers(frames, n=10, by="id"):
+    """
+    The n identifiers (by="id") or nodes (by="node") with the most bus bits.
+    Returns a structured array (key, frames, payload_bytes, bits, share) sorted by bits.
+    """
+    size = NO_ID + 1 if by == "id" else 256
+    counts = np.zeros(size, np.int64)
+    payload = np.zeros(size)
+    total_bits = np.zeros(size)
+    for seg in segments_of(frames):
+        sel = seg[frame_mask(seg, DATA) | frame_mask(seg, REMOTE)]
+        keys = sel["id" if by == "id" else "node"].astype(np.int64)
+        counts += np.bincount(keys, minlength=size)
+        payload += np.bincount(keys, weights=sel["dlc"] * (frame_mask(sel, DATA)), minlength=size)
+        total_bits += np.bincount(keys, weights=frame_bits(sel), minlength=size)
+    order = np.argsort(total_bits, kind="stable")[::-1][:n]
+    order = order[counts[order] > 0]
+    result = np.zeros(len(order), dtype=[("key", "<i8"), ("frames", "<i8"), ("payload_bytes", "<i8"),
+                                         ("bits", "<i8"), ("share", "<f8")])
+    result["key"] = order
+    result["frames"] = counts[order]
+    result["payload_bytes"] = payload[order]
+    result["bits"] = total_bits[order]
+    result["share"] = total_bits[order] / max(total_bits.sum(), 1)
+    return result
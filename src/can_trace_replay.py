@@ -0,0 +1,157 @@
+import os
+
+from can_message import DataFrame, RemoteFrame
+from can_bus import IDLE
+from can_node import CANNode, BUS_OFF
+from can_trace import DATA, REMOTE, read_trace, index_path, TraceIndex
+
+RECORDED = "recorded"  # inject every frame at its recorded time
+ASAP = "asap"          # inject frames as fast as the bus takes them
+
+
+class TraceReplayer:
+    """
+    Pushes the data and remote frames of a trace file through a CANBus, so captured
+    traffic goes through the simulated arbitration and error model. Error and
+    overload frames of the trace are not injected, the bus produces its own.
+
+    Frames go to a simulated node chosen by
+      id_map    {identifier: CANNode}      (e.g. the ECU known to send an ID)
+      node_map  {trace node: CANNode}      (interface / channel / node of the trace)
+      the bus node whose node_id equals the trace node,
+      default_node                         (created as node 0 if not given)
+    pace RECORDED queues each frame at its recorded time (relative to the first
+    frame, scaled by `speed`); pace ASAP keeps up to `backlog` frames queued on the
+    bus and steps without waiting. With skip_idle, idle gaps between recorded frames
+    are jumped over instead of stepped through bit by bit.
+
+    The trace is read lazily (see can_trace.read_trace), only the next record is held
+    in memory, so replaying a capture larger than memory works. A time window
+    (start_time / end_time in trace seconds) is read through the trace's sidecar
+    index when there is one, so only the blocks of the window are read.
+    """
+
+    def __init__(self, bus, path, fmt=None, compression=None, pace=RECORDED, speed=1.0,
+                 id_map=None, node_map=None, default_node=None, backlog=4, start=0, skip_idle=True,
+                 start_time=None, end_time=None):
+        if pace not in (RECORDED, ASAP):
+            raise ValueError(f"Unknown replay pace {pace!r}")
+        self.bus = bus
+        self.pace = pace
+        self.speed = speed
+        self.id_map = dict(id_map) if id_map else {}
+        self.node_map = dict(node_map) if node_map else {}
+        self.nodes_by_id = {nd.node_id: nd for nd in bus.nodes}
+        self.default_node = default_node
+        self.backlog = backlog
+        self.skip_idle = skip_idle
+        if (start_time is not None or end_time is not None) and os.path.exists(index_path(path)):
+            self.records = TraceIndex.load(index_path(path)).query(path, start=start_time, end=end_time)
+        elif start_time is not None or end_time is not None:
+            self.records = (r for r in read_trace(path, fmt, compression, start)
+                            if (start_time is None or r[0] >= start_time) and (end_time is None or r[0] <= end_time))
+        else:
+            self.records = read_trace(path, fmt, compression, start)
+        self.next_record = None
+        self.time_origin = None  # (trace timestamp, bit_time) of the first frame
+        self.injected = 0
+        self.skipped = 0
+        self.dropped = 0  # frames for nodes that are BUS_OFF
+        self.finished = False
+        self.advance()
+
+    def advance(self):
+        for record in self.records:
+            if record[1] in (DATA, REMOTE) and record[3] is not None and record[3] < 2048:
+                self.next_record = record
+                return
+            self.skipped += 1
+        self.next_record = None
+        self.finished = True
+
+    def node_for(self, record):
+        node = self.id_map.get(record[3])
+        if node is None:
+            node = self.node_map.get(record[2]) or self.nodes_by_id.get(record[2])
+        if node is None:
+            if self.default_node is None:
+                self.default_node = CANNode(0)
+                self.bus.connect_node(self.default_node)
+                self.nodes_by_id[0] = self.default_node
+            node = self.default_node
+        return node
+
+    def due_bit(self, record):
+        if self.time_origin is None:
+            self.time_origin = (record[0], self.bus.bit_time)
+        first_timestamp, first_bit = self.time_origin
+        return first_bit + round((record[0] - first_timestamp) * self.bus.bitrate / self.speed)
+
+    def pending_frames(self):
+        return sum(len(nd.message_queue) for nd in self.bus.nodes if nd.state != BUS_OFF)
+
+    def skip_to_next(self, limit=None):
+        """Jumps an idle bus to one bit before the next recorded frame is due (at most to bit_time `limit`)."""
+        bus = self.bus
+        if (self.next_record is None or bus.state != IDLE or bus.current_winner is not None
+                or bus.arbitration_in_progress or self.pending_frames()):
+            return
+        target = self.due_bit(self.next_record) - 1
+        if limit is not None:
+            target = min(target, limit)
+        gap = target - bus.bit_time
+        if gap > 0:
+            bus.bit_time += gap
+            if bus.accounting is not None:
+                bus.accounting.idle_bit(gap)
+
+    def inject(self, record):
+        _, kind, _, identifier, dlc, data, _ = record
+        node = self.node_for(record)
+        if node.state == BUS_OFF:
+            self.dropped += 1
+            return
+        if kind == REMOTE:
+            msg = RemoteFrame(identifier, node.node_id, dlc=dlc)
+        else:
+            msg = DataFrame(identifier, node.node_id, list(data))
+        node.add_message_to_queue(msg)
+        self.injected += 1
+
+    def inject_due(self):
+        """Queues the frames that are due now; returns False once the trace is exhausted."""
+        while self.next_record is not None:
+            if self.pace == ASAP:
+                if self.pending_frames() >= self.backlog:
+                    break
+            elif self.due_bit(self.next_record) > self.bus.bit_time:
+                break
+            self.inject(self.next_record)
+            self.advance()
+        return not self.finished
+
+    def step(self, bits=1):
+        for _ in range(bits):
+            self.inject_due()
+            self.bus.simulate_step()
+
+    def run(self, max_bits=None, drain=True):
+        """
+        Replays until the trace is exhausted (and, with drain, the queued frames
+        went out) or max_bits bit times have passed. Returns the bit times run.
+        """
+        start = self.bus.bit_time
+        while max_bits is None or self.bus.bit_time - start < max_bits:
+            if not self.inject_due() and (not drain or not self.pending_frames()):
+                break
+            if self.skip_idle and self.pace == RECORDED:
+                self.skip_to_next(None if max_bits is None else start + max_bits - 1)
+            self.bus.simulate_step()
+        return self.bus.bit_time - start
+
+    def close(self):
+        self.records.close()
+
+    def stats(self):
+        return {"injected": self.injected, "skipped": self.skipped, "dropped": self.dropped,
+                "finished": self.finished}
@@ -0,0 +1,142 @@
+import bisect
+import heapq
+from array import array
+
+BUS = "bus"  # signal name of the wire level; node signals are named by node_id
+
+
+def vcd_identifier(index):
+    """VCD identifier code of the index-th signal: !, ", ... ~, then !!, "!, ... (bijective base 94)."""
+    code = ""
+    while True:
+        index, digit = divmod(index, 94)
+        code += chr(33 + digit)
+        if index == 0:
+            return code
+        index -= 1
+
+
+class WaveformCapture:
+    """
+    Run-length encoded waveform of a bus: the wire level and the level every node
+    drives (recessive 1 when it drives nothing), attached with CANBus.set_waveform().
+    Each signal keeps only its edges, two arrays of (bit_time, new level), so a long
+    run costs memory per level change and not per bit. Levels hold from their edge
+    up to the next one; a signal is recessive before its first edge.
+
+    The capture is a measurement and not part of bus snapshots; when the bus goes
+    back in time (restore), the edges after the restored bit_time are dropped.
+    """
+
+    def __init__(self, nodes=True):
+        self.nodes = nodes  # False: only the wire level
+        self.signals = {}   # name -> (array of bit_times, array of levels)
+        self.first_bit = None
+        self.last_bit = None
+        self.bitrate = None
+
+    def attach(self, bus):
+        self.bitrate = bus.bitrate
+
+    def signal(self, name):
+        if name not in self.signals:
+            self.signals[name] = (array("Q"), array("b"))
+        return self.signals[name]
+
+    def set_level(self, name, bit_time, level):
+        times, levels = self.signal(name)
+        current = levels[-1] if levels else 1
+        if level != current:
+            times.append(bit_time)
+            levels.append(level)
+
+    def sample(self, bus):
+        now = bus.bit_time
+        if self.last_bit is not None and now <= self.last_bit:
+            self.truncate(now - 1)
+        if self.first_bit is None:
+            self.first_bit = now
+        self.last_bit = now
+        self.set_level(BUS, now, bus.current_bit)
+        if self.nodes:
+            drive = bus.drive_levels
+            for nd in bus.nodes:
+                self.set_level(nd.node_id, now, drive.get(nd.node_id, 1))
+
+    def truncate(self, bit_time):
+        """Forgets everything after bit_time."""
+        for times, levels in self.signals.values():
+            keep = bisect.bisect_right(times, bit_time)
+            del times[keep:]
+            del levels[keep:]
+        self.last_bit = bit_time if self.first_bit is not None and bit_time >= self.first_bit else None
+        if self.last_bit is None:
+            self.first_bit = None
+
+    def edges(self, name=None):
+        if name is not None:
+            return len(self.signal(name)[0])
+        return sum(len(times) for times, _ in self.signals.values())
+
+    def level_at(self, name, bit_time):
+        times, levels = self.signal(name)
+        i = bisect.bisect_right(times, bit_time) - 1
+        return levels[i] if i >= 0 else 1
+
+    def segments(self, name, start=None, end=None):
+        """(first bit, last bit, level) runs of a signal within [start, end]."""
+        if self.first_bit is None:
+            return
+        start = self.first_bit if start is None else max(start, self.first_bit)
+        end = self.last_bit if end is None else min(end, self.last_bit)
+        times, levels = self.signal(name)
+        i = bisect.bisect_right(times, start) - 1
+        level = levels[i] if i >= 0 else 1
+        begin = start
+        for j in range(i + 1, len(times)):
+            if times[j] > end:
+                break
+            yield begin, times[j] - 1, level
+            begin, level = times[j], levels[j]
+        if begin <= end:
+            yield begin, end, level
+
+    def bits(self, name, start=None, end=None):
+        """The signal expanded to one level per bit (for short windows)."""
+        return [level for first, last, level in self.segments(name, start, end)
+                for _ in range(last - first + 1)]
+
+    def export_vcd(self, path, bitrate=None, module="can"):
+        """Writes the capture as a Value Change Dump; time 0 is the start of the first captured bit."""
+        bitrate = bitrate or self.bitrate or 500000
+        unit_ps = 10 ** 12 // bitrate
+        names = [BUS] + sorted((n for n in self.signals if n != BUS), key=str)
+        codes = {name: vcd_identifier(i) for i, name in enumerate(names)}
+        origin = self.first_bit or 0
+
+        def changes(name):
+            times, levels = self.signal(name)
+            for t, level in zip(times, levels):
+                yield (t - origin) * unit_ps, codes[name], level
+
+        with open(path, "w") as f:
+            f.write("$timescale 1ps $end\n")
+            f.write(f"$scope module {module} $end\n")
+            for name in names:
+                label = name if name == BUS else f"node{name}"
+                f.write(f"$var wire 1 {codes[name]} {label} $end\n")
+            f.write("$upscope $end\n$enddefinitions $end\n")
+            f.write("#0\n$dumpvars\n")
+            for name in names:
+                f.write(f"{self.level_at(name, origin)}{codes[name]}\n")
+            f.write("$end\n")
+            last_time = 0
+            for time_ps, code, level in heapq.merge(*(changes(n) for n in names)):
+                if time_ps == 0:
+                    continue
+                if time_ps != last_time:
+                    f.write(f"#{time_ps}\n")
+                    last_time = time_ps
+                f.write(f"{level}{code}\n")
+            if self.last_bit is not None:
+                f.write(f"#{(self.last_bit + 1 - origin) * unit_ps}\n")
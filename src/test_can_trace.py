@@ -0,0 +1,42 @@
+import pytest
+
+from can_bus import CANBus
+from can_message import DataFrame
+from can_node import CANNode
+from can_trace import ANY_ID, TraceIndex, TraceRecorder, index_path, read_trace
+
+EXTENSIONS = {"binary": "bin", "candump": "log", "asc": "asc"}
+
+
+def record_trace(path, fmt, start_time):
+    bus = CANBus(seed=1)
+    nodes = [CANNode(1), CANNode(2)]
+    for nd in nodes:
+        bus.connect_node(nd)
+    recorder = TraceRecorder(bus, path, fmt=fmt, start_time=start_time, index_block=4)
+    for t in range(3000):
+        if t % 100 == 0:
+            nd = nodes[t // 100 % 2]
+            nd.add_message_to_queue(DataFrame(0x100 + t // 100 % 3, nd.node_id, [t % 256]))
+        bus.simulate_step()
+    recorder.close()
+
+
+@pytest.mark.parametrize("fmt", ["binary", "candump", "asc"])
+@pytest.mark.parametrize("start_time", [0.0, 100.0])
+def test_index_query_matches_full_scan(tmp_path, fmt, start_time):
+    path = str(tmp_path / f"run.{EXTENSIONS[fmt]}")
+    record_trace(path, fmt, start_time)
+    records = list(read_trace(path))
+    index = TraceIndex.load(index_path(path))
+    assert index.records == len(records) > 8
+
+    times = [r[0] for r in records]
+    windows = [(None, None), (times[3], times[-4]), (times[5], times[5]), (None, times[6]),
+               (times[-2], None), (times[-1] + 1.0, None), (0.0, 0.0005), (100.0, 100.0005)]
+    for start, end in windows:
+        for identifier in (ANY_ID, 0x101, 0x7FF):
+            expected = [r for r in records
+                        if (start is None or r[0] >= start) and (end is None or r[0] <= end)
+                        and (identifier == ANY_ID or r[3] == identifier)]
+            assert list(index.query(path, identifier, start, end)) == expected